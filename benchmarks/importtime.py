@@ -0,0 +1,69 @@
+"""
+Guards the start-up time of the command line against regressions.
+
+Runs `python -X importtime` on the grading modules and on
+`workflowgrader.py --help`, reports the cumulative import time of each and
+fails when a heavy dependency is imported or the time exceeds the budget.
+
+    python benchmarks/importtime.py [--budget-ms 150] [--repeat 5]
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# dependencies which must only be imported by the code paths that need them
+HEAVY_MODULES = ('pandas', 'numpy', 'tqdm', 'requests')
+
+TARGETS = {
+    'import knime': ['-c', 'import knime'],
+    'import utils': ['-c', 'import utils'],
+    'workflowgrader.py --help': [os.path.join(REPO_DIR, 'workflowgrader.py'), '--help'],
+}
+
+
+def importtime(args):
+    """
+    Runs python -X importtime with args.
+    Returns a tuple of (total import time in us, set of top level modules imported).
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', *args], cwd=REPO_DIR,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    total = 0
+    modules = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _self, cumulative, name = line[len('import time:'):].split('|')
+        modules.add(name.strip().split('.')[0])
+        # only modules imported directly by the target contribute to the total
+        if not name[1:].startswith(' '):
+            total += int(cumulative)
+    return total, modules
+
+def main():
+    parser = argparse.ArgumentParser(description='Import-time benchmark of the grading command line.')
+    parser.add_argument('--budget-ms', type=float, default=150, help='Maximum import time of each target in milliseconds.')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs per target, the fastest is reported.')
+    args = parser.parse_args()
+
+    failed = False
+    for name, target_args in TARGETS.items():
+        runs = [importtime(target_args) for _ in range(args.repeat)]
+        total = min(t for t, _ in runs) / 1000
+        heavy = sorted(set.union(*(m for _, m in runs)) & set(HEAVY_MODULES))
+        status = 'ok'
+        if heavy:
+            status = 'FAIL imports {}'.format(', '.join(heavy))
+        elif total > args.budget_ms:
+            status = 'FAIL over budget of {} ms'.format(args.budget_ms)
+        failed = failed or status != 'ok'
+        print('  {:<28} {:>8.1f} ms   {}'.format(name, total, status))
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Measures the prefetching of submission metadata on slow storage.
+
+Generates a workflowset of synthetic workflows and extracts it with
+`workflowgrader.extract_workflow_data`, once scanning every workflow in its
+execution slot (--depths 0) and once prefetching the next workflows while
+the current ones execute. Each file system access to the workflowset is
+delayed by --latency-ms to simulate a network-mounted workspace, and KNIME
+is replaced by a stand-in which sleeps for --exec-ms.
+
+    python benchmarks/prefetch_pipeline.py [--workflows 40] [--nodes 40] [--latency-ms 2] [--exec-ms 300]
+"""
+import io
+import os
+import sys
+import time
+import stat
+import builtins
+import argparse
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+NAMESPACE = 'xmlns="http://www.knime.org/2008/09/XMLConfig" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'
+FACTORIES = {
+    'CSV Reader': 'org.knime.base.node.io.filehandling.csv.reader.CSVTableReaderNodeFactory',
+    'Row Filter': 'org.knime.base.node.preproc.filter.row.RowFilterNodeFactory',
+    'Container Output _Table_': 'org.knime.base.node.io.container.output.table.ContainerTableOutputNodeFactory',
+}
+FAKE_KNIME = '''#!{python}
+import sys, json, time
+time.sleep({exec_s})
+for arg in sys.argv[1:]:
+    if arg.startswith('-option=') and ',outputPathOrUrl,' in arg:
+        path = arg.split(',')[2].strip('"')
+        json.dump({{"table-spec": [{{"x": "double"}}], "table-data": [[1.0]]}}, open(path, 'w'))
+'''
+
+
+def settings_xml(node, node_id, n_entries, data_path):
+    entries = ''.join('<entry key="option_{}" type="xstring" value="{}"/>\n'.format(i, i) for i in range(n_entries))
+    if node == 'CSV Reader':
+        entries += ('<config key="settings"><config key="file_selection"><config key="path">'
+                    '<entry key="path" type="xstring" value="{}"/></config></config></config>\n'.format(data_path))
+    annotation = '<config key="nodeAnnotation"><entry key="text" type="xstring" value="Q{}"/></config>\n'.format(node_id) \
+        if node == 'Container Output _Table_' else ''
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n<config {} key="settings.xml">\n'
+            '<config key="model">\n{}</config>\n{}<entry key="factory" type="xstring" value="{}"/>\n</config>\n').format(
+                NAMESPACE, entries, annotation, FACTORIES[node])
+
+def make_workflow(path, n_nodes, data_path, n_entries=50):
+    """
+    Writes a workflow of a CSV Reader of data_path feeding a chain of Row
+    Filters, with two Container Output (Table) nodes at the end of the chain.
+    """
+    nodes = ['CSV Reader'] + ['Row Filter'] * (n_nodes - 3) + ['Container Output _Table_'] * 2
+    node_configs, connection_configs = [], []
+    for node_id, node in enumerate(nodes, 1):
+        dirname = '{} (#{})'.format(node, node_id)
+        os.makedirs(os.path.join(path, dirname))
+        with open(os.path.join(path, dirname, 'settings.xml'), 'w') as fh:
+            fh.write(settings_xml(node, node_id, n_entries, data_path))
+        node_configs.append('<config key="node_{0}"><entry key="id" type="xint" value="{0}"/>'
+                            '<entry key="node_settings_file" type="xstring" value="{1}/settings.xml"/></config>'.format(node_id, dirname))
+        source = node_id - 1 if node_id < len(nodes) else node_id - 2
+        if node_id > 1:
+            connection_configs.append('<config key="connection_{}"><entry key="sourceID" type="xint" value="{}"/>'
+                                      '<entry key="destID" type="xint" value="{}"/></config>'.format(node_id, source, node_id))
+    with open(os.path.join(path, 'workflow.knime'), 'w') as fh:
+        fh.write('<?xml version="1.0" encoding="UTF-8"?>\n<config {} key="workflow.knime">\n'
+                 '<config key="nodes">\n{}\n</config>\n<config key="connections">\n{}\n</config>\n</config>\n'.format(
+                     NAMESPACE, '\n'.join(node_configs), '\n'.join(connection_configs)))
+
+def slow_storage(root, latency):
+    """
+    Delays every open, stat and directory listing under root by latency seconds.
+    """
+    def delayed(function):
+        def wrapper(path, *args, **kwargs):
+            if isinstance(path, (str, os.PathLike)) and os.fspath(path).startswith(root):
+                time.sleep(latency)
+            return function(path, *args, **kwargs)
+        return wrapper
+    builtins.open = io.open = delayed(io.open)
+    os.stat = delayed(os.stat)
+    os.scandir = delayed(os.scandir)
+    os.listdir = delayed(os.listdir)
+    os.access = delayed(os.access)
+
+def main():
+    parser = argparse.ArgumentParser(description='Extraction time of a workflowset on slow storage with and without prefetching.')
+    parser.add_argument('--workflows', type=int, default=40)
+    parser.add_argument('--nodes', type=int, default=40)
+    parser.add_argument('--latency-ms', type=float, default=2)
+    parser.add_argument('--exec-ms', type=float, default=300)
+    parser.add_argument('--max-workers', type=int, default=4)
+    parser.add_argument('--depths', type=int, nargs='+', default=[0, 8])
+    args = parser.parse_args()
+
+    import logging
+    import pandas as pd
+    import workflowgraph
+    from utils import workflowgrader
+
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        workspace = os.path.join(temp_dir, 'workspace')
+        data_path = os.path.join(temp_dir, 'iris.csv')
+        open(data_path, 'w').close()
+        for i in range(args.workflows):
+            make_workflow(os.path.join(workspace, 'set', 'a{}'.format(i)), args.nodes, data_path)
+        exec_path = os.path.join(temp_dir, 'knime')
+        with open(exec_path, 'w') as fh:
+            fh.write(FAKE_KNIME.format(python=sys.executable, exec_s=args.exec_ms / 1000))
+        os.chmod(exec_path, os.stat(exec_path).st_mode | stat.S_IEXEC)
+
+        reference = ({'Q{}'.format(args.nodes - 1): pd.DataFrame({'x': [1.0]}),
+                      'Q{}'.format(args.nodes): pd.DataFrame({'x': [1.0]})}, {})
+        slow_storage(workspace, args.latency_ms / 1000)
+
+        print('  {:>6} {:>10} {:>14} {:>9}'.format('depth', 'seconds', 'workflows/min', 'speedup'))
+        baseline = None
+        for depth in args.depths:
+            workflowgraph._graphs.clear()
+            wfg = workflowgrader(workspace, 'ref', exec_path, ['set'], heap_size='64m', max_workers=args.max_workers,
+                                 reference=reference, preflight=True, prefetch_depth=depth)
+            start = time.perf_counter()
+            wfg.extract_workflow_data('set')
+            seconds = time.perf_counter() - start
+            failures = sum(f is not None for f in wfg.sub_failures['set'].values())
+            assert not failures, '{} workflows failed'.format(failures)
+            baseline = baseline or seconds
+            print('  {:>6} {:>10.2f} {:>14.1f} {:>8.2f}x'.format(depth, seconds, args.workflows / seconds * 60, baseline / seconds))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Output bundles of graded workflowsets.
+
+A bundle holds everything the checks of a workflowset need from its
+submissions: the outputs of their COT nodes, their node distributions and
+their data paths. A workflowset can be regraded from its bundle against a
+new reference without executing any of its workflows again.
+"""
+import os
+import pickle
+import socket
+
+
+BUNDLE_VERSION = 1
+
+
+def bundle_filepath(save_dir, workflowset):
+    return os.path.join(save_dir, workflowset + '.bundle')
+
+def save_bundle(filepath, workflowset, student_ids, results):
+    """
+    Saves the results of `workflowgrader.extract_submission_data` for the
+    students of the workflowset, so that readers never observe a partial
+    bundle.
+    """
+    bundle = {'version': BUNDLE_VERSION, 'workflowset': workflowset,
+              'student_ids': list(student_ids), 'results': list(results)}
+    tmp_filepath = '{}.{}.{}.tmp'.format(filepath, socket.gethostname(), os.getpid())
+    with open(tmp_filepath, 'wb') as fh:
+        pickle.dump(bundle, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_filepath, filepath)
+
+def load_bundle(filepath):
+    """
+    Returns the (student_ids, results) saved in a bundle by `save_bundle`.
+    """
+    with open(filepath, 'rb') as fh:
+        bundle = pickle.load(fh)
+    if bundle.get('version') != BUNDLE_VERSION:
+        raise ValueError('Unsupported bundle version {} in {}'.format(bundle.get('version'), filepath))
+    return bundle['student_ids'], bundle['results']
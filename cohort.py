@@ -0,0 +1,164 @@
+"""
+Cohort statistics of a workflowset, accumulated online while it is checked.
+
+A `cohortstats` is updated with the results of the checks of every
+submission as they complete, in memory which does not grow with the number
+of students: counters of the graded and passed checks of each question,
+running moments and a fixed histogram of node_summary, and `topk` sketches
+of the incorrect columns of each question and of the foreign annotations.
+Its summary is saved as <workflowset>_cohort.json next to the csv of the
+workflowset:
+
+    students            number of students
+    failures            number of students by cause of failure, see `failures`
+    node_summary        count, mean, std, min, max and a histogram by upper bound
+    questions           for each question, the number of students who submitted it
+                        and, for each of the var, dtype, data and settings checks,
+                        the students graded and passed, the pass rate and the
+                        most common incorrect columns (or settings) with counts
+    foreign_questions   the most common foreign annotations with counts
+
+The counts of the sketches are exact as long as fewer distinct items than
+their capacity are seen, and otherwise overestimate by at most the error
+reported with each item.
+"""
+import json
+import math
+from bisect import bisect_left
+
+from failures import cause_of
+
+
+# number of items reported by each sketch
+TOP_K = 10
+# upper bounds of the buckets of the node_summary histogram
+NODE_SUMMARY_BUCKETS = (0.5, 0.75, 0.9, 1.1, 1.25, 1.5, 2, float('inf'))
+CHECKS = ('var', 'dtype', 'data', 'settings')
+UNGRADED = 'UNGRADED'
+
+
+class topk():
+    """
+    Space-Saving sketch of the k most frequent items of a stream, which
+    holds at most capacity items.
+    """
+    def __init__(self, k=TOP_K, capacity=None):
+        self.k = k
+        self.capacity = capacity or 10 * k
+        # {item: [count, error]}
+        self.counters = {}
+
+    def add(self, item, count=1):
+        if item in self.counters:
+            self.counters[item][0] += count
+        elif len(self.counters) < self.capacity:
+            self.counters[item] = [count, 0]
+        else:
+            # the least frequent item is replaced, its count becomes the error of the new item
+            evicted = min(self.counters, key=lambda i: self.counters[i][0])
+            minimum = self.counters.pop(evicted)[0]
+            self.counters[item] = [minimum + count, minimum]
+
+    def items(self):
+        """
+        Returns the k most frequent items as [item, count, error], most frequent first.
+        """
+        ranked = sorted(self.counters.items(), key=lambda kv: (-kv[1][0], str(kv[0])))
+        return [[item, count, error] for item, (count, error) in ranked[:self.k]]
+
+
+class runningstats():
+    """
+    Count, mean, variance (Welford), extremes and histogram of a stream of numbers.
+    """
+    def __init__(self, buckets=NODE_SUMMARY_BUCKETS):
+        self.buckets = buckets
+        self.histogram = [0] * len(buckets)
+        self.count, self.mean, self.m2 = 0, 0.0, 0.0
+        self.min, self.max = None, None
+
+    def add(self, value):
+        if value is None or math.isnan(value):
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.histogram[bisect_left(self.buckets, value)] += 1
+
+    def summary(self):
+        return {'count': self.count,
+                'mean': self.mean if self.count else None,
+                'std': math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else None,
+                'min': self.min, 'max': self.max,
+                'histogram': [['+Inf' if math.isinf(b) else b, n] for b, n in zip(self.buckets, self.histogram)]}
+
+
+class cohortstats():
+    """
+    Statistics of the students of a workflowset against the questions of
+    the reference, updated with `add_submission` and `add_check`.
+    """
+    def __init__(self, questions, k=TOP_K):
+        self.questions = [str(q) for q in questions]
+        self.students = 0
+        self.failures = {}
+        self.node_summary = runningstats()
+        self.submitted = dict.fromkeys(self.questions, 0)
+        # {question: {check: [graded, passed]}}
+        self.checks = {q: {c: [0, 0] for c in CHECKS} for q in self.questions}
+        # {question: {check: topk of the incorrect columns}}
+        self.incorrect = {q: {c: topk(k) for c in CHECKS} for q in self.questions}
+        self.foreign = topk(k)
+
+    def add_submission(self, missing_questions, foreign_questions, node_summary=None, failure=None):
+        """
+        Adds a student from the results of `compare_COT_annotation`, the
+        node_summary of the workflow and the reason of its failure, if any.
+        """
+        self.students += 1
+        if failure:
+            cause = cause_of(failure)
+            self.failures[cause] = self.failures.get(cause, 0) + 1
+        self.node_summary.add(node_summary)
+        missing = set(map(str, missing_questions))
+        for q in self.questions:
+            self.submitted[q] += q not in missing
+        for f in foreign_questions:
+            self.foreign.add(str(f))
+
+    def add_check(self, question, check, details):
+        """
+        Adds the result of the check of a question of a student, where
+        details is the list of incorrect columns (or settings, or
+        (column, dtype) for the dtype check), or ['UNGRADED'].
+        """
+        if UNGRADED in details:
+            return
+        counts = self.checks[str(question)][check]
+        counts[0] += 1
+        counts[1] += not details
+        for d in details:
+            self.incorrect[str(question)][check].add(str(d[0]) if isinstance(d, (tuple, list)) else str(d))
+
+    def summary(self):
+        """
+        Returns the statistics as a dictionary, see the module docstring.
+        """
+        questions = {}
+        for q in self.questions:
+            questions[q] = {'submitted': self.submitted[q]}
+            for c in CHECKS:
+                graded, passed = self.checks[q][c]
+                if graded:
+                    questions[q][c] = {'graded': graded, 'passed': passed, 'pass_rate': passed / graded,
+                                       'incorrect': self.incorrect[q][c].items()}
+        return {'students': self.students, 'failures': self.failures,
+                'node_summary': self.node_summary.summary(),
+                'questions': questions, 'foreign_questions': self.foreign.items()}
+
+    def save(self, filepath):
+        with open(filepath, 'w') as fh:
+            json.dump(self.summary(), fh)
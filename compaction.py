@@ -0,0 +1,126 @@
+"""
+Compact in-memory representation of the outputs of submissions.
+
+Outputs are held for every submission of a cohort until it is graded. To
+reduce their footprint, low-cardinality string variables are encoded as
+categoricals whose categories are shared by all submissions with the same
+values, other strings are interned in a pool shared by all submissions, and
+numeric variables are downcast when no value changes. The original dtypes
+are kept in the attrs of each output, so that variables can be compared in
+the dtypes which KNIME produced.
+"""
+
+
+# key of the attrs of a compacted output holding {variable: original dtype}
+ORIGINAL_DTYPES = 'original_dtypes'
+# string variables with at most this proportion of distinct values are encoded as categoricals
+CATEGORY_RATIO = 0.5
+
+
+class stringpool():
+    """
+    Pool of the strings and categorical dtypes shared by the outputs of all
+    submissions, so that each distinct value is held once.
+    """
+    def __init__(self):
+        self.strings = {}
+        self.dtypes = {}
+
+    def intern(self, value):
+        if not isinstance(value, str):
+            return value
+        return self.strings.setdefault(value, value)
+
+    def categorical_dtype(self, categories):
+        """
+        Returns the categorical dtype of the sorted categories, shared by
+        every output with the same categories.
+        """
+        import pandas as pd
+
+        key = tuple(categories)
+        if key not in self.dtypes:
+            self.dtypes[key] = pd.CategoricalDtype([self.intern(c) for c in key])
+        return self.dtypes[key]
+
+
+def compact_column(series, pool):
+    """
+    Returns the series in its most compact lossless dtype.
+    """
+    import numpy as np
+    import pandas as pd
+
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return series
+    if pd.api.types.is_integer_dtype(series.dtype):
+        return pd.to_numeric(series, downcast='integer')
+    if pd.api.types.is_float_dtype(series.dtype):
+        downcast = pd.to_numeric(series, downcast='float')
+        if downcast.dtype != series.dtype and \
+                np.array_equal(downcast.to_numpy(dtype=series.dtype), series.to_numpy(), equal_nan=True):
+            return downcast
+        return series
+    if pd.api.types.is_string_dtype(series.dtype):
+        values = series.dropna()
+        if not all(isinstance(v, str) for v in values):
+            return series
+        categories = sorted(values.unique())
+        if len(series) > 1 and len(categories) <= CATEGORY_RATIO * len(series):
+            return series.astype(pool.categorical_dtype(categories))
+        if series.dtype == object:
+            return series.map(pool.intern, na_action='ignore')
+    return series
+
+def compact_output(output, pool):
+    """
+    Compacts the dataframes of an output {question: dataframe} from
+    `utils.collect_workflow_outputs`, keeping their original dtypes.
+    Returns the compacted output with the memory used before and after
+    compaction, in bytes.
+    """
+    import pandas as pd
+
+    compacted, before, after = {}, 0, 0
+    for q, df in output.items():
+        if not isinstance(df, pd.DataFrame):
+            compacted[q] = df
+            continue
+        before += int(df.memory_usage(index=True, deep=True).sum())
+        compact_df = pd.DataFrame({v: compact_column(df[v], pool) for v in df.columns}, index=df.index)
+        if compact_df.columns.tolist() != df.columns.tolist():
+            # duplicated variables are kept as they are
+            compacted[q] = df
+            after += int(df.memory_usage(index=True, deep=True).sum())
+            continue
+        compact_df.attrs[ORIGINAL_DTYPES] = dict(df.attrs.get(ORIGINAL_DTYPES, df.dtypes.to_dict()))
+        compacted[q] = compact_df
+        after += int(compact_df.memory_usage(index=True, deep=True).sum())
+    return compacted, before, after
+
+
+def original_dtype(df, v):
+    """
+    Returns the dtype of variable v of an output dataframe before compaction.
+    """
+    dtype = df[v].dtype
+    return df.attrs.get(ORIGINAL_DTYPES, {}).get(v, dtype)
+
+def original_column(df, v):
+    """
+    Returns variable v of an output dataframe in its dtype before compaction.
+    """
+    series = df[v]
+    dtype = df.attrs.get(ORIGINAL_DTYPES, {}).get(v, series.dtype)
+    return series if series.dtype == dtype else series.astype(dtype)
+
+def original_frame(df, columns):
+    """
+    Returns the variables columns of an output dataframe in their dtypes
+    before compaction.
+    """
+    import pandas as pd
+
+    if ORIGINAL_DTYPES not in df.attrs:
+        return df[columns]
+    return pd.DataFrame({v: original_column(df, v) for v in columns}, index=df.index)
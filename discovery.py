@@ -0,0 +1,187 @@
+"""
+Discovery of the workflowsets and workflows of a workspace.
+
+A workspace is walked recursively with `os.scandir`, and its directories
+are classified from their markers:
+
+    workflow       holds a workflow.knime, not walked further
+    workflowset    holds a workflowset.meta and no workflow.svg
+    folder         any other directory, e.g. of a course, section or group
+
+Every workflow belongs to the nearest workflowset above it, so that the
+workflows of a workflowset may be nested in folders of groups. Nested
+workflowsets are named by their path relative to the workspace, joined by
+dots, e.g. course.section for course/section. When the workspace holds
+no workflowset, the workflows anywhere in it belong to a workflowset
+named after the workspace.
+
+Directories are listed concurrently, a level of the workspace at a time.
+The classification and the subdirectories of every directory are cached
+in a JSON file with the modification time of the directory, so that a
+directory which did not change since the last discovery is not listed
+again, but only stat'ed. The workflows in such a directory are taken from
+the cache without being stat'ed, as a workflow stays a workflow; only
+the folders and workflowsets of a workspace are stat'ed on a repeat
+discovery.
+"""
+import os
+import json
+import socket
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+
+WORKFLOW_MARKER = 'workflow.knime'
+WORKFLOWSET_MARKER = 'workflowset.meta'
+# exported workflows hold a workflow.svg, which workflowsets do not
+SVG_MARKER = 'workflow.svg'
+# directories which hold no submissions
+IGNORED_DIRNAMES = ('Example Workflows',)
+# number of threads listing directories
+DISCOVERY_WORKERS = 8
+CACHE_VERSION = 1
+
+
+def _classify(names):
+    if WORKFLOW_MARKER in names:
+        return 'workflow'
+    if WORKFLOWSET_MARKER in names and SVG_MARKER not in names:
+        return 'workflowset'
+    return 'folder'
+
+def workflowset_name(relpath):
+    """
+    Returns the name of the workflowset in the directory relpath of the workspace.
+    """
+    return '.'.join(relpath.split(os.sep))
+
+
+class workspacetree():
+    """
+    Workflowsets and workflows of the workspace, found by `discover`. When
+    cache_filepath is provided, the directories of the workspace are cached
+    in it across discoveries.
+    """
+    def __init__(self, workspace, cache_filepath=None, max_workers=DISCOVERY_WORKERS):
+        self.workspace = workspace
+        self.cache_filepath = cache_filepath
+        self.max_workers = max_workers
+        # {workflowset: fullpath of its directory}, in the order found
+        self.workflowsets = {}
+        # {workflowset: fullpaths of its workflows}, in the order found
+        self.workflows = {}
+        # {relpath: [mtime_ns, kind, subdirectory names]}
+        self.dirs = {}
+        # number of directories listed by the last discovery, the others were cached
+        self.listed = 0
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_filepath) as fh:
+                cache = json.load(fh)
+        except (OSError, ValueError):
+            return {}
+        if cache.get('version') != CACHE_VERSION or cache.get('workspace') != os.path.abspath(self.workspace):
+            return {}
+        return cache.get('dirs', {})
+
+    def _save_cache(self):
+        tmp_filepath = '{}.{}.{}.tmp'.format(self.cache_filepath, socket.gethostname(), os.getpid())
+        with open(tmp_filepath, 'w') as fh:
+            json.dump({'version': CACHE_VERSION, 'workspace': os.path.abspath(self.workspace), 'dirs': self.dirs}, fh)
+        os.replace(tmp_filepath, self.cache_filepath)
+
+    def _visit(self, relpath, cached):
+        """
+        Returns the entry of the directory relpath of the workspace, and
+        whether it was listed, from its cached entry when the directory
+        did not change since.
+        """
+        path = os.path.join(self.workspace, relpath) if relpath else self.workspace
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None, False
+        entry = cached.get(relpath)
+        if entry is not None and entry[0] == mtime:
+            return entry, False
+
+        names, subdirs = set(), []
+        try:
+            with os.scandir(path) as it:
+                for e in it:
+                    names.add(e.name)
+                    if not e.name.startswith('.') and e.name not in IGNORED_DIRNAMES and e.is_dir():
+                        subdirs.append(e.name)
+        except OSError as e:
+            logging.warning('Cannot list {}: {}'.format(path, e))
+            return None, False
+        kind = _classify(names)
+        return [mtime, kind, [] if kind == 'workflow' else subdirs], True
+
+    def discover(self):
+        """
+        Walks the workspace and finds its workflowsets and workflows.
+        Returns self.
+        """
+        cached = self._load_cache() if self.cache_filepath else {}
+        self.dirs, self.listed = {}, 0
+        # [relpath of the directory, relpath of its nearest workflowset or None]
+        level = [('', None)]
+        workflows = []
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='discovery') as executor:
+            while level:
+                visited = executor.map(lambda item: self._visit(item[0], cached), level)
+                next_level = []
+                for (relpath, workflowset), (entry, listed) in zip(level, visited):
+                    if entry is None:
+                        continue
+                    self.dirs[relpath] = entry
+                    self.listed += listed
+                    _, kind, subdirs = entry
+                    if kind == 'workflow' and relpath:
+                        workflows.append((relpath, workflowset))
+                        continue
+                    if kind == 'workflowset' and relpath:
+                        workflowset = relpath
+                        self.workflowsets[workflowset_name(relpath)] = os.path.join(self.workspace, relpath)
+                    for d in subdirs:
+                        subpath = os.path.join(relpath, d)
+                        if not listed and cached.get(subpath, [None, None])[1] == 'workflow':
+                            self.dirs[subpath] = cached[subpath]
+                            workflows.append((subpath, workflowset))
+                        else:
+                            next_level.append((subpath, workflowset))
+                level = next_level
+
+        root_name = os.path.basename(os.path.normpath(self.workspace))
+        for name in self.workflowsets:
+            self.workflows[name] = []
+        for relpath, workflowset in workflows:
+            if workflowset is not None:
+                self.workflows[workflowset_name(workflowset)].append(os.path.join(self.workspace, relpath))
+            elif not self.workflowsets:
+                self.workflows.setdefault(root_name, []).append(os.path.join(self.workspace, relpath))
+        for name, wfps in self.workflows.items():
+            student_ids = [os.path.basename(wfp) for wfp in wfps]
+            if len(set(student_ids)) < len(student_ids):
+                logging.warning('Workflowset {} holds workflows of the same name in different folders'.format(name))
+
+        if self.cache_filepath and (self.listed or set(cached) != set(self.dirs)):
+            self._save_cache()
+        return self
+
+    def workflow_paths(self, workflowset):
+        """
+        Returns the fullpaths of the workflows found in the workflowset.
+        """
+        return list(self.workflows.get(workflowset, []))
+
+    def workflowset_dir(self, workflowset):
+        """
+        Returns the fullpath of the directory of the workflowset.
+        """
+        if workflowset in self.workflowsets:
+            return self.workflowsets[workflowset]
+        return self.workspace if workflowset == os.path.basename(os.path.normpath(self.workspace)) \
+            else os.path.join(self.workspace, workflowset)
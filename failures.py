@@ -0,0 +1,88 @@
+"""
+Classification of the failed executions of submitted workflows.
+
+A failed execution is either transient, and likely to succeed when the
+workflow is executed again, or permanent, when the workflow itself is
+broken:
+
+    locked            transient  the workflow is locked by another KNIME instance
+    jvm_crash         transient  the JVM of KNIME crashed or ran out of memory
+    temp_collision    transient  a temporary file or directory of the execution
+                                 collided with one of a concurrent execution
+    timeout           transient  the execution did not complete in time
+    missing_output    permanent  KNIME completed without writing the outputs
+    preflight         permanent  the workflow failed the pre-flight checks
+    other             permanent  any other error
+    quarantined       permanent  transient failures which did not recover
+                                 after retries
+
+Failures are recorded as reasons of the form '<cause>: <message>', see
+`workflowgrader.extract_submission_data`, from which `cause_of` recovers
+the cause.
+"""
+import errno
+import subprocess
+
+
+TRANSIENT = ('locked', 'jvm_crash', 'temp_collision', 'timeout')
+PERMANENT = ('missing_output', 'preflight', 'other', 'quarantined')
+# number of times a transient failure is retried before it is quarantined
+RETRIES = 2
+# seconds before the first retry, doubled at every retry
+RETRY_BACKOFF = 10
+
+# phrases of the stderr of KNIME when its JVM crashed
+JVM_CRASH_PHRASES = (b'hs_err_pid', b'A fatal error has been detected by the Java Runtime',
+                     b'java.lang.OutOfMemoryError', b'Could not create the Java Virtual Machine')
+# exit codes of the shell running KNIME when its JVM was aborted or killed, e.g. by the OOM killer
+JVM_CRASH_RETURNCODES = (134, 137)
+# phrases of the stderr of KNIME when files of concurrent executions collided
+TEMP_COLLISION_PHRASES = (b'already in use', b'FileAlreadyExistsException')
+
+
+def classify(exc):
+    """
+    Returns the cause of a failed execution from its exception, one of
+    the causes in TRANSIENT or 'missing_output' or 'other'.
+    """
+    import knime
+
+    if isinstance(exc, (TimeoutError, subprocess.TimeoutExpired)):
+        return 'timeout'
+    if isinstance(exc, (FileExistsError, IsADirectoryError)) or \
+            (isinstance(exc, OSError) and exc.errno in (errno.EEXIST, errno.ENOTEMPTY)):
+        return 'temp_collision'
+    if isinstance(exc, ChildProcessError):
+        stderr = getattr(exc, 'stderr', b'') or b''
+        returncode = getattr(exc, 'returncode', None)
+        if knime.KEYPHRASE_LOCKED.decode('utf8') in str(exc) or knime.KEYPHRASE_LOCKED in stderr:
+            return 'locked'
+        if (returncode is not None and (returncode < 0 or returncode in JVM_CRASH_RETURNCODES)) or \
+                any(p in stderr for p in JVM_CRASH_PHRASES):
+            return 'jvm_crash'
+        if any(p in stderr for p in TEMP_COLLISION_PHRASES):
+            return 'temp_collision'
+        if 'not found' in str(exc):
+            return 'missing_output'
+    return 'other'
+
+def cause_of(reason):
+    """
+    Returns the cause of a failure from its reason, 'other' when the
+    reason does not start with a known cause.
+    """
+    cause = reason.split(':', 1)[0] if reason else ''
+    return cause if cause in TRANSIENT + PERMANENT else 'other'
+
+def is_transient(reason):
+    """
+    Returns True when the failure with the reason is worth retrying.
+    """
+    return reason is not None and cause_of(reason) in TRANSIENT
+
+def quarantine_reason(reason, attempts):
+    """
+    Returns the reason of a transient failure which still failed after
+    the number of attempts.
+    """
+    return 'quarantined: {} (after {} attempts)'.format(reason, attempts)
@@ -0,0 +1,126 @@
+import os
+import pickle
+import struct
+import zlib
+import logging
+
+
+# each record is framed as (payload length, crc32 of payload) followed by the pickled payload
+FRAME_HEADER = struct.Struct('<II')
+
+
+def failed(result):
+    """
+    Returns True when the result of `workflowgrader.extract_submission_data`
+    carries a failure. Results saved before failures were reported have none.
+    """
+    return len(result) > 3 and result[3] is not None
+
+
+class checkpointjournal():
+    """
+    Append-only journal of a grading run which allows the run to be resumed.
+
+    Records are
+        ('reference', None, reference, reference_args)    after the references are read
+        ('extract', workflowset, student_id, result)      after a submission is extracted
+        ('checks', workflowset, check_results)            after a workflowset is checked
+
+    where reference is the tuple returned by `workflowgrader.reference`,
+    reference_args are the arguments naming the reference workflows it was
+    read from, result is the tuple returned by `workflowgrader.extract_submission_data`
+    and check_results is the dictionary returned by `workflowgrader.checks_by_workflowset`.
+    Every record is fsync'ed before the next one is written, so at most the
+    record being written is lost on a crash. A torn record at the end of the
+    journal is detected by its checksum and discarded when the journal is opened.
+    Submissions whose result carries a failure are not taken as completed
+    when the journal is replayed, so a resumed run executes them again, and
+    neither are the check results of their workflowsets.
+    """
+    def __init__(self, filepath, resume=False):
+        self.filepath = filepath
+        # see `workflowgrader.reference`
+        self.reference = None
+        # arguments naming the reference workflows, e.g. {'ref_workflow': 'ref_wf', ...}
+        self.reference_args = None
+        # {workflowset: {student_id: result}}
+        self.extracted = {}
+        # {workflowset: check_results}
+        self.checks = {}
+
+        if resume and os.path.exists(filepath):
+            valid_size = self._replay()
+            with open(filepath, 'r+b') as fh:
+                fh.truncate(valid_size)
+        self._fh = open(filepath, 'ab' if resume else 'wb')
+
+    def _replay(self):
+        """
+        Reads the records of the journal. Returns the size of the journal
+        up to the last intact record.
+        """
+        valid_size = 0
+        with open(self.filepath, 'rb') as fh:
+            while True:
+                header = fh.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    break
+                length, crc = FRAME_HEADER.unpack(header)
+                payload = fh.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    logging.warning('Discarding torn record at the end of {}'.format(self.filepath))
+                    break
+                self._apply(pickle.loads(payload))
+                valid_size = fh.tell()
+        # the checks of a workflowset are run again with its failed submissions
+        for workflowset in list(self.checks):
+            if any(failed(result) for result in self.extracted.get(workflowset, {}).values()):
+                del self.checks[workflowset]
+        return valid_size
+
+    def _apply(self, record):
+        kind, workflowset, *data = record
+        if kind == 'reference':
+            # journals written before the reference arguments were recorded have none
+            self.reference, self.reference_args = data[0], data[1] if len(data) > 1 else None
+        elif kind == 'extract':
+            student_id, result = data
+            self.extracted.setdefault(workflowset, {})[student_id] = result
+        elif kind == 'checks':
+            self.checks[workflowset] = data[0]
+
+    def _append(self, record):
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        self._fh.write(FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._apply(record)
+
+    def record_reference(self, reference, reference_args):
+        """
+        Durably records the reference from `workflowgrader.reference`, with
+        the arguments naming the reference workflows it was read from.
+        """
+        self._append(('reference', None, reference, reference_args))
+
+    def record_extract(self, workflowset, student_id, result):
+        """
+        Durably records the extracted result of a submission.
+        """
+        self._append(('extract', workflowset, student_id, result))
+
+    def record_checks(self, workflowset, check_results):
+        """
+        Durably records the check results of a workflowset.
+        """
+        self._append(('checks', workflowset, check_results))
+
+    def completed(self, workflowset):
+        """
+        Returns {student_id: result} of the submissions of the workflowset
+        which are already extracted without a failure.
+        """
+        return {s: result for s, result in self.extracted.get(workflowset, {}).items() if not failed(result)}
+
+    def close(self):
+        self._fh.close()
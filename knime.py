@@ -27,16 +27,24 @@ import warnings
 import logging
 import os
 from urllib.parse import urlparse
-try:
-    import requests
-except ImportError:
-    # RemoteWorkflow capabilities will be unavailable
-    pass
-try:
-    import pandas
-except ImportError:
-    # Optional support for returning pandas DataFrames will be unavailable
-    pandas = None
+# requests (for RemoteWorkflow) and pandas are imported on first use as
+# importing them dominates the startup time of command line tools.
+
+
+_pandas = None
+
+def _import_pandas():
+    """Imports pandas on first use.  Returns None if pandas is not installed,
+    in which case optional support for returning pandas DataFrames will be
+    unavailable."""
+    global _pandas
+    if _pandas is None:
+        try:
+            import pandas
+        except ImportError:
+            pandas = False
+        _pandas = pandas
+    return _pandas or None
 
 
 __author__ = "Appliomics, LLC"
@@ -57,6 +65,17 @@ else:
 KEYPHRASE_LOCKED = b"Workflow is locked by another KNIME instance"
 
 
+# NEW
+class ExecutionError(ChildProcessError):
+    """Raised when the KNIME batch executor did not produce the outputs of a
+    workflow, with the exit code and the captured stderr of the executor."""
+
+    def __init__(self, message, returncode=None, stderr=None):
+        super().__init__(message)
+        self.returncode = returncode
+        self.stderr = stderr or b""
+
+
 def find_service_table_node_dirnames(path_to_knime_workflow):
     """Returns a tuple containing the unique directory names of the Container
     Input and Output (Table) nodes employed by the KNIME workflow in the
@@ -158,6 +177,49 @@ def find_service_file_reader_data_path(
                                             parameter_name = d.attrib.get("value")
     return parameter_name
 
+# NEW
+def set_service_file_reader_data_path(
+    path_to_knime_workflow,
+    unique_node_dirname,
+    data_path
+):
+    """
+    Sets the data path of CSV, File and Excel Reader nodes to the local
+    file data_path, in place, as the file chooser of KNIME stores a local
+    file: a LOCAL file system without specifier, also selected in the
+    chooser. Legacy File Reader nodes, which store a DataURL rather than a
+    file selection, are left as they are, as `find_service_file_reader_data_path`
+    finds no data path for them.
+    Returns True when the data path was set.
+    """
+    settings_filepath = Path(path_to_knime_workflow, unique_node_dirname, "settings.xml")
+    tree = ElementTree.parse(settings_filepath)
+    top_config = tree.getroot()
+    if top_config.tag.startswith("{"):
+        ElementTree.register_namespace("", top_config.tag[1:].split("}")[0])
+    found = False
+    for config in top_config.iter():
+        if config.attrib.get("key") != "file_selection":
+            continue
+        for c in config:
+            if c.attrib.get("key") == "path":
+                for d in list(c):
+                    if d.attrib.get("key") == "path":
+                        d.set("value", str(data_path))
+                        found = True
+                    elif d.attrib.get("key") == "file_system_type":
+                        d.set("value", "LOCAL")
+                    elif d.attrib.get("key") == "file_system_specifier":
+                        # local paths have no specifier, e.g. knime.workflow or a mountpoint
+                        c.remove(d)
+            elif c.attrib.get("key") == "file_system_chooser__Internals":
+                for d in c:
+                    if d.attrib.get("key") == "convenience_fs_category":
+                        d.set("value", "LOCAL")
+    if found:
+        tree.write(settings_filepath, encoding="UTF-8", xml_declaration=True)
+    return found
+
 
 def find_service_table_input_node_parameter_name(
     path_to_knime_workflow,
@@ -215,6 +277,61 @@ def find_node_id(path_to_knime_workflow, unique_node_dirname):
     return node_id
 
 
+# NEW
+def find_node_ids(path_to_knime_workflow):
+    """Returns {unique node directory name: node id} of the nodes at the
+    top level of the KNIME workflow, parsing its workflow.knime once."""
+
+    tree = ElementTree.parse(Path(path_to_knime_workflow, "workflow.knime"))
+    node_ids = {}
+    for entry in tree.getroot():
+        if entry.attrib.get("key") != "nodes":
+            continue
+        for node_config in entry:
+            values = {sub_tag.attrib.get("key"): sub_tag.attrib.get("value") for sub_tag in node_config}
+            if values.get("id") is not None and values.get("node_settings_file") is not None:
+                node_ids[str(PurePosixPath(values["node_settings_file"]).parent)] = int(values["id"])
+    return node_ids
+
+# NEW
+def discover_service_nodes(path_to_knime_workflow):
+    """Returns the Container Input (Table), Container Output (Table) and
+    CSV, File and Excel Reader nodes of the KNIME workflow as a tuple of
+    their unique directory names and node ids, (input dirnames, output
+    dirnames, file reader dirnames, input ids, output ids, file reader ids),
+    as found by `find_service_table_node_dirnames`,
+    `find_service_file_reader_node_dirnames` and `find_node_id`, reading
+    each settings.xml and the workflow.knime once."""
+
+    input_dirnames, output_dirnames, file_reader_dirnames = [], [], []
+    for settings_filepath in Path(path_to_knime_workflow).glob("*/settings.xml"):
+        dirname = settings_filepath.parent.name
+        table_found = reader_found = False
+        with settings_filepath.open() as fh:
+            for line in fh:
+                if not table_found:
+                    if "ContainerTableInputNodeFactory" in line:
+                        input_dirnames.append(dirname)
+                        table_found = True
+                    elif "ContainerTableOutputNodeFactory" in line:
+                        output_dirnames.append(dirname)
+                        table_found = True
+                if not reader_found and ("CSVTableReaderNodeFactory" in line or
+                        "ExcelTableReaderNodeFactory" in line or "FileReaderNodeFactory" in line):
+                    file_reader_dirnames.append(dirname)
+                    reader_found = True
+                if table_found and reader_found:
+                    break
+
+    node_ids = find_node_ids(path_to_knime_workflow)
+    return (
+        input_dirnames, output_dirnames, file_reader_dirnames,
+        [node_ids.get(dirname) for dirname in input_dirnames],
+        [node_ids.get(dirname) for dirname in output_dirnames],
+        [node_ids.get(dirname) for dirname in file_reader_dirnames],
+    )
+
+
 map_numpy_to_knime_type = (
     ('float', 'double'),
     ('int64', 'long'),
@@ -277,6 +394,24 @@ def convert_dataframe_to_knime_friendly_dict(df):
     return data
 
 
+# NEW
+def _kill_process_tree(process):
+    "Kills a process started by `run_workflow_using_multiple_service_tables` and its children."
+    if os.name == "nt":
+        subprocess.run(
+            ["taskkill", "/F", "/T", "/PID", str(process.pid)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+    else:
+        import signal
+        # the shell, KNIME and its JVM share the session started for the shell
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    process.kill()
+
+
 def run_workflow_using_multiple_service_tables(
         input_datas,
         path_to_knime_executable,
@@ -287,13 +422,26 @@ def run_workflow_using_multiple_service_tables(
         *,
         save_after_execution=False,
         live_passthru_stdout_stderr=False,
-        output_as_pandas_dataframes=True if pandas else False,
+        output_as_pandas_dataframes=None,
         input_json_filename_pattern="input_%d.json",
         output_json_filename_pattern="output_%d.json",
+        vmargs=None,
+        timeout=None,
     ):
     """Executes the requested KNIME workflow, feeding the supplied data
     to the Container Input (Table) nodes in that workflow and returning the
-    output from the workflow's Container Output (Table) nodes."""
+    output from the workflow's Container Output (Table) nodes.
+
+    Arguments for the JVM of the batch executor (e.g. ["-Xmx2g"]) may be
+    supplied as `vmargs`; these are passed through KNIME's `-vmargs` flag
+    and override the heap settings in knime.ini for this run only.
+    When the execution takes longer than `timeout` seconds, KNIME and the
+    processes it started are killed and subprocess.TimeoutExpired is raised.
+    Outputs are returned as pandas DataFrames if pandas is installed, unless
+    `output_as_pandas_dataframes` is False."""
+
+    if output_as_pandas_dataframes is None:
+        output_as_pandas_dataframes = _import_pandas() is not None
 
     abspath_to_knime_workflow = Path(path_to_knime_workflow).resolve(strict=True)
     if not Path(path_to_knime_executable).exists():
@@ -347,6 +495,8 @@ def run_workflow_using_multiple_service_tables(
             f'-workflowDir="{abspath_to_knime_workflow}"',
             " ".join(option_flags_input_service_table_nodes),
             " ".join(option_flags_output_service_table_nodes),
+            # -vmargs consumes the remainder of the command line, keep it last
+            " ".join(["-vmargs", *vmargs]) if vmargs else "",
         ])
         logging.info(f"knime invocation: {shell_command}")
         startupinfo = None
@@ -360,14 +510,25 @@ def run_workflow_using_multiple_service_tables(
             )
             startupinfo.wShowWindow = subprocess.SW_HIDE
         
-        result = subprocess.run(
+        # EDITED
+        # KNIME is started in a session of its own, so that its process tree can be killed on timeout
+        process = subprocess.Popen(
             shell_command,
             shell=True if os.name != "nt" else False,
             # stdout=subprocess.DEVNULL,
             stdout=subprocess.PIPE if not live_passthru_stdout_stderr else None,
             stderr=subprocess.PIPE if not live_passthru_stdout_stderr else None,
-            startupinfo=startupinfo
+            startupinfo=startupinfo,
+            start_new_session=os.name != "nt"
         )
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            logging.error(f"KNIME execution timed out after {timeout} seconds")
+            _kill_process_tree(process)
+            process.communicate()
+            raise
+        result = subprocess.CompletedProcess(shell_command, process.returncode, stdout, stderr)
         logging.info(f"exit code from KNIME execution: {result.returncode}")
 
         knime_outputs = []
@@ -378,7 +539,7 @@ def run_workflow_using_multiple_service_tables(
                 knime_outputs.append(single_node_knime_output)
         except FileNotFoundError:
             if result.stderr and KEYPHRASE_LOCKED in result.stderr:
-                raise ChildProcessError(KEYPHRASE_LOCKED.decode('utf8'))
+                raise ExecutionError(KEYPHRASE_LOCKED.decode('utf8'), result.returncode, result.stderr)
 
             try:
                 logging.error(f"captured stdout: {result.stdout.decode('utf8')}")
@@ -386,7 +547,7 @@ def run_workflow_using_multiple_service_tables(
             except:
                 logging.error(f"captured stdout: {result.stdout}")
                 logging.error(f"captured stderr: {result.stderr}")
-            raise ChildProcessError("Output from KNIME not found")
+            raise ExecutionError("Output from KNIME not found", result.returncode, result.stderr)
 
         if output_as_pandas_dataframes:
             try:
@@ -395,7 +556,7 @@ def run_workflow_using_multiple_service_tables(
                         k for d in output['table-spec']
                         for k, v in d.items()
                     )
-                    knime_outputs[i] = pandas.DataFrame(
+                    knime_outputs[i] = _import_pandas().DataFrame(
                         output['table-data'],
                         columns=df_columns
                     )
@@ -449,8 +610,10 @@ class LocalWorkflow:
             "_service_table_input_nodes", "_service_table_output_nodes",
             "_service_file_reader_nodes",
             "save_after_execution",
-            "path_to_knime_workflow", "_input_ids", "_output_ids", "_filereader_ids")
-    def __init__(self, workflow_path, *, workspace_path=None, save_after_execution=False):
+            "path_to_knime_workflow", "_input_ids", "_output_ids", "_filereader_ids",
+            "vmargs", "timeout")
+    def __init__(self, workflow_path, *, workspace_path=None, save_after_execution=False,
+                 vmargs=None, discovered=None, timeout=None):
         if workspace_path is not None:
             try:
                 workflow_path_as_path = Path(workflow_path).relative_to("/")
@@ -462,6 +625,9 @@ class LocalWorkflow:
         else:
             self.path_to_knime_workflow = Path(workflow_path).resolve()
         self.save_after_execution = save_after_execution
+        # NEW
+        self.vmargs = list(vmargs) if vmargs else []
+        self.timeout = timeout
         self._data_table_inputs = None
         self._data_table_outputs = None
         self._service_table_input_nodes = None
@@ -469,6 +635,11 @@ class LocalWorkflow:
         # NEW
         self._file_readers_data_dir = None
         self._service_file_reader_nodes = None
+        # NEW
+        # nodes discovered beforehand with `discover_service_nodes`, e.g. of a
+        # workflow of which this workflow is a copy
+        if discovered is not None:
+            self._apply_discovered_nodes(discovered)
 
     def __dir__(self):
         return [ a for a in dir(self.__class__) if a[0] != "_" or a[1] == "_" ]
@@ -482,22 +653,13 @@ class LocalWorkflow:
         return False
     # EDITED
     def _discover_inputoutput_filereader_nodes(self):
-        self._service_table_input_nodes, self._service_table_output_nodes = \
-            find_service_table_node_dirnames(self.path_to_knime_workflow)
-        self._service_file_reader_nodes = \
-            find_service_file_reader_node_dirnames(self.path_to_knime_workflow)
-        self._input_ids = [
-            find_node_id(self.path_to_knime_workflow, stin)
-            for stin in self._service_table_input_nodes
-        ]
-        self._output_ids = [
-            find_node_id(self.path_to_knime_workflow, stin)
-            for stin in self._service_table_output_nodes
-        ]        
-        self._filereader_ids = [
-            find_node_id(self.path_to_knime_workflow, stin) 
-            for stin in self._service_file_reader_nodes
-        ]
+        self._apply_discovered_nodes(discover_service_nodes(self.path_to_knime_workflow))
+
+    # NEW
+    def _apply_discovered_nodes(self, discovered):
+        (self._service_table_input_nodes, self._service_table_output_nodes,
+         self._service_file_reader_nodes, self._input_ids, self._output_ids,
+         self._filereader_ids) = (list(d) for d in discovered)
         self._data_table_inputs = [None] * len(self._service_table_input_nodes)
         self._data_table_outputs = [None] * len(self._service_table_output_nodes)
         self._file_readers_data_dir = [None] * len(self._service_file_reader_nodes)
@@ -517,7 +679,7 @@ class LocalWorkflow:
             self,
             *,
             live_passthru_stdout_stderr=False,
-            output_as_pandas_dataframes=True if pandas else False,
+            output_as_pandas_dataframes=None,
         ):
         "Executes the KNIME workflow via KNIME's batch executor."
         outputs = run_workflow_using_multiple_service_tables(
@@ -530,6 +692,8 @@ class LocalWorkflow:
             save_after_execution=self.save_after_execution,
             live_passthru_stdout_stderr=live_passthru_stdout_stderr,
             output_as_pandas_dataframes=output_as_pandas_dataframes,
+            vmargs=self.vmargs,
+            timeout=self.timeout,
         )
         self._data_table_outputs[:] = outputs
 
@@ -592,7 +756,7 @@ class LocalWorkflow:
         CSV, File or Excel Reader nodes. This list is not
         guaranteed to persist after __exit__ is called."""
         if self._service_file_reader_nodes is None:
-            self._discover_filereader_nodes()
+            self._discover_inputoutput_filereader_nodes()
         # for unique_node_dirname in self._service_file_reader_nodes:
         #     print(unique_node_dirname)
         return list(
@@ -639,6 +803,7 @@ class RemoteWorkflow(LocalWorkflow):
     def __init__(self, workflow_path, *, workspace_path=None,
                  username=None, password=None,
                  server_base_path="/knime"):
+        import requests
         if workspace_path is not None:
             parsed_path = urlparse(workspace_path)
             reduced_workflow_path = workflow_path.split("/knime", 1)[-1]
@@ -666,6 +831,7 @@ class RemoteWorkflow(LocalWorkflow):
         self._service_table_input_nodes = None
 
     def _discover_inputoutput_nodes(self):
+        import requests
         r = requests.get(
             f"{self.rest_api_root_url}/repository/{self.path_to_knime_workflow}:openapi",
             headers={"Authorization": f"Bearer {self.jwt}"}
@@ -720,8 +886,12 @@ class RemoteWorkflow(LocalWorkflow):
         return self._data_table_outputs
 
     def execute(self, *, timeout_ms=-1, reset=None,
-                output_as_pandas_dataframes=True if pandas else False):
+                output_as_pandas_dataframes=None):
         "Executes the KNIME workflow via a KNIME Server's REST API."
+        import requests
+
+        if output_as_pandas_dataframes is None:
+            output_as_pandas_dataframes = _import_pandas() is not None
 
         data_table_inputs = self.data_table_inputs
         job_input_data = {
@@ -766,7 +936,7 @@ class RemoteWorkflow(LocalWorkflow):
                         for k, v in d.items()
                     )
                     knime_outputs.append(
-                        pandas.DataFrame(
+                        _import_pandas().DataFrame(
                             output['table-data'],
                             columns=df_columns
                         )
@@ -788,6 +958,7 @@ class RemoteWorkflow(LocalWorkflow):
         self._data_table_outputs[:] = knime_outputs
 
     def _get_workflow_svg(self):
+        import requests
         r = requests.get(
             f"{self.rest_api_root_url}/repository/{self.path_to_knime_workflow}:image",
             headers={"Authorization": f"Bearer {self.jwt}"}
@@ -0,0 +1,263 @@
+"""
+Live metrics of a grading run in the Prometheus text format.
+
+The workflowgrader records its metrics in a `metricsregistry`, which a
+`metricsexporter` publishes while the run goes on, as a text file for the
+textfile collector of the node exporter and/or on a local /metrics endpoint:
+
+    workflowgrader_submissions_total             submissions extracted
+    workflowgrader_submissions_per_minute        submissions extracted per minute over the last 5 minutes
+    workflowgrader_in_flight_executions          KNIME executions running
+    workflowgrader_queue_depth                   submissions waiting for an execution
+    workflowgrader_phase_duration_seconds        histogram of the duration of each phase
+    workflowgrader_failures_total                failed executions by cause, see failures.py
+    workflowgrader_retries_total                 executions retried after a transient failure, by cause
+    workflowgrader_quarantined_total             submissions quarantined after their retries failed
+    workflowgrader_memory_bytes                  resident memory of the grader, memory available on the machine
+                                                 and memory committed to KNIME executions
+"""
+import os
+import time
+import socket
+import threading
+import logging
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+
+PREFIX = 'workflowgrader'
+# upper bounds, in seconds, of the buckets of the phase duration histogram
+BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, float('inf'))
+# window over which submissions per minute are computed, in seconds
+RATE_WINDOW = 300
+
+METRICS = {
+    'submissions_total': ('counter', 'Submissions extracted.'),
+    'submissions_per_minute': ('gauge', 'Submissions extracted per minute over the last 5 minutes.'),
+    'in_flight_executions': ('gauge', 'KNIME executions running.'),
+    'queue_depth': ('gauge', 'Submissions waiting for an execution.'),
+    'phase_duration_seconds': ('histogram', 'Duration of the phases of grading.'),
+    'failures_total': ('counter', 'Failed executions by cause.'),
+    'retries_total': ('counter', 'Executions retried after a transient failure, by cause.'),
+    'quarantined_total': ('counter', 'Submissions quarantined after their retries failed.'),
+    'memory_bytes': ('gauge', 'Resident memory of the grader, memory available on the machine and memory committed to KNIME executions.'),
+}
+
+
+def failure_cause(exc):
+    """
+    Returns the cause of a failed execution from its exception, see
+    `failures.classify`.
+    """
+    from failures import classify
+
+    return classify(exc)
+
+def resident_memory():
+    """
+    Returns the resident memory of the grader in bytes, or None when it
+    cannot be determined.
+    """
+    try:
+        with open('/proc/self/status') as fh:
+            return next(int(line.split()[1]) * 1024 for line in fh if line.startswith('VmRSS:'))
+    except (OSError, StopIteration):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+def memory_usage(governor):
+    """
+    Returns the memory gauges {labels: bytes} of a grading run whose KNIME
+    executions are admitted by the `scheduler.memorygovernor` governor.
+    """
+    from scheduler import available_system_memory
+
+    return {(('kind', 'grader_resident'),): resident_memory(),
+            (('kind', 'system_available'),): available_system_memory(),
+            (('kind', 'knime_committed'),): governor.committed}
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+def _format(name, labels, value):
+    label_text = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels)
+    return '{}_{}{} {}'.format(PREFIX, name, '{' + label_text + '}' if label_text else '', repr(float(value)))
+
+
+class metricsregistry():
+    """
+    Thread-safe store of the counters, gauges and histograms of METRICS.
+    Gauges may also be given as functions evaluated when the metrics are
+    rendered.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {name: {labels: value}}
+        self.values = {name: {} for name in METRICS}
+        # {name: {labels: (bucket counts, sum, count)}}
+        self.histograms = {}
+        # {name: function returning {labels dict as tuple: value}}
+        self.functions = {}
+        self._completions = deque()
+        self.started = time.time()
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            series = self.values[name]
+            key = _labels(labels)
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.values[name][_labels(labels)] = value
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            key = _labels(labels)
+            buckets, total, count = self.histograms.setdefault(name, {}).get(key, ([0] * len(BUCKETS), 0.0, 0))
+            buckets = list(buckets)
+            buckets[bisect_left(BUCKETS, value)] += 1
+            self.histograms[name][key] = (buckets, total + value, count + 1)
+
+    def gauge_function(self, name, function):
+        """
+        Registers a function returning {labels tuple: value} of gauge name.
+        """
+        self.functions[name] = function
+
+    @contextmanager
+    def timer(self, phase):
+        """
+        Observes the duration of the enclosed phase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('phase_duration_seconds', time.perf_counter() - start, phase=phase)
+
+    def completed(self):
+        """
+        Counts a submission as extracted.
+        """
+        now = time.time()
+        self.inc('submissions_total')
+        with self._lock:
+            self._completions.append(now)
+
+    def submissions_per_minute(self):
+        now = time.time()
+        with self._lock:
+            while self._completions and self._completions[0] < now - RATE_WINDOW:
+                self._completions.popleft()
+            n = len(self._completions)
+        return n / (max(min(now - self.started, RATE_WINDOW), 1) / 60)
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        values = {}
+        for name, function in self.functions.items():
+            try:
+                values[name] = function()
+            except Exception:
+                logging.exception('Error encountered evaluating metric {}'.format(name))
+        values['submissions_per_minute'] = {(): self.submissions_per_minute()}
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in METRICS.items():
+                lines.append('# HELP {}_{} {}'.format(PREFIX, name, help_text))
+                lines.append('# TYPE {}_{} {}'.format(PREFIX, name, kind))
+                if kind == 'histogram':
+                    for key, (buckets, total, count) in sorted(self.histograms.get(name, {}).items()):
+                        cumulative = 0
+                        for bound, n in zip(BUCKETS, buckets):
+                            cumulative += n
+                            le = '+Inf' if bound == float('inf') else repr(float(bound))
+                            lines.append(_format(name + '_bucket', key + (('le', le),), cumulative))
+                        lines.append(_format(name + '_sum', key, total))
+                        lines.append(_format(name + '_count', key, count))
+                    continue
+                series = dict(self.values[name])
+                series.update(values.get(name, {}))
+                for key, value in sorted(series.items()):
+                    if value is not None:
+                        lines.append(_format(name, key, value))
+        return '\n'.join(lines) + '\n'
+
+
+class metricsexporter():
+    """
+    Publishes the metrics of a registry every interval seconds to a text
+    file, replaced atomically, and/or on http://127.0.0.1:port/metrics.
+    """
+    def __init__(self, registry, textfile=None, port=None, interval=15):
+        self.registry = registry
+        self.textfile = textfile
+        self.port = port
+        self.interval = interval
+        self._stop = threading.Event()
+        self._threads = []
+        self.server = None
+
+    def write(self):
+        tmp_filepath = '{}.{}.{}.tmp'.format(self.textfile, socket.gethostname(), os.getpid())
+        with open(tmp_filepath, 'w') as fh:
+            fh.write(self.registry.render())
+        os.replace(tmp_filepath, self.textfile)
+
+    def _write_periodically(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError:
+                logging.exception('Error encountered writing metrics to {}'.format(self.textfile))
+
+    def start(self):
+        if self.textfile:
+            self.write()
+            self._threads.append(threading.Thread(target=self._write_periodically, daemon=True))
+        if self.port is not None:
+            from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+            registry = self.registry
+
+            class handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split('?')[0] != '/metrics':
+                        self.send_error(404)
+                        return
+                    payload = registry.render().encode('utf8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                    self.send_header('Content-Length', str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+
+                def log_message(self, format, *args):
+                    pass
+
+            self.server = ThreadingHTTPServer(('127.0.0.1', self.port), handler)
+            self._threads.append(threading.Thread(target=self.server.serve_forever, daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops publishing, writing the text file a last time.
+        """
+        self._stop.set()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if self.textfile:
+            self.write()
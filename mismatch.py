@@ -0,0 +1,128 @@
+"""
+Localization of the mismatches of the variables with incorrect data.
+
+When a variable of a submitted output differs from the reference, its
+values are compared with the reference in vectorized chunks to locate where
+they differ. The diagnostic of the variable is a dictionary:
+
+    mismatches    number of differing values among the rows compared, rows
+                  missing from or extra to the submitted output included
+    ratio         mismatches over the rows compared
+    rows          the first k differing rows as [row, reference value, submitted value],
+                  by position, with values shortened to MAX_VALUE_CHARS and
+                  None for the value of a missing or extra row
+    shape         [reference rows, submitted rows], when they differ
+    nan           [reference NaNs, submitted NaNs], when they differ
+    dtype         [reference dtype, submitted dtype], when they differ
+    compared      number of rows compared, when the budget stopped the
+                  comparison before the last row
+
+Outputs of unordered questions are compared as multisets: mismatches is the
+number of values in one multiset and not in the other, and rows is replaced
+by missing and extra, the first k values missing from or extra to the
+submitted output.
+
+The comparison of a variable stops after max_rows rows or once it took
+time_budget seconds, so that huge outputs neither stall the checks nor
+bloat the csv.
+"""
+import time
+
+
+# number of differing rows reported per variable
+DIAGNOSTIC_ROWS = 3
+# seconds the comparison of a variable may take
+DIAGNOSTIC_TIME_BUDGET = 0.05
+# rows compared per variable
+DIAGNOSTIC_MAX_ROWS = 10**6
+# rows compared at once
+CHUNK_ROWS = 2**16
+MAX_VALUE_CHARS = 40
+
+
+def _short(value):
+    import pandas as pd
+
+    if pd.isna(value):
+        return None
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, (bool, int, float)):
+        return value
+    value = str(value)
+    return value if len(value) <= MAX_VALUE_CHARS else value[:MAX_VALUE_CHARS - 3] + '...'
+
+def _differing(ref, sub):
+    """
+    Returns a boolean array of the positions at which two aligned series of
+    values differ, NaNs being equal to NaNs.
+    """
+    import numpy as np
+    import pandas as pd
+
+    ref_na, sub_na = pd.isna(ref), pd.isna(sub)
+    try:
+        with np.errstate(invalid='ignore'):
+            equal = np.asarray(ref == sub, dtype=bool)
+    except (TypeError, ValueError):
+        equal = np.fromiter((a == b for a, b in zip(ref, sub)), dtype=bool, count=len(ref))
+    return ~(equal | (ref_na & sub_na)) | (ref_na != sub_na)
+
+def diagnose_column(ref, sub, unordered=False, k=DIAGNOSTIC_ROWS,
+                    time_budget=DIAGNOSTIC_TIME_BUDGET, max_rows=DIAGNOSTIC_MAX_ROWS):
+    """
+    Returns the diagnostic of the submitted series sub against the reference
+    series ref, see the module docstring.
+    """
+    import numpy as np
+
+    start = time.perf_counter()
+    diagnostic = {}
+    if len(ref) != len(sub):
+        diagnostic['shape'] = [len(ref), len(sub)]
+    ref_nan, sub_nan = int(ref.isna().sum()), int(sub.isna().sum())
+    if ref_nan != sub_nan:
+        diagnostic['nan'] = [ref_nan, sub_nan]
+    if ref.dtype != sub.dtype:
+        diagnostic['dtype'] = [str(ref.dtype), str(sub.dtype)]
+
+    if unordered:
+        n = min(max(len(ref), len(sub)), max_rows)
+        ref_counts = ref.iloc[:n].value_counts(dropna=False)
+        sub_counts = sub.iloc[:n].value_counts(dropna=False)
+        delta = ref_counts.sub(sub_counts, fill_value=0)
+        diagnostic['mismatches'] = int(np.abs(delta).sum())
+        diagnostic['ratio'] = round(diagnostic['mismatches'] / max(n, 1), 4)
+        diagnostic['missing'] = [_short(v) for v in delta[delta > 0].index[:k]]
+        diagnostic['extra'] = [_short(v) for v in delta[delta < 0].index[:k]]
+        if n < max(len(ref), len(sub)):
+            diagnostic['compared'] = n
+        return diagnostic
+
+    ref_values = ref.to_numpy(dtype=object) if ref.dtype != sub.dtype else ref.to_numpy()
+    sub_values = sub.to_numpy(dtype=object) if ref.dtype != sub.dtype else sub.to_numpy()
+    n = min(len(ref_values), len(sub_values))
+    total = max(len(ref_values), len(sub_values))
+    compared, mismatches, rows = 0, 0, []
+    while compared < min(n, max_rows):
+        end = min(compared + CHUNK_ROWS, n, max_rows)
+        differing = np.flatnonzero(_differing(ref_values[compared:end], sub_values[compared:end])) + compared
+        mismatches += len(differing)
+        rows.extend([int(i), _short(ref_values[i]), _short(sub_values[i])] for i in differing[:k - len(rows)])
+        compared = end
+        if time.perf_counter() - start > time_budget:
+            break
+    if compared == n < total:
+        # the rows past the end of the shorter output are missing from or extra to the submitted output
+        end = min(total, max_rows)
+        longer, ref_longer = (ref_values, True) if len(ref_values) > n else (sub_values, False)
+        mismatches += end - n
+        rows.extend([i, _short(longer[i]), None] if ref_longer else [i, None, _short(longer[i])]
+                    for i in range(n, min(end, n + k - len(rows))))
+        compared = end
+    diagnostic['mismatches'] = mismatches
+    diagnostic['ratio'] = round(mismatches / max(compared, 1), 4)
+    diagnostic['rows'] = rows
+    if compared < total:
+        diagnostic['compared'] = compared
+    return diagnostic
@@ -0,0 +1,142 @@
+"""
+Sparse matrix of the node counts of the workflows in a workflowset.
+
+Each submission uses a few of the many node types found across a cohort, so
+the counts are held as a CSR matrix of students by node types, with the node
+type ids of the vocabulary shared by all workflow graphs (see
+`workflowgraph.NODE_TYPES`). Totals and statistics against the reference are
+computed on the nonzero counts only.
+"""
+from workflowgraph import NODE_TYPES
+
+
+class nodecountmatrix():
+    """
+    Node counts of the students of a workflowset.
+
+    The counts of student i are data[indptr[i]:indptr[i+1]] for the node
+    types indices[indptr[i]:indptr[i+1]], and ref holds the counts of the
+    reference workflow by node type id.
+    """
+    def __init__(self, student_ids, node_dists, ref_node_dist):
+        """
+        Args:
+            student_ids: list of the students, one per row.
+            node_dists: list of {node type name: count}, from `utils.collect_workflow_nodes`.
+            ref_node_dist: {node type name: count} of the reference workflow.
+        """
+        import numpy as np
+
+        self.student_ids = list(student_ids)
+        indptr, indices, data = [0], [], []
+        for d in node_dists:
+            for name, count in d.items():
+                if count:
+                    indices.append(NODE_TYPES.id(name))
+                    data.append(count)
+            indptr.append(len(indices))
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.indices = np.array(indices, dtype=np.int32)
+        self.data = np.array(data, dtype=np.int32)
+        self.rows = np.repeat(np.arange(len(self.student_ids), dtype=np.int32), np.diff(self.indptr))
+
+        ref = [(NODE_TYPES.id(name), count) for name, count in ref_node_dist.items()]
+        # every node type id above is in the vocabulary by now
+        self.ref = np.zeros(len(NODE_TYPES), dtype=np.int32)
+        for t, count in ref:
+            self.ref[t] = count
+        self.shape = (len(self.student_ids), len(self.ref))
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    def node_types(self):
+        """
+        Returns the sorted ids of the node types used by any student or by
+        the reference.
+        """
+        import numpy as np
+
+        return np.union1d(self.indices, self.ref.nonzero()[0])
+
+    def node_dists(self):
+        """
+        Returns the list of {node type name: count} of the students.
+        """
+        return [{NODE_TYPES.names[t]: int(c) for t, c in zip(self.indices[start:end], self.data[start:end])}
+                for start, end in zip(self.indptr[:-1], self.indptr[1:])]
+
+    def node_count(self):
+        """
+        Returns the total number of nodes of each student.
+        """
+        import numpy as np
+
+        return np.bincount(self.rows, weights=self.data, minlength=len(self)).astype(np.int64)
+
+    def node_summary(self):
+        """
+        Returns the number of nodes of each student relative to the reference.
+        """
+        return self.node_count() / self.ref.sum()
+
+    def to_frame(self):
+        """
+        Returns a dataframe of the counts indexed by student, with a column
+        per node type used by any student or by the reference, and the
+        node_count and node_summary columns.
+        """
+        import numpy as np
+        import pandas as pd
+
+        types = self.node_types()
+        names = [NODE_TYPES.names[t] for t in types]
+        order = np.argsort(names, kind='stable')
+        types = types[order]
+        columns = np.zeros(len(self.ref), dtype=np.int64)
+        columns[types] = np.arange(len(types))
+        dense = np.zeros((len(self), len(types)), dtype=np.int64)
+        dense[self.rows, columns[self.indices]] = self.data
+        df = pd.DataFrame(dense, index=self.student_ids, columns=[NODE_TYPES.names[t] for t in types])
+        df['node_count'] = self.node_count()
+        df['node_summary'] = self.node_summary()
+        return df
+
+    def statistics(self):
+        """
+        Returns a dataframe of the cohort statistics of each node type
+        against the reference, ranked by the number of students who differ
+        from the reference:
+            reference          count in the reference workflow
+            students           number of students using the node type
+            students_extra     number of students with more nodes than the reference
+            extra_nodes        total number of nodes more than the reference
+            students_missing   number of students with fewer nodes than the reference
+            missing_nodes      total number of nodes fewer than the reference
+        """
+        import numpy as np
+        import pandas as pd
+
+        n_types = len(self.ref)
+        ref = self.ref[self.indices]
+        students = np.bincount(self.indices, minlength=n_types)
+        extra = self.data > ref
+        students_extra = np.bincount(self.indices[extra], minlength=n_types)
+        extra_nodes = np.bincount(self.indices[extra], weights=(self.data - ref)[extra], minlength=n_types)
+        # students without a node type have none of its reference nodes
+        covered = np.bincount(self.indices, weights=np.minimum(self.data, ref), minlength=n_types)
+        students_complete = np.bincount(self.indices[self.data >= ref], minlength=n_types)
+        students_missing = np.where(self.ref > 0, len(self) - students_complete, 0)
+        missing_nodes = self.ref * len(self) - covered
+
+        types = self.node_types()
+        stats = pd.DataFrame({'node_type': [NODE_TYPES.names[t] for t in types],
+                              'reference': self.ref[types],
+                              'students': students[types],
+                              'students_extra': students_extra[types],
+                              'extra_nodes': extra_nodes[types].astype(np.int64),
+                              'students_missing': students_missing[types],
+                              'missing_nodes': missing_nodes[types].astype(np.int64)})
+        stats['students_differing'] = stats['students_extra'] + stats['students_missing']
+        stats = stats.sort_values(['students_differing', 'node_type'], ascending=[False, True], ignore_index=True)
+        return stats.drop(columns='students_differing')
@@ -0,0 +1,102 @@
+"""
+Prefetching of the metadata of submitted workflows ahead of their execution.
+
+Before a workflow is executed, its files are scanned: its nodes are
+counted, its Container Output (Table) and reader nodes are discovered, it
+is checked before its execution and its datasets are staged, see
+`staging`. On network-mounted workspaces this
+directory walking and xml parsing is slow, and stalls the execution slot
+waiting for it. A `prefetcher` scans the next submissions on a pool of I/O
+threads while the current ones execute, and hands the `submissionscan` of
+each submission to its execution, which does not read its metadata again.
+"""
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+# number of submissions scanned ahead of their execution
+PREFETCH_DEPTH = 8
+# number of threads scanning submissions
+IO_WORKERS = 8
+
+
+class submissionscan():
+    """
+    Metadata of a submitted workflow read before its execution:
+
+        node_dist      node distribution, see `utils.collect_workflow_nodes`
+        discovered     service and reader nodes, see `knime.discover_service_nodes`
+        annotations    annotations of the Container Output (Table) nodes
+        data_paths     data paths of the reader nodes
+        failure        reason why the workflow cannot be executed, see
+                       `preflight.check_workflow`, None when it can or when
+                       it was not checked
+        staged         cached files of the datasets of the readers by reader
+                       dirname, see `staging.datasetcache.stage_readers`,
+                       None when the datasets are not staged
+        pruned         directories of the nodes to prune, see
+                       `pruning.pruned_node_dirnames`, None when not pruned
+        outside        directories of the nodes referring to files outside
+                       the workflow, see `pruning.outside_node_dirnames`,
+                       None when neither pruned nor staged
+    """
+    __slots__ = ('node_dist', 'discovered', 'annotations', 'data_paths', 'failure', 'staged', 'pruned', 'outside')
+
+    def __init__(self, node_dist, discovered, annotations, data_paths, failure=None, staged=None,
+                 pruned=None, outside=None):
+        self.node_dist = node_dist
+        self.discovered = discovered
+        self.annotations = annotations
+        self.data_paths = data_paths
+        self.failure = failure
+        self.staged = staged
+        self.pruned = pruned
+        self.outside = outside
+
+
+class prefetcher():
+    """
+    Scans the workflows in wfps with scan(wfp) on io_workers threads, in
+    order and at most depth workflows ahead of the workflows whose scans
+    were taken with `take`.
+    """
+    def __init__(self, scan, wfps, depth=PREFETCH_DEPTH, io_workers=IO_WORKERS):
+        self.scan = scan
+        self.depth = depth
+        self._executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix='prefetch')
+        self._lock = threading.Lock()
+        self._pending = deque(wfps)
+        # {wfp: future of its scan}
+        self._futures = {}
+        with self._lock:
+            self._fill()
+
+    def _fill(self):
+        while self._pending and len(self._futures) < self.depth:
+            wfp = self._pending.popleft()
+            self._futures[wfp] = self._executor.submit(self.scan, wfp)
+
+    def take(self, wfp):
+        """
+        Returns the scan of the workflow, waiting for it when it is still
+        being scanned, and starts scanning the next workflow.
+        """
+        with self._lock:
+            future = self._futures.pop(wfp, None)
+            if future is None and self._pending and self._pending[0] == wfp:
+                self._pending.popleft()
+            elif future is None and wfp in self._pending:
+                self._pending.remove(wfp)
+            self._fill()
+        return future.result() if future is not None else self.scan(wfp)
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_inst, exc_tb):
+        self.close()
+        return False
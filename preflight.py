@@ -0,0 +1,114 @@
+"""
+Static pre-flight checks of submitted workflows.
+
+A workflow which is locked, corrupt, has no Container Output (Table) nodes
+or reads data files which do not exist cannot produce its outputs, but
+fails only after a full KNIME launch. These checks find such workflows
+from the files of the workflow alone, so that they are not executed.
+"""
+import os
+import xml.etree.ElementTree as ElementTree
+from urllib.parse import urlparse, unquote
+import knime
+
+
+# file KNIME locks while a workflow is opened
+LOCK_FILENAME = '.knimeLock'
+
+
+def is_locked(path_to_knime_workflow):
+    """
+    Returns True when the workflow is locked by a running KNIME instance.
+    A lock file left behind by a KNIME instance which exited is not a lock.
+    """
+    lock_filepath = os.path.join(path_to_knime_workflow, LOCK_FILENAME)
+    if not os.path.exists(lock_filepath):
+        return False
+    try:
+        fh = open(lock_filepath, 'a+b')
+    except PermissionError:
+        return True
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            try:
+                msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+            except OSError:
+                return True
+        else:
+            import fcntl
+            try:
+                fcntl.lockf(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                fcntl.lockf(fh.fileno(), fcntl.LOCK_UN)
+            except OSError:
+                return True
+    finally:
+        fh.close()
+    return False
+
+def local_data_path(path_to_knime_workflow, data_path):
+    """
+    Returns the local file of a reader data path, resolving paths relative
+    to the workflow, or None when the data path is not a local file, e.g. a
+    URL or a path relative to a mountpoint.
+    """
+    url = urlparse(data_path)
+    if url.scheme == 'knime' and url.netloc == 'knime.workflow':
+        return os.path.normpath(os.path.join(path_to_knime_workflow, unquote(url.path).lstrip('/')))
+    if url.scheme == 'file':
+        return unquote(url.path)
+    if os.path.isabs(data_path):
+        return data_path
+    return None
+
+def check_workflow(path_to_knime_workflow, resolve_data_path=local_data_path, discovered=None):
+    """
+    Checks whether the workflow in the provided path can be executed.
+    The local files of the data paths of readers are resolved with
+    resolve_data_path(path_to_knime_workflow, data_path), see
+    `staging.datasetcache.resolve`. The nodes of the workflow are
+    discovered with `knime.discover_service_nodes` unless discovered
+    is provided.
+    Returns the reason why it cannot, or None when it can. The reason starts
+    with 'locked:' when the workflow is locked, which may not last, see
+    `failures`, and with 'preflight:' otherwise.
+    """
+    from workflowgraph import load_workflow_graph
+
+    workflow_filepath = os.path.join(path_to_knime_workflow, 'workflow.knime')
+    if not os.path.isfile(workflow_filepath):
+        return 'preflight: corrupt: workflow.knime not found'
+    if is_locked(path_to_knime_workflow):
+        return 'locked: {}'.format(knime.KEYPHRASE_LOCKED.decode('utf8'))
+    try:
+        graph = load_workflow_graph(path_to_knime_workflow)
+    except (OSError, ElementTree.ParseError) as e:
+        return 'preflight: corrupt: {}'.format(e)
+
+    if discovered is None:
+        discovered = knime.discover_service_nodes(path_to_knime_workflow)
+    _, output_dirnames, reader_dirnames = discovered[:3]
+    if not output_dirnames:
+        return 'preflight: no Container Output (Table) nodes'
+    try:
+        for dirname in output_dirnames:
+            knime.find_service_COT_node_annotation(path_to_knime_workflow, dirname)
+    except ElementTree.ParseError as e:
+        return 'preflight: corrupt: {}/settings.xml ({})'.format(dirname, e)
+
+    # a reader failing on a missing file fails every output it feeds
+    index = {dirname: i for i, dirname in enumerate(graph.node_dirnames)}
+    outputs = [index[d] for d in output_dirnames if d in index]
+    upstream = graph.upstream(outputs) if outputs else None
+    for dirname in reader_dirnames:
+        try:
+            data_path = knime.find_service_file_reader_data_path(path_to_knime_workflow, dirname)
+        except ElementTree.ParseError as e:
+            return 'preflight: corrupt: {}/settings.xml ({})'.format(dirname, e)
+        filepath = resolve_data_path(path_to_knime_workflow, data_path) if data_path else None
+        if filepath is None or os.access(filepath, os.R_OK):
+            continue
+        if upstream is None or dirname not in index or upstream[index[dirname]]:
+            return 'preflight: data file not found: {} read by {}'.format(data_path, dirname)
+    return None
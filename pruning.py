@@ -0,0 +1,189 @@
+"""
+Pruning of submitted workflows to the nodes feeding their outputs.
+
+Submissions often hold nodes which none of their Container Output (Table)
+nodes depend on: exploratory plots, joins on side branches, writers. The
+batch executor runs every node of a workflow, so a pruned copy holding only
+the upstream closure of the Container Output (Table) nodes is executed in
+its place, in a temporary directory. Nodes inside metanodes and components
+are kept with the metanode or component at the top level of the workflow.
+The copy holds the settings of the kept nodes but not their data, e.g. the
+tables of a workflow saved executed, which KNIME recomputes anyway.
+"""
+import os
+import shutil
+import tempfile
+import logging
+import xml.etree.ElementTree as ElementTree
+from contextlib import contextmanager
+import knime
+
+
+KNIME_XMLNS = 'http://www.knime.org/2008/09/XMLConfig'
+XSI_XMLNS = 'http://www.w3.org/2001/XMLSchema-instance'
+# URLs of settings referring to files outside the workflow by a path relative to it or to
+# the mountpoint holding it, which a temporary copy is not in
+RELATIVE_OUTSIDE = ('knime.workflow/..', 'knime://knime.mountpoint')
+# file systems of the file selections of the nodes, since KNIME 4.3, which resolve their path
+# relative to the workflow or its data area, or to the mountpoint holding the workflow
+RELATIVE_FILE_SYSTEM = 'RELATIVE'
+RELATIVE_SPECIFIERS = ('knime.workflow', 'knime.workflow.data')
+MOUNTPOINT_SPECIFIER = 'knime.mountpoint'
+
+
+def pruned_node_dirnames(path_to_knime_workflow, output_dirnames=None):
+    """
+    Returns the directories of the nodes at the top level of the workflow
+    which none of its Container Output (Table) nodes depend on. The
+    directories of the output nodes are found in the workflow unless
+    output_dirnames is provided.
+    """
+    from workflowgraph import load_workflow_graph
+
+    if output_dirnames is None:
+        _, output_dirnames = knime.find_service_table_node_dirnames(path_to_knime_workflow)
+    graph = load_workflow_graph(path_to_knime_workflow)
+    index = {dirname: i for i, dirname in enumerate(graph.node_dirnames)}
+    outputs = [index[d] for d in output_dirnames if d in index]
+    if not outputs:
+        return []
+    upstream = graph.upstream(outputs)
+    return [dirname for dirname, depth, keep in zip(graph.node_dirnames, graph.depths, upstream)
+            if depth == 0 and not keep]
+
+def _relative_path_outside(settings):
+    """
+    Returns True when a file selection of the settings.xml content resolves
+    its path relative to the workflow and the path leaves the workflow,
+    e.g. a path ../data.csv relative to knime.workflow, or resolves it
+    relative to the mountpoint holding the workflow. Settings which cannot
+    be parsed are assumed to refer outside.
+    """
+    try:
+        root = ElementTree.fromstring(settings)
+    except ElementTree.ParseError:
+        return True
+    for config in root.iter('{{{}}}config'.format(KNIME_XMLNS)):
+        entries = {child.attrib.get('key'): child.attrib.get('value') for child in config
+                   if child.tag.endswith('entry')}
+        if entries.get('file_system_type') != RELATIVE_FILE_SYSTEM:
+            continue
+        if entries.get('file_system_specifier') == MOUNTPOINT_SPECIFIER:
+            return True
+        if entries.get('file_system_specifier') in RELATIVE_SPECIFIERS and \
+                '..' in (entries.get('path') or '').replace('\\', '/').split('/'):
+            return True
+    return False
+
+def outside_node_dirnames(path_to_knime_workflow, node_dirnames):
+    """
+    Returns the directories, among node_dirnames, of the nodes whose
+    settings refer to files outside the workflow by a path relative to the
+    workflow, which a copy of the workflow elsewhere would not find: either
+    by a knime:// URL through knime.workflow/.. or knime.mountpoint, or by
+    a relative file selection whose path climbs out of the workflow or is
+    relative to the mountpoint.
+    """
+    outside = []
+    for dirname in node_dirnames:
+        for root, _, files in os.walk(os.path.join(path_to_knime_workflow, dirname)):
+            if 'settings.xml' not in files:
+                continue
+            with open(os.path.join(root, 'settings.xml'), encoding='utf8', errors='replace') as fh:
+                settings = fh.read()
+            if any(url in settings for url in RELATIVE_OUTSIDE) or \
+                    (RELATIVE_FILE_SYSTEM in settings and _relative_path_outside(settings)):
+                outside.append(dirname)
+                break
+    return outside
+
+def refers_outside(path_to_knime_workflow, node_dirnames):
+    """
+    Returns True when the settings of any of the nodes refer to files
+    outside the workflow, see `outside_node_dirnames`.
+    """
+    return bool(outside_node_dirnames(path_to_knime_workflow, node_dirnames))
+
+def _copy_node(node_path, copy_path):
+    """
+    Copies the files of a node directory, with the nodes of a metanode or
+    component recursively, but not its subdirectories of data, e.g. of
+    port tables or internal state.
+    """
+    os.makedirs(copy_path)
+    with os.scandir(node_path) as it:
+        for e in it:
+            if e.is_file():
+                shutil.copy2(e.path, os.path.join(copy_path, e.name))
+            elif e.is_dir() and (os.path.exists(os.path.join(e.path, 'settings.xml')) or
+                                 os.path.exists(os.path.join(e.path, 'workflow.knime'))):
+                _copy_node(e.path, os.path.join(copy_path, e.name))
+
+def prune_workflow(path_to_knime_workflow, pruned_path, node_dirnames):
+    """
+    Copies the workflow to pruned_path without the nodes in node_dirnames,
+    removing the nodes and their connections from the workflow.knime of the
+    copy. The kept nodes are copied without their data, see `_copy_node`;
+    the other files and directories of the workflow, e.g. its data area,
+    are copied as they are.
+    """
+    ElementTree.register_namespace('', KNIME_XMLNS)
+    ElementTree.register_namespace('xsi', XSI_XMLNS)
+
+    pruned = set(node_dirnames)
+    tree = ElementTree.parse(os.path.join(path_to_knime_workflow, 'workflow.knime'))
+    sections = {child.attrib.get('key'): child for child in tree.getroot()}
+    kept, pruned_ids = set(), set()
+    for node_config in list(sections['nodes']) if 'nodes' in sections else []:
+        entries = {child.attrib.get('key'): child.attrib.get('value') for child in node_config}
+        dirname = os.path.dirname(entries.get('node_settings_file') or '')
+        if dirname in pruned:
+            pruned_ids.add(entries.get('id'))
+            sections['nodes'].remove(node_config)
+        elif dirname:
+            kept.add(dirname)
+
+    os.makedirs(pruned_path)
+    with os.scandir(path_to_knime_workflow) as it:
+        for e in it:
+            # the lock of the workflow is not copied, the copy is locked by its own execution
+            if e.name == '.knimeLock' or e.name in pruned:
+                continue
+            copy_path = os.path.join(pruned_path, e.name)
+            if e.name in kept and e.is_dir():
+                _copy_node(e.path, copy_path)
+            elif e.is_dir():
+                shutil.copytree(e.path, copy_path)
+            else:
+                shutil.copy2(e.path, copy_path)
+    for connection_config in list(sections['connections']) if 'connections' in sections else []:
+        entries = {child.attrib.get('key'): child.attrib.get('value') for child in connection_config}
+        if entries.get('sourceID') in pruned_ids or entries.get('destID') in pruned_ids:
+            sections['connections'].remove(connection_config)
+    tree.write(os.path.join(pruned_path, 'workflow.knime'), encoding='UTF-8', xml_declaration=True)
+
+@contextmanager
+def pruned_workflow(path_to_knime_workflow, scan=None):
+    """
+    Yields the path to a pruned copy of the workflow, which is removed on
+    exit, or the path to the workflow itself when none of its nodes can be
+    pruned or it refers to files outside it by paths relative to it. The
+    nodes to prune and the nodes referring outside the workflow are taken
+    from the scan of the workflow when provided, see
+    `utils.workflowgrader.scan_submission`.
+    """
+    if scan is not None and scan.pruned is not None:
+        node_dirnames = scan.pruned
+        outside = set(scan.outside) - set(node_dirnames)
+    else:
+        node_dirnames = pruned_node_dirnames(path_to_knime_workflow)
+        outside = node_dirnames and refers_outside(path_to_knime_workflow,
+                                                   set(os.listdir(path_to_knime_workflow)) - set(node_dirnames))
+    if not node_dirnames or outside:
+        yield path_to_knime_workflow
+        return
+    with tempfile.TemporaryDirectory(prefix='pruned_') as temp_dir:
+        pruned_path = os.path.join(temp_dir, os.path.basename(os.path.normpath(path_to_knime_workflow)))
+        prune_workflow(path_to_knime_workflow, pruned_path, node_dirnames)
+        logging.debug('Pruned {} nodes of {}'.format(len(node_dirnames), path_to_knime_workflow))
+        yield pruned_path
@@ -0,0 +1,158 @@
+"""
+Matching of mislabeled COT node annotations to the questions of the reference.
+
+Students often annotate their outputs with a label which differs from the
+reference, e.g. 'Q1 ' or 'question 1' for 'Q1'. The missing questions of a
+submission are matched to its foreign annotations all at once: a similarity
+matrix combining the similarity of the labels and of the table schemas is
+built, and the assignment maximizing the total similarity is solved, with
+scipy when it is installed.
+"""
+import re
+from difflib import SequenceMatcher
+
+
+# pairs less similar than this are not matched
+MATCH_THRESHOLD = 0.5
+# weight of the similarity of the labels, the rest is given to the similarity of the schemas
+LABEL_WEIGHT = 0.5
+
+
+def normalize_annotation(annotation):
+    """
+    Returns the normalized form of an annotation, e.g. 'q1' for 'Q1 ',
+    'question 1' and 'Q.1'.
+    """
+    text = str(annotation).lower()
+    text = re.sub(r'(?<![a-z])(questions?|ques|qns?)(?![a-z])', 'q', text)
+    return re.sub(r'[\W_]+', '', text)
+
+def label_similarity(a, b):
+    """
+    Returns the similarity, between 0 and 1, of two normalized annotations.
+    """
+    if a == b:
+        return 1.0
+    return SequenceMatcher(None, a, b).ratio()
+
+def schema_similarity(ref_df, sub_df):
+    """
+    Returns the similarity, between 0 and 1, of the schemas of two outputs
+    as the Jaccard similarity of their variables, with and without their
+    datatypes.
+    """
+    import pandas as pd
+
+    if not isinstance(ref_df, pd.DataFrame) or not isinstance(sub_df, pd.DataFrame):
+        return 0.0
+    ref_vars, sub_vars = set(ref_df.columns), set(sub_df.columns)
+    if not ref_vars | sub_vars:
+        return 0.0
+    ref_typed = set(zip(ref_df.columns, map(str, ref_df.dtypes)))
+    sub_typed = set(zip(sub_df.columns, map(str, sub_df.dtypes)))
+    return (len(ref_vars & sub_vars) / len(ref_vars | sub_vars) +
+            len(ref_typed & sub_typed) / len(ref_typed | sub_typed)) / 2
+
+
+def _linear_sum_assignment(cost):
+    """
+    Solves the assignment problem of minimum cost with the Hungarian method,
+    for a cost matrix with no more rows than columns.
+    Returns the column assigned to each row.
+    """
+    n, m = cost.shape
+    inf = float('inf')
+    u, v = [0.0] * (n + 1), [0.0] * (m + 1)
+    # p[j] is the row (1-based) assigned to column j, way[j] the previous column on the augmenting path
+    p, way = [0] * (m + 1), [0] * (m + 1)
+    for i in range(1, n + 1):
+        p[0], j0 = i, 0
+        minv, used = [inf] * (m + 1), [False] * (m + 1)
+        while p[j0] != 0:
+            used[j0] = True
+            i0, delta, j1 = p[j0], inf, 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    cur = cost[i0 - 1][j - 1] - u[i0] - v[j]
+                    if cur < minv[j]:
+                        minv[j], way[j] = cur, j0
+                    if minv[j] < delta:
+                        delta, j1 = minv[j], j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    assigned = [0] * n
+    for j in range(1, m + 1):
+        if p[j]:
+            assigned[p[j] - 1] = j - 1
+    return assigned
+
+def linear_sum_assignment(cost):
+    """
+    Returns the (rows, columns) of the assignment of minimum cost of a cost
+    matrix, as `scipy.optimize.linear_sum_assignment`.
+    """
+    import numpy as np
+
+    try:
+        from scipy.optimize import linear_sum_assignment as scipy_linear_sum_assignment
+        return scipy_linear_sum_assignment(cost)
+    except ImportError:
+        pass
+    cost = np.asarray(cost, dtype=float)
+    if cost.shape[0] <= cost.shape[1]:
+        return np.arange(cost.shape[0]), np.array(_linear_sum_assignment(cost), dtype=int)
+    cols = _linear_sum_assignment(cost.T)
+    order = np.argsort(cols)
+    return np.array(cols, dtype=int)[order], np.arange(cost.shape[1])[order]
+
+
+class questionmatcher():
+    """
+    Matches the foreign annotations of submissions to the missing questions
+    of the reference output ref_output {question: dataframe}. The normalized
+    questions of the reference are computed once.
+    """
+    def __init__(self, ref_output, threshold=MATCH_THRESHOLD, label_weight=LABEL_WEIGHT):
+        self.ref_output = ref_output
+        self.threshold = threshold
+        self.label_weight = label_weight
+        self.normalized = {q: normalize_annotation(q) for q in ref_output.keys()}
+
+    def similarity(self, missing, foreign, sub_output):
+        """
+        Returns the similarity matrix of the missing questions by the
+        foreign annotations of the output sub_output of a submission.
+        """
+        import numpy as np
+
+        normalized = [normalize_annotation(f) for f in foreign]
+        matrix = np.zeros((len(missing), len(foreign)))
+        for i, q in enumerate(missing):
+            for j, f in enumerate(foreign):
+                matrix[i, j] = self.label_weight * label_similarity(self.normalized[q], normalized[j]) + \
+                    (1 - self.label_weight) * schema_similarity(self.ref_output[q], sub_output.get(f))
+        return matrix
+
+    def match(self, missing, foreign, sub_output):
+        """
+        Returns {foreign annotation: missing question} of the assignment of
+        maximum total similarity, leaving out the pairs less similar than
+        the threshold. A single missing question and a single foreign
+        annotation are always matched.
+        """
+        if not missing or not foreign:
+            return {}
+        if len(missing) == 1 and len(foreign) == 1:
+            return {foreign[0]: missing[0]}
+        matrix = self.similarity(missing, foreign, sub_output)
+        rows, cols = linear_sum_assignment(-matrix)
+        return {foreign[j]: missing[i] for i, j in zip(rows, cols) if matrix[i, j] >= self.threshold}
@@ -0,0 +1,145 @@
+"""
+Grading of submissions against several reference solutions.
+
+Submissions are graded against the first reference as with a single one.
+Only when an output does not match it perfectly are the alternative
+references consulted, through a `referenceindex`: for each question, the
+schema of every alternative output and fingerprints of its variables are
+computed once. A submitted output is fingerprinted once per variable and
+then compared with each alternative by its fingerprints only, so that
+grading against N references costs little more than grading against one.
+Alternatives are tried in order and the search stops at the first one which
+the output matches perfectly.
+
+The fingerprints of the variables of unordered questions are the multisets
+of their hashed values, see `hash_value_counts`, compared in linear time.
+"""
+import hashlib
+from compaction import original_dtype, original_column, original_frame
+
+
+def hash_value_counts(data):
+    """
+    Hashes the rows of a dataframe (or the values of a series) and counts
+    the occurrences of each hash in linear time.
+    Returns a series of the form {row hash: count}, i.e. the multiset of rows.
+    """
+    import pandas as pd
+
+    return pd.Series(pd.util.hash_pandas_object(data, index=False).values).value_counts()
+
+def equal_multisets(c1, c2):
+    """
+    Compares two multisets from `hash_value_counts` in linear time with a
+    hash join of their counts instead of sorting.
+    """
+    return len(c1) == len(c2) and (c2.reindex(c1.index) == c1).all()
+
+def fingerprint(data):
+    """
+    Returns a fingerprint of a series (or the rows of a dataframe), equal
+    for two series when they have equal values in the same order.
+    """
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(data, pd.Series) and pd.api.types.is_float_dtype(data.dtype):
+        # -0.0 and 0.0, and NaNs with different payloads, are equal values
+        values = data.to_numpy(dtype=data.dtype) + 0.0
+        values[np.isnan(values)] = np.nan
+        data = pd.Series(values, dtype=data.dtype)
+    hashes = pd.util.hash_pandas_object(data, index=False).to_numpy()
+    return len(hashes), hashlib.blake2b(hashes.tobytes(), digest_size=16).digest()
+
+def same_values(f1, f2, unordered):
+    """
+    Compares two fingerprints, or two multisets when unordered.
+    """
+    return equal_multisets(f1, f2) if unordered else f1 == f2
+
+
+class referenceentry():
+    """
+    Schema and fingerprints of the output of a reference for a question.
+    """
+    def __init__(self, r, output, unordered):
+        self.r = r
+        self.columns = list(output.columns)
+        self.dtypes = dict(zip(output.columns, output.dtypes))
+        digest = hash_value_counts if unordered else fingerprint
+        self.fingerprints = {v: digest(output[v]) for v in self.columns}
+        self.rows_fingerprint = hash_value_counts(output) if unordered else None
+
+
+def score(missing_vars, incorrect_var_dtype, incorrect_var_data, n_vars):
+    """
+    Returns the proportion of incorrect variables of a graded output, the
+    smaller the better.
+    """
+    return (len(missing_vars) + len(incorrect_var_dtype) + len(incorrect_var_data)) / max(n_vars, 1)
+
+
+class referenceindex():
+    """
+    Index of the alternative reference outputs by question.
+
+    ref_outputs is the list of the outputs {question: dataframe} of the
+    references, the first of which defines the questions to be graded and
+    is not indexed, as submissions are graded against it directly.
+    """
+    def __init__(self, ref_outputs, unordered_questions=()):
+        self.ref_outputs = ref_outputs
+        self.unordered_questions = set(unordered_questions)
+        self.entries = {}
+        for q in ref_outputs[0].keys():
+            unordered = q in self.unordered_questions
+            self.entries[q] = [referenceentry(r, output[q], unordered)
+                               for r, output in enumerate(ref_outputs) if r > 0 and q in output]
+
+    def __len__(self):
+        return len(self.ref_outputs)
+
+    def match(self, q, sub_output, best_score=None):
+        """
+        Grades the output sub_output of question q against the alternative
+        reference it matches best, i.e. with the smallest proportion of
+        missing variables, variables with incorrect datatype and variables
+        with incorrect data, when it matches it better than best_score.
+        Returns a tuple (r, missing_vars, incorrect_var_dtype, incorrect_var_data)
+        where r is the position of the matched reference, or None.
+        """
+        unordered = q in self.unordered_questions
+        digest = hash_value_counts if unordered else fingerprint
+        sub_fingerprints = {}
+        best = None
+        for entry in self.entries[q]:
+            missing_vars, incorrect_var_dtype, incorrect_var_data = [], [], []
+            for v in entry.columns:
+                try:
+                    dtype = original_dtype(sub_output, v)
+                except KeyError:
+                    missing_vars.append(v)
+                    continue
+                if dtype != entry.dtypes[v]:
+                    incorrect_var_dtype.append((v, dtype))
+
+            # when the rows match as a whole, the variables need not be compared one by one
+            rows_match = unordered and not missing_vars and \
+                equal_multisets(entry.rows_fingerprint, hash_value_counts(original_frame(sub_output, entry.columns)))
+            if not rows_match:
+                for v in entry.columns:
+                    if v in missing_vars:
+                        continue
+                    if v not in sub_fingerprints:
+                        sub_fingerprints[v] = digest(original_column(sub_output, v))
+                    # ordered data are equal only with equal datatypes, as with pandas .equals
+                    if not same_values(entry.fingerprints[v], sub_fingerprints[v], unordered) or \
+                            (not unordered and (v, original_dtype(sub_output, v)) in incorrect_var_dtype):
+                        incorrect_var_data.append(v)
+
+            entry_score = score(missing_vars, incorrect_var_dtype, incorrect_var_data, len(entry.columns))
+            if best_score is None or entry_score < best_score:
+                best, best_score = (entry.r, missing_vars, incorrect_var_dtype, incorrect_var_data), entry_score
+            if entry_score == 0:
+                break
+        return best
@@ -0,0 +1,243 @@
+"""
+SQLite store of the results of grading runs across workflowsets and terms.
+
+The results of every workflowset are normalized into indexed tables, one
+row per student and question and check, so that questions such as which
+students failed the data check of Q3 in any section of a term are answered
+with a query instead of parsing the csv of every workflowset:
+
+    runs           run_id, started, workspace, reference, term
+    workflowsets   run_id, workflowset, columns of its csv
+    students       run_id, workflowset, student_id, position, question_summary,
+                   node_summary, node_count, failure_reason, cells of the other
+                   columns of the student
+    results        run_id, workflowset, student_id, question, check_kind, passed,
+                   summary, details, cell
+    node_counts    run_id, workflowset, student_id, node_type, count
+
+where check_kind is one of 'question', 'var', 'dtype', 'data', 'reference'
+and 'settings', passed is NULL for ungraded checks and details is a JSON
+list. The view latest_results holds the results of the latest run of each
+workflowset in each term. The csv of a workflowset is exported from the
+store with `resultstore.export_csv`.
+"""
+import os
+import json
+import math
+import sqlite3
+import threading
+from datetime import datetime
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY, started TEXT, workspace TEXT, reference TEXT, term TEXT);
+CREATE TABLE IF NOT EXISTS workflowsets (
+    run_id INTEGER, workflowset TEXT, columns TEXT, PRIMARY KEY (run_id, workflowset));
+CREATE TABLE IF NOT EXISTS students (
+    run_id INTEGER, workflowset TEXT, student_id TEXT, position INTEGER,
+    question_summary REAL, node_summary REAL, node_count INTEGER, failure_reason TEXT, cells TEXT,
+    PRIMARY KEY (run_id, workflowset, student_id));
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER, workflowset TEXT, student_id TEXT, question TEXT, check_kind TEXT,
+    passed INTEGER, summary REAL, details TEXT, cell TEXT);
+CREATE TABLE IF NOT EXISTS node_counts (
+    run_id INTEGER, workflowset TEXT, student_id TEXT, node_type TEXT, count INTEGER);
+CREATE INDEX IF NOT EXISTS results_by_question ON results (question, check_kind, passed);
+CREATE INDEX IF NOT EXISTS results_by_student ON results (student_id);
+CREATE INDEX IF NOT EXISTS results_by_workflowset ON results (run_id, workflowset);
+CREATE INDEX IF NOT EXISTS node_counts_by_workflowset ON node_counts (run_id, workflowset);
+CREATE VIEW IF NOT EXISTS latest_results AS
+    SELECT runs.term, results.* FROM results JOIN runs USING (run_id)
+    WHERE run_id = (SELECT MAX(w.run_id) FROM workflowsets w JOIN runs r USING (run_id)
+                    WHERE w.workflowset = results.workflowset AND r.term IS runs.term);
+'''
+
+# columns of a student which are stored in the columns of the students table
+STUDENT_COLUMNS = ('question_summary', 'node_summary', 'node_count', 'failure_reason')
+# suffixes of the columns of a question, with the check and the field they hold
+QUESTION_COLUMNS = {
+    '_var_summary': ('var', 'summary'),
+    '_missing_var': ('var', 'details'),
+    '_dtype_summary': ('dtype', 'summary'),
+    '_incorrect_var_dtype': ('dtype', 'details'),
+    '_data_summary': ('data', 'summary'),
+    '_incorrect_var_values': ('data', 'details'),
+    '_reference': ('reference', 'details'),
+    '_incorrect_settings': ('settings', 'details'),
+}
+UNGRADED = 'UNGRADED'
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+def _cell(value):
+    """
+    Returns a value as written to a csv by pandas.
+    """
+    return '' if _is_missing(value) else str(value)
+
+def _plain(value):
+    """
+    Returns a value as JSON serializable builtins, e.g. lists for tuples and
+    names for numpy dtypes.
+    """
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if hasattr(value, 'item') and not hasattr(value, '__len__'):
+        return value.item()
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+def _number(value):
+    if _is_missing(value) or isinstance(value, str):
+        return None
+    return _plain(value)
+
+
+class resultstore():
+    """
+    Results of grading runs in the SQLite database in filepath. A run is
+    begun with `begin_run`, and the summary of each of its workflowsets, see
+    `workflowgrader.summarize_workflowset`, is recorded in a single
+    transaction with `record_workflowset`.
+    """
+    def __init__(self, filepath, term=None):
+        self.filepath = filepath
+        self.term = term
+        self.run_id = None
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(filepath, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    def begin_run(self, workspace, reference):
+        """
+        Records a new run grading the workspace against the reference
+        workflows, to which the workflowsets recorded next belong.
+        """
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                'INSERT INTO runs (started, workspace, reference, term) VALUES (?, ?, ?, ?)',
+                (datetime.now().isoformat(timespec='seconds'), os.path.abspath(workspace),
+                 json.dumps(list(reference)), self.term))
+            self.run_id = cursor.lastrowid
+        return self.run_id
+
+    def record_workflowset(self, workflowset, summary_df, questions, node_types):
+        """
+        Records the summary dataframe of the workflowset, with a row per
+        student, replacing what the run recorded of the workflowset before.
+        questions are the questions of the reference and node_types the
+        columns of the node counts.
+        """
+        questions = [str(q) for q in questions]
+        node_types = set(node_types)
+        question_columns = {str(q) + suffix: (str(q), check, field)
+                            for q in questions for suffix, (check, field) in QUESTION_COLUMNS.items()}
+        columns = [str(c) for c in summary_df.columns]
+
+        students, results, node_counts = [], [], []
+        for position, row in enumerate(summary_df.itertuples(index=False, name=None)):
+            values = dict(zip(columns, row))
+            student_id = str(values['index'])
+            checks, cells = {}, {}
+            for column, value in values.items():
+                if column in question_columns:
+                    q, check, field = question_columns[column]
+                    checks.setdefault((q, check), {})[field] = value
+                elif column in node_types:
+                    if value:
+                        node_counts.append((self.run_id, workflowset, student_id, column, int(value)))
+                elif column not in STUDENT_COLUMNS:
+                    cells[column] = _cell(value)
+            students.append((self.run_id, workflowset, student_id, position,
+                             _number(values.get('question_summary')), _number(values.get('node_summary')),
+                             _number(values.get('node_count')), _cell(values.get('failure_reason')),
+                             json.dumps(cells)))
+
+            missing = values.get('missing_questions') or []
+            for q in questions:
+                results.append((self.run_id, workflowset, student_id, q, 'question',
+                                int(q not in map(str, missing)), None, None, None))
+            for (q, check), fields in checks.items():
+                details = fields.get('details')
+                summary = fields.get('summary')
+                ungraded = summary == UNGRADED or details == UNGRADED or \
+                    (isinstance(details, list) and UNGRADED in details)
+                if ungraded:
+                    passed = None
+                elif check == 'reference':
+                    passed = None if _is_missing(details) else 1
+                else:
+                    passed = int(not details) if isinstance(details, (list, tuple)) else None
+                results.append((self.run_id, workflowset, student_id, q, check, passed,
+                                _number(summary), json.dumps(_plain(details)),
+                                _cell(details) if 'details' in fields else None))
+
+        with self._lock, self.conn:
+            for table in ('workflowsets', 'students', 'results', 'node_counts'):
+                self.conn.execute('DELETE FROM {} WHERE run_id = ? AND workflowset = ?'.format(table),
+                                  (self.run_id, workflowset))
+            self.conn.execute('INSERT INTO workflowsets VALUES (?, ?, ?)',
+                              (self.run_id, workflowset, json.dumps(columns)))
+            self.conn.executemany('INSERT INTO students VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', students)
+            self.conn.executemany('INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', results)
+            self.conn.executemany('INSERT INTO node_counts VALUES (?, ?, ?, ?, ?)', node_counts)
+
+    def export_frame(self, workflowset, run_id=None):
+        """
+        Returns the summary of the workflowset recorded by the run, by
+        default the current run, as a dataframe of the cells of its csv.
+        """
+        import pandas as pd
+
+        run_id = self.run_id if run_id is None else run_id
+        with self._lock:
+            found = self.conn.execute('SELECT columns FROM workflowsets WHERE run_id = ? AND workflowset = ?',
+                                      (run_id, workflowset)).fetchone()
+            if found is None:
+                raise KeyError('Workflowset {} was not recorded by run {}'.format(workflowset, run_id))
+            students = self.conn.execute(
+                'SELECT student_id, question_summary, node_summary, node_count, failure_reason, cells '
+                'FROM students WHERE run_id = ? AND workflowset = ? ORDER BY position', (run_id, workflowset)).fetchall()
+            results = self.conn.execute(
+                'SELECT student_id, question, check_kind, summary, cell FROM results '
+                'WHERE run_id = ? AND workflowset = ? AND check_kind != ?', (run_id, workflowset, 'question')).fetchall()
+            node_counts = self.conn.execute(
+                'SELECT student_id, node_type, count FROM node_counts WHERE run_id = ? AND workflowset = ?',
+                (run_id, workflowset)).fetchall()
+
+        # {(student, column): cell}
+        cells = {}
+        for student_id, question_summary, node_summary, node_count, failure_reason, other in students:
+            cells.update({(student_id, c): v for c, v in json.loads(other).items()})
+            cells.update({(student_id, 'question_summary'): _cell(question_summary),
+                          (student_id, 'node_summary'): _cell(node_summary),
+                          (student_id, 'node_count'): _cell(node_count),
+                          (student_id, 'failure_reason'): failure_reason})
+        for student_id, question, check, summary, cell in results:
+            for suffix, (c, field) in QUESTION_COLUMNS.items():
+                if c == check:
+                    value = cell if field == 'details' else (UNGRADED if summary is None else _cell(summary))
+                    cells[(student_id, question + suffix)] = value
+        for student_id, node_type, count in node_counts:
+            cells[(student_id, node_type)] = str(count)
+
+        columns = json.loads(found[0])
+        student_ids = [s[0] for s in students]
+        return pd.DataFrame({c: [cells.get((s, c), '0') for s in student_ids] for c in columns}, dtype=object)
+
+    def export_csv(self, workflowset, filepath, run_id=None):
+        """
+        Writes the csv of the workflowset recorded by the run, as
+        `workflowgrader.generate_csv_by_workflowset` does.
+        """
+        self.export_frame(workflowset, run_id).to_csv(filepath)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
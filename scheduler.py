@@ -0,0 +1,188 @@
+import os
+import re
+import threading
+import logging
+from contextlib import contextmanager
+
+
+# fraction of the heap added on top of -Xmx for metaspace, code cache, thread stacks, etc.
+JVM_OVERHEAD = 0.25
+# memory that must stay free for the grader and the operating system
+DEFAULT_RESERVE = 1024**3
+
+
+def parse_memory_size(size):
+    """
+    Converts a JVM style memory size (e.g. '512m', '4g', '2GB', '2 GiB', '2048k'
+    or a plain number of bytes) to a number of bytes.
+    Returns None when size is None.
+    """
+    if size is None:
+        return None
+    if isinstance(size, (int, float)):
+        return int(size)
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kmgt]?)(?:ib|b)?\s*', str(size).lower())
+    if not match:
+        raise ValueError('Unrecognised memory size: {}'.format(size))
+    value, unit = match.groups()
+    return int(float(value) * 1024**' kmgt'.index(unit or ' '))
+
+def available_system_memory():
+    """
+    Returns the number of bytes of memory available to new processes, or
+    None when it cannot be determined on this platform.
+    """
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+
+    if os.name == 'nt':
+        import ctypes
+
+        class MEMORYSTATUSEX(ctypes.Structure):
+            _fields_ = [('dwLength', ctypes.c_ulong), ('dwMemoryLoad', ctypes.c_ulong),
+                        ('ullTotalPhys', ctypes.c_ulonglong), ('ullAvailPhys', ctypes.c_ulonglong),
+                        ('ullTotalPageFile', ctypes.c_ulonglong), ('ullAvailPageFile', ctypes.c_ulonglong),
+                        ('ullTotalVirtual', ctypes.c_ulonglong), ('ullAvailVirtual', ctypes.c_ulonglong),
+                        ('ullAvailExtendedVirtual', ctypes.c_ulonglong)]
+
+        status = MEMORYSTATUSEX()
+        status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullAvailPhys
+        return None
+
+    try:
+        with open('/proc/meminfo') as fh:
+            for line in fh:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class memorygovernor():
+    """
+    Admission control for concurrent KNIME batch executions.
+
+    Every execution is projected to use its heap (-Xmx) plus JVM_OVERHEAD.
+    A new execution is admitted only when the projected memory of all
+    executions in flight fits the memory budget and the system still has
+    the reserve available after starting it. The number of concurrent
+    executions starts at one and adapts: it grows by one after a successful
+    execution when there is headroom for another JVM, stops growing when
+    system memory runs low and halves when an execution fails under memory
+    pressure.
+    """
+    def __init__(self, heap_size=None, memory_budget=None, max_workers=1,
+                 reserve=DEFAULT_RESERVE, poll_interval=1.0):
+        # heap given to each JVM, None keeps the knime.ini setting
+        self.heap_size = heap_size
+        heap = parse_memory_size(heap_size)
+        # without a heap setting, assume the KNIME default of 2g for projections
+        self.projected = int((heap or 2 * 1024**3) * (1 + JVM_OVERHEAD))
+
+        self.memory_budget = parse_memory_size(memory_budget)
+        if self.memory_budget is not None and self.memory_budget < self.projected:
+            raise ValueError('Memory budget of {} does not fit a single execution with heap size {}'.format(
+                memory_budget, heap_size))
+
+        self.max_workers = max(1, max_workers)
+        self.reserve = reserve
+        self.poll_interval = poll_interval
+
+        # current adaptive limit on concurrent executions
+        self.limit = 1
+        self.in_flight = 0
+        self.committed = 0
+        self._cond = threading.Condition()
+
+    @property
+    def vmargs(self):
+        """
+        The JVM arguments to pass to each execution.
+        """
+        heap = parse_memory_size(self.heap_size)
+        # the JVM only accepts k, m or g suffixes, so the heap is passed in whole megabytes
+        return ['-Xmx{}m'.format(max(1, -(-heap // 1024**2)))] if heap else []
+
+    def _headroom(self):
+        """
+        Returns the memory left after admitting one more execution, or None
+        when available system memory is unknown.
+        """
+        available = available_system_memory()
+        if available is None:
+            return None
+        return available - self.projected - self.reserve
+
+    def _admissible(self):
+        if self.in_flight == 0:
+            # a lone execution is always admitted, waiting cannot free any memory
+            return True
+        if self.in_flight >= self.limit:
+            return False
+        if self.memory_budget is not None and self.committed + self.projected > self.memory_budget:
+            return False
+        headroom = self._headroom()
+        if headroom is not None and headroom < 0:
+            # hold concurrency at what is running now instead of growing further
+            self._back_off('available system memory is low', self.in_flight)
+            return False
+        return True
+
+    def _back_off(self, reason, limit=None):
+        limit = max(1, min(self.limit, self.limit // 2 if limit is None else limit))
+        if limit < self.limit:
+            logging.warning('Reducing concurrent KNIME executions from {} to {}: {}'.format(self.limit, limit, reason))
+        self.limit = limit
+
+    def acquire(self):
+        """
+        Blocks until an execution can be admitted.
+        """
+        with self._cond:
+            while not self._admissible():
+                # poll as system memory changes without any notification
+                self._cond.wait(self.poll_interval)
+            self.in_flight += 1
+            self.committed += self.projected
+
+    def release(self, failed=False):
+        """
+        Releases an admitted execution and adapts the concurrency limit.
+        A failed execution is taken as a sign of memory pressure when it
+        leaves no headroom for another JVM.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            self.committed -= self.projected
+            if failed:
+                headroom = self._headroom()
+                if headroom is not None and headroom < self.projected:
+                    self._back_off('execution failed while memory is low')
+            elif self.limit < self.max_workers and self.in_flight + 1 >= self.limit:
+                headroom = self._headroom()
+                fits_budget = self.memory_budget is None or \
+                    (self.limit + 1) * self.projected <= self.memory_budget
+                if fits_budget and (headroom is None or headroom >= self.projected):
+                    self.limit += 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self):
+        """
+        Context manager which holds an admitted execution for its duration.
+        """
+        self.acquire()
+        failed = False
+        try:
+            yield self
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.release(failed)
@@ -0,0 +1,169 @@
+"""
+Local grading service for instant pre-checks of single submissions.
+
+The service keeps a `utils.workflowgrader` with the reference outputs loaded
+and grades the submissions it receives over HTTP on the local machine,
+without network access:
+
+    POST /grade    {"path": "<workflow directory or .knwf>", "student": "<id>"}
+                   or the bytes of a .knwf, with the student id as ?student=<id>
+    GET  /health   reference workflows, executions in flight and submissions queued
+
+Submissions are queued for a pool of max_workers executions, and rejected
+with 503 when max_queue submissions are already waiting. The response of
+/grade is the row of the student as in the csv of a workflowset.
+"""
+import os
+import json
+import math
+import shutil
+import tempfile
+import threading
+import zipfile
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+# maximum number of submissions waiting for an execution
+MAX_QUEUE = 16
+
+
+def extract_knwf(knwf, extract_dir):
+    """
+    Extracts a .knwf archive, given as a path or a file object, to
+    extract_dir. Returns the path to the workflow in the archive.
+    """
+    with zipfile.ZipFile(knwf) as archive:
+        archive.extractall(extract_dir)
+    for root, dirs, files in os.walk(extract_dir):
+        if 'workflow.knime' in files:
+            return root
+        dirs.sort()
+    raise ValueError('No workflow.knime found in the archive')
+
+def _jsonable(value):
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+class gradingservice():
+    """
+    HTTP service grading single submissions against the reference of the
+    workflowgrader wfg, with up to wfg.governor.max_workers executions at
+    a time.
+    """
+    def __init__(self, wfg, host='127.0.0.1', port=8080, max_queue=MAX_QUEUE):
+        self.wfg = wfg
+        self.executor = ThreadPoolExecutor(max_workers=wfg.governor.max_workers)
+        # admits the submissions being executed or waiting for an execution
+        self.slots = threading.BoundedSemaphore(wfg.governor.max_workers + max_queue)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.queued = 0
+        self.server = ThreadingHTTPServer((host, port), _gradinghandler)
+        self.server.service = self
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def status(self):
+        with self._lock:
+            return {'status': 'ok', 'reference': self.wfg.ref_workflows,
+                    'in_flight': self.in_flight, 'queued': self.queued}
+
+    def _grade(self, wfp, student_id):
+        with self._lock:
+            self.queued -= 1
+            self.in_flight += 1
+        try:
+            return self.wfg.grade_submission(wfp, student_id)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def grade(self, wfp, student_id=None):
+        """
+        Grades the workflow in wfp, a workflow directory or a .knwf, once an
+        execution is free. Returns the row of the student as a dictionary,
+        or None when the queue is full.
+        """
+        if not self.slots.acquire(blocking=False):
+            return None
+        extract_dir = None
+        try:
+            if os.path.isfile(wfp):
+                student_id = student_id or os.path.splitext(os.path.basename(wfp))[0]
+                extract_dir = tempfile.mkdtemp(prefix='knwf_')
+                wfp = extract_knwf(wfp, extract_dir)
+            with self._lock:
+                self.queued += 1
+            row = self.executor.submit(self._grade, wfp, student_id).result()
+            return {k: _jsonable(v) for k, v in row.iloc[0].to_dict().items()}
+        finally:
+            self.slots.release()
+            if extract_dir:
+                shutil.rmtree(extract_dir, ignore_errors=True)
+
+    def serve_forever(self):
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            self.executor.shutdown(wait=True)
+
+    def shutdown(self):
+        self.server.shutdown()
+
+
+class _gradinghandler(BaseHTTPRequestHandler):
+
+    def _respond(self, code, body):
+        payload = json.dumps(body, default=str).encode('utf8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if urlparse(self.path).path != '/health':
+            return self._respond(404, {'error': 'Not found'})
+        self._respond(200, self.server.service.status())
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/grade':
+            return self._respond(404, {'error': 'Not found'})
+        service = self.server.service
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        upload = None
+        try:
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                request = json.loads(body)
+                wfp, student_id = request['path'], request.get('student')
+                if not os.path.exists(wfp):
+                    return self._respond(400, {'error': 'No such workflow: {}'.format(wfp)})
+            else:
+                student_id = parse_qs(url.query).get('student', ['submission'])[0]
+                with tempfile.NamedTemporaryFile(suffix='.knwf', delete=False) as fh:
+                    fh.write(body)
+                    upload = wfp = fh.name
+            row = service.grade(wfp, student_id)
+            if row is None:
+                return self._respond(503, {'error': 'Queue is full, retry later'})
+            self._respond(200, row)
+        except (ValueError, KeyError, zipfile.BadZipFile) as e:
+            self._respond(400, {'error': str(e)})
+        except Exception as e:
+            logging.exception('Error encountered grading {}'.format(self.path))
+            self._respond(500, {'error': str(e)})
+        finally:
+            if upload:
+                os.remove(upload)
+
+    def log_message(self, format, *args):
+        logging.info('%s - %s', self.address_string(), format % args)
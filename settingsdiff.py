@@ -0,0 +1,135 @@
+"""
+Static checks of the node settings of submissions against the reference.
+
+The model settings of a node are canonicalized into a tree of hashed
+subtrees (a Merkle tree), in which the hash of a config covers all of its
+keys and values regardless of their order. Two nodes are compared top-down,
+descending only into the subtrees whose hashes differ, so that the keys
+which differ are found without comparing the settings that agree.
+"""
+import os
+import xml.etree.ElementTree as ElementTree
+from functools import lru_cache
+from pathlib import Path
+import knime
+from workflowgraph import config_entries, hash64, load_workflow_graph
+
+
+# settings which are expected to differ between submissions, e.g. the data path of readers
+IGNORED_KEYS = frozenset(['file_selection'])
+
+
+def settings_tree(element):
+    """
+    Returns the canonical tree of a KNIME settings element as a tuple
+    (hash, value, children), where children is {key: subtree} of a config
+    and None for an entry.
+    """
+    if element.tag.endswith('entry'):
+        value = element.attrib.get('value')
+        return hash64('{}={}'.format(element.attrib.get('key'), value)), value, None
+    children = {k: settings_tree(child) for k, child in config_entries(element).items()
+                if k not in IGNORED_KEYS}
+    digest = hash64('{}{{{}}}'.format(element.attrib.get('key'),
+                                      ';'.join('{}:{:x}'.format(k, c[0]) for k, c in sorted(children.items()))))
+    return digest, None, children
+
+@lru_cache(maxsize=65536)
+def _load_settings_tree(settings_filepath, mtime_ns):
+    model = config_entries(ElementTree.parse(settings_filepath).getroot()).get('model')
+    return settings_tree(model) if model is not None else None
+
+def load_settings_tree(settings_filepath):
+    """
+    Returns the canonical tree of the model settings in a settings.xml,
+    parsing it only when it changed since the last call.
+    """
+    return _load_settings_tree(str(settings_filepath), os.stat(settings_filepath).st_mtime_ns)
+
+def diff_settings(ref_tree, sub_tree, prefix=''):
+    """
+    Compares two settings trees top-down, descending only into subtrees
+    whose hashes differ.
+    Returns the list of the keys, as '/' separated paths, which differ.
+    """
+    if ref_tree is None or sub_tree is None:
+        return [] if ref_tree is sub_tree else [prefix or 'model']
+    if ref_tree[0] == sub_tree[0]:
+        return []
+    if ref_tree[2] is None or sub_tree[2] is None:
+        return [prefix or 'model']
+    diffs = []
+    for k in ref_tree[2].keys() | sub_tree[2].keys():
+        path = prefix + '/' + k if prefix else k
+        if k not in ref_tree[2] or k not in sub_tree[2]:
+            diffs.append(path)
+        else:
+            diffs.extend(diff_settings(ref_tree[2][k], sub_tree[2][k], path))
+    return sorted(diffs)
+
+
+def question_nodes(path_to_knime_workflow):
+    """
+    Returns {question: [node indices]} of the nodes feeding each Container
+    Output (Table) node of the workflow, excluding the output node itself.
+    Questions are keyed as the outputs of `utils.collect_workflow_outputs`,
+    by the annotations of the output nodes, or by their position when none
+    of them is annotated.
+    """
+    graph = load_workflow_graph(path_to_knime_workflow)
+    index = {dirname: i for i, dirname in enumerate(graph.node_dirnames)}
+    output_dirnames = knime.discover_service_nodes(path_to_knime_workflow)[1]
+    annotations = [knime.find_service_COT_node_annotation(path_to_knime_workflow, dirname)
+                   for dirname in output_dirnames]
+    if all(a is None for a in annotations):
+        annotations = list(range(len(annotations)))
+    nodes = {}
+    for annotation, dirname in zip(annotations, output_dirnames):
+        if dirname not in index:
+            continue
+        upstream = graph.upstream([index[dirname]])
+        upstream[index[dirname]] = False
+        nodes[annotation] = [int(j) for j in upstream.nonzero()[0]]
+    return nodes
+
+def settings_index(path_to_knime_workflow, indices):
+    """
+    Returns {factory id: [(node dirname, settings tree)]} of the nodes with
+    the given indices in the workflow.
+    """
+    graph = load_workflow_graph(path_to_knime_workflow)
+    index = {}
+    for i in indices:
+        if graph.is_meta[i] or graph.factories[i] < 0:
+            continue
+        tree = load_settings_tree(Path(path_to_knime_workflow, graph.node_dirnames[i], 'settings.xml'))
+        index.setdefault(int(graph.factories[i]), []).append((graph.node_dirnames[i], tree))
+    return index
+
+def diff_question_settings(ref_index, path_to_knime_workflow, indices):
+    """
+    Compares the settings of the nodes with the given indices in a submitted
+    workflow with a reference index from `settings_index`. Each reference
+    node is paired with the submitted node of the same factory class whose
+    settings differ the least, and is reported as 'node: missing' when no
+    such node is left to pair it with.
+    Returns a list of 'node: key' strings of the settings which differ.
+    """
+    sub_index = settings_index(path_to_knime_workflow, indices)
+    diffs = []
+    for factory, ref_nodes in ref_index.items():
+        candidates = list(sub_index.get(factory, []))
+        for ref_dirname, ref_tree in ref_nodes:
+            if not candidates:
+                diffs.append('{}: missing'.format(ref_dirname))
+                continue
+            best = None
+            for c, (_dirname, sub_tree) in enumerate(candidates):
+                d = diff_settings(ref_tree, sub_tree)
+                if best is None or len(d) < len(best[1]):
+                    best = (c, d)
+                if not d:
+                    break
+            del candidates[best[0]]
+            diffs.extend('{}: {}'.format(ref_dirname, k) for k in best[1])
+    return diffs
@@ -0,0 +1,149 @@
+"""
+Detection of similar submissions within a cohort.
+
+Each workflow is described by a set of shingles (node types, connections
+between node types, node settings and node layout), which is compressed to
+a MinHash signature. Locality-sensitive hashing over bands of the signatures
+selects the candidate pairs, so that the cohort is not compared pair by pair.
+"""
+import os
+import hashlib
+import logging
+from workflowgraph import load_workflow_graph
+
+
+# 2**61 - 1, the Mersenne prime used for the universal hash permutations
+MERSENNE_PRIME = (1 << 61) - 1
+NUM_PERM = 128
+
+
+def workflow_shingles(path_to_knime_workflow):
+    """
+    Returns the set of shingles of the KNIME workflow in the provided path,
+    from its graph (see `workflowgraph.workflowgraph`):
+        n: node types, numbered by occurrence
+        c: connections between node types, numbered by occurrence
+        s: node types with the hash of their model settings
+        u: node types with the hash of their position in the layout
+    """
+    graph = load_workflow_graph(path_to_knime_workflow)
+    types = graph.node_type_names()
+
+    shingles = set()
+    counts = {}
+    for t, settings_hash, bounds_hash in zip(types, graph.settings_hashes, graph.bounds_hashes):
+        counts[t] = counts.get(t, 0) + 1
+        shingles.add('n:{}#{}'.format(t, counts[t]))
+        if settings_hash:
+            shingles.add('s:{}:{:016x}'.format(t, settings_hash))
+        if bounds_hash:
+            shingles.add('u:{}:{:016x}'.format(t, bounds_hash))
+
+    counts = {}
+    for source, dest in zip(graph.sources, graph.dests):
+        edge = '{}->{}'.format(types[source], types[dest])
+        counts[edge] = counts.get(edge, 0) + 1
+        shingles.add('c:{}#{}'.format(edge, counts[edge]))
+
+    return shingles
+
+
+def safe_workflow_shingles(path_to_knime_workflow):
+    """
+    Returns the shingles of the workflow as `workflow_shingles`, or an empty
+    set when the workflow cannot be parsed, e.g. when its workflow.knime is
+    missing or corrupt.
+    """
+    try:
+        return workflow_shingles(path_to_knime_workflow)
+    except Exception:
+        logging.exception('Error encountered with shingles of {}'.format(path_to_knime_workflow))
+        return set()
+
+
+class minhasher():
+    """
+    MinHash signatures of shingle sets with NUM_PERM universal hash
+    permutations of the form (a*x + b) mod MERSENNE_PRIME.
+    """
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        import numpy as np
+
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        # a*x + b stays below 2**64 with 32 bit a, b and x
+        self.a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def signature(self, shingles):
+        """
+        Returns the MinHash signature of a set of shingles as an array of
+        num_perm 32 bit values.
+        """
+        import numpy as np
+
+        if not shingles:
+            return np.full(self.num_perm, 0xffffffff, dtype=np.uint64)
+        x = np.fromiter((int.from_bytes(hashlib.blake2b(s.encode('utf8'), digest_size=4).digest(), 'little')
+                         for s in shingles), dtype=np.uint64, count=len(shingles))
+        hashed = (np.outer(x, self.a) + self.b) % np.uint64(MERSENNE_PRIME) & np.uint64(0xffffffff)
+        return hashed.min(axis=0)
+
+
+def lsh_bands(num_perm, threshold):
+    """
+    Returns the (bands, rows) splitting num_perm with the LSH threshold
+    (1/bands)**(1/rows) closest to the similarity threshold.
+    """
+    splits = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    return min(splits, key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - threshold))
+
+def candidate_pairs(signatures, threshold):
+    """
+    Returns the set of index pairs (i, j), i < j, of signatures sharing at
+    least one LSH band, in time linear in the number of signatures.
+    """
+    bands, rows = lsh_bands(signatures.shape[1], threshold)
+    candidates = set()
+    for band in range(bands):
+        buckets = {}
+        for i, key in enumerate(signatures[:, band*rows:(band+1)*rows]):
+            buckets.setdefault(key.tobytes(), []).append(i)
+        for members in buckets.values():
+            for x in range(len(members)):
+                for y in range(x + 1, len(members)):
+                    candidates.add((members[x], members[y]))
+    return candidates
+
+def similarity_report(workflow_paths, ref_workflow_path=None, threshold=0.5, num_perm=NUM_PERM):
+    """
+    Finds the pairs of workflows with similar shingles. Shingles of the
+    reference workflow are ignored, as every correct submission shares them.
+    Returns a dataframe of the pairs with an estimated similarity of at least
+    threshold, with their estimated and exact Jaccard similarity, ranked by
+    similarity. Workflows without shingles besides those of the reference,
+    e.g. which cannot be parsed, are similar to no other workflow.
+    """
+    import numpy as np
+    import pandas as pd
+
+    ref_shingles = safe_workflow_shingles(ref_workflow_path) if ref_workflow_path else set()
+    student_ids = [os.path.basename(wfp) for wfp in workflow_paths]
+    shingles = [safe_workflow_shingles(wfp) - ref_shingles for wfp in workflow_paths]
+
+    # empty shingle sets would all share every band, they are left out of the banding
+    hashed = [i for i, s in enumerate(shingles) if s]
+    hasher = minhasher(num_perm)
+    signatures = np.vstack([hasher.signature(shingles[i]) for i in hashed]) if hashed \
+        else np.empty((0, num_perm), dtype=np.uint64)
+
+    rows = []
+    for x, y in candidate_pairs(signatures, threshold):
+        i, j = hashed[x], hashed[y]
+        estimate = float(np.mean(signatures[x] == signatures[y]))
+        if estimate >= threshold:
+            jaccard = len(shingles[i] & shingles[j]) / len(shingles[i] | shingles[j])
+            rows.append((student_ids[i], student_ids[j], estimate, jaccard))
+
+    report = pd.DataFrame(rows, columns=['student_a', 'student_b', 'similarity', 'jaccard'])
+    return report.sort_values(['similarity', 'jaccard'], ascending=False, ignore_index=True)
@@ -0,0 +1,173 @@
+"""
+Local staging of the datasets read by submitted workflows.
+
+The CSV, File and Excel Reader nodes of every submission point at the path
+of the dataset on the machine of its student, often on a network share or
+on a path which only exists on their laptop. A `datasetcache` resolves each
+distinct dataset once, to the path itself when it can be read or else to a
+file of the same name in one of its data directories, and copies it into
+the cache directory under the hash of its contents. The datasets of a
+workflow are staged by `stage_readers` when it is scanned ahead of its
+execution, see `prefetch`, so that no execution slot waits for a copy. The
+readers of a temporary copy of each workflow are then pointed at the cached
+files before the copy is executed, so that every execution reads its
+datasets from local storage. Legacy File Reader nodes, which have no file
+selection, read their datasets in place.
+
+The cache directory holds
+
+    <hash><extension>    cached datasets, shared by identical datasets
+    index.json           hashes of the datasets by path, size and modification time
+
+so that datasets which did not change are not read again by later runs.
+"""
+import os
+import re
+import json
+import socket
+import shutil
+import hashlib
+import tempfile
+import threading
+import logging
+from contextlib import contextmanager
+import knime
+from preflight import LOCK_FILENAME, local_data_path
+from pruning import refers_outside
+
+
+INDEX_FILENAME = 'index.json'
+CHUNK_SIZE = 2**20
+
+
+def _basename(data_path):
+    # data paths may come from any platform
+    return re.split(r'[\\/]', data_path.rstrip('\\/'))[-1]
+
+
+class datasetcache():
+    """
+    Cache of the datasets read by submitted workflows in cache_dir. Datasets
+    which cannot be read from their own paths are looked up by file name in
+    data_dirs.
+    """
+    def __init__(self, cache_dir, data_dirs=()):
+        self.cache_dir = cache_dir
+        self.data_dirs = list(data_dirs)
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        # {source lock key: lock}, so that each dataset is read by a single thread
+        self._source_locks = {}
+        # {'source|size|mtime_ns': cached filename}
+        self.index = {}
+        try:
+            with open(os.path.join(cache_dir, INDEX_FILENAME)) as fh:
+                self.index = json.load(fh)
+        except (OSError, ValueError):
+            pass
+        self.staged = 0
+
+    def resolve(self, path_to_knime_workflow, data_path):
+        """
+        Returns the local file from which the dataset at data_path, read by
+        the workflow in the provided path, is staged, or None when it
+        cannot be found.
+        """
+        filepath = local_data_path(path_to_knime_workflow, data_path)
+        if filepath is not None and os.access(filepath, os.R_OK):
+            return filepath
+        basename = _basename(data_path)
+        for data_dir in self.data_dirs:
+            filepath = os.path.join(data_dir, basename)
+            if basename and os.access(filepath, os.R_OK):
+                return filepath
+        return None
+
+    def _save_index(self):
+        filepath = os.path.join(self.cache_dir, INDEX_FILENAME)
+        tmp_filepath = '{}.{}.{}.tmp'.format(filepath, socket.gethostname(), os.getpid())
+        with open(tmp_filepath, 'w') as fh:
+            json.dump(self.index, fh)
+        os.replace(tmp_filepath, filepath)
+
+    def stage(self, source):
+        """
+        Returns the cached file of the dataset in source, copying it into
+        the cache when it is not cached yet. The dataset is read once, to
+        copy and hash it at the same time.
+        """
+        stat = os.stat(source)
+        key = '{}|{}|{}'.format(os.path.abspath(source), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            source_lock = self._source_locks.setdefault(key, threading.Lock())
+        with source_lock:
+            filename = self.index.get(key)
+            if filename and os.path.exists(os.path.join(self.cache_dir, filename)):
+                return os.path.join(self.cache_dir, filename)
+
+            digest = hashlib.blake2b(digest_size=16)
+            fd, tmp_filepath = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            try:
+                with open(source, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+                    for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                        digest.update(chunk)
+                        dst.write(chunk)
+                filename = digest.hexdigest() + os.path.splitext(source)[1].lower()
+                os.replace(tmp_filepath, os.path.join(self.cache_dir, filename))
+            except BaseException:
+                os.remove(tmp_filepath)
+                raise
+            with self._lock:
+                self.index[key] = filename
+                self.staged += 1
+                self._save_index()
+            logging.debug('Staged {} as {}'.format(source, filename))
+            return os.path.join(self.cache_dir, filename)
+
+    def stage_readers(self, path_to_knime_workflow, reader_dirnames=None, data_paths=None):
+        """
+        Stages the datasets read by the readers of the workflow, with the
+        reader_dirnames and data_paths of a `prefetch.submissionscan` when
+        provided, and otherwise found in the workflow.
+        Returns {reader dirname: cached file} of the staged datasets.
+        """
+        if reader_dirnames is None:
+            reader_dirnames = knime.find_service_file_reader_node_dirnames(path_to_knime_workflow)
+            data_paths = [knime.find_service_file_reader_data_path(path_to_knime_workflow, dirname)
+                          for dirname in reader_dirnames]
+        staged = {}
+        for dirname, data_path in zip(reader_dirnames, data_paths):
+            source = self.resolve(path_to_knime_workflow, data_path) if data_path else None
+            if source is not None:
+                staged[dirname] = self.stage(source)
+        return staged
+
+    @contextmanager
+    def staged_workflow(self, path_to_knime_workflow, scan=None):
+        """
+        Yields the path to a copy of the workflow whose readers read the
+        cached datasets, which is removed on exit, or the path to the
+        workflow itself when none of its datasets can be staged or its other
+        nodes refer to files outside it by paths relative to it. The
+        datasets staged by the scan of the workflow are used when provided,
+        see `utils.workflowgrader.scan_submission`, as are its nodes referring
+        outside it; the workflow may then be a pruned copy of the scanned
+        one, without some of its nodes.
+        """
+        node_dirnames = set(os.listdir(path_to_knime_workflow))
+        if scan is not None and scan.staged is not None:
+            staged = {dirname: filepath for dirname, filepath in scan.staged.items() if dirname in node_dirnames}
+            outside = (node_dirnames & set(scan.outside)) - set(staged)
+        else:
+            staged = self.stage_readers(path_to_knime_workflow)
+            outside = staged and refers_outside(path_to_knime_workflow, node_dirnames - set(staged))
+        if not staged or outside:
+            yield path_to_knime_workflow
+            return
+        with tempfile.TemporaryDirectory(prefix='staged_') as temp_dir:
+            staged_path = os.path.join(temp_dir, os.path.basename(os.path.normpath(path_to_knime_workflow)))
+            # the lock of the workflow is not copied, the copy is locked by its own execution
+            shutil.copytree(path_to_knime_workflow, staged_path, ignore=shutil.ignore_patterns(LOCK_FILENAME))
+            for dirname, filepath in staged.items():
+                knime.set_service_file_reader_data_path(staged_path, dirname, filepath)
+            yield staged_path
@@ -1,14 +1,31 @@
 import knime
-import pandas as pd
-import numpy as np
 from pathlib import Path
-import os, re
-import glob
-from tqdm import tqdm
+import os, re, json
 import xml.etree.ElementTree as ET
-import sys, traceback, logging
+import sys, traceback, logging, time
 from datetime import datetime
 import itertools
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import heapq
+from scheduler import memorygovernor
+from metrics import metricsregistry, memory_usage, failure_cause
+from nodecounts import nodecountmatrix
+from workflowgraph import NODE_TYPES
+from references import referenceindex, score, hash_value_counts, equal_multisets
+from questionmatch import questionmatcher
+from bundle import bundle_filepath, save_bundle, load_bundle
+from preflight import check_workflow, local_data_path
+from pruning import pruned_workflow, pruned_node_dirnames, outside_node_dirnames
+from prefetch import submissionscan, prefetcher, PREFETCH_DEPTH
+from discovery import workspacetree
+from failures import is_transient, cause_of, quarantine_reason, RETRIES, RETRY_BACKOFF
+from cohort import cohortstats
+from mismatch import diagnose_column, DIAGNOSTIC_ROWS, DIAGNOSTIC_TIME_BUDGET
+from compaction import stringpool, compact_output, original_dtype, original_column, original_frame
+
+# pandas, numpy and tqdm are imported by the functions using them, so that
+# the command line starts without waiting for them to load
 
 
 def display_process_start(verbose):
@@ -26,7 +43,18 @@ def collect_workflow_nodes(path_to_knime_workflow):
     Collect the list of nodes of the workflow in the provided path to a KNIME workflow.
     Returns a dictionary which describes the count of the various nodes in the workflow.
 
+    The nodes are counted from the (cached) graph of the workflow, see
+    `workflowgraph.load_workflow_graph`, and from the node directories when
+    its workflow.knime cannot be parsed.
     """
+    import numpy as np
+    from workflowgraph import load_workflow_graph
+
+    try:
+        return load_workflow_graph(path_to_knime_workflow).node_type_counts()
+    except (OSError, ET.ParseError):
+        logging.warning('Counting nodes of {} from node directories'.format(path_to_knime_workflow))
+
     nodes = []
     for settings_filepath in Path(path_to_knime_workflow).glob("*/settings.xml"):
         node = re.split('[\(\)]',os.path.basename(settings_filepath.parent))[0].strip()
@@ -34,22 +62,41 @@ def collect_workflow_nodes(path_to_knime_workflow):
 
     return dict(zip(*np.unique(nodes,return_counts=True)))
 
-def collect_workflow_outputs(path_to_knime_workflow, exec_path = None):
+def collect_workflow_outputs(path_to_knime_workflow, exec_path = None, vmargs = None, prune = False,
+                             dataset_cache = None, scan = None, timeout = None):
     """
     Collect all the outputs of the workflow in the provided path to a KNIME workflow.
+    JVM arguments such as ['-Xmx2g'] can be passed to the execution with vmargs.
+    With prune, only the nodes feeding the outputs are executed, see `pruning.pruned_workflow`.
+    With a dataset_cache, the datasets are read from the cache, see `staging.datasetcache`.
+    With a scan of the workflow, see `prefetch.submissionscan`, its nodes are not discovered, pruned nor staged again.
+    An execution taking longer than timeout seconds is killed and raises subprocess.TimeoutExpired.
     Returns a dictionary where (key,value) = (node annotation,output table)
     """
-    if not None:
-        wf = knime.Workflow(path_to_knime_workflow)
-        wf.execute()        
-    else:
+    if exec_path is not None:
         knime.executable_path = exec_path
-        wf = knime.Workflow(path_to_knime_workflow)
+    discovered = scan.discovered if scan is not None else None
+    with ExitStack() as stack:
+        # the workflow is executed from a temporary copy when pruned or staged
+        execution_path = path_to_knime_workflow
+        if prune:
+            execution_path = stack.enter_context(pruned_workflow(execution_path, scan))
+        if dataset_cache is not None:
+            execution_path = stack.enter_context(dataset_cache.staged_workflow(execution_path, scan))
+        wf = knime.Workflow(execution_path, vmargs=vmargs, discovered=discovered, timeout=timeout)
         wf.execute()
-    if all([e == None for e in wf.COT_annotation]):
-        return dict(zip(list(range(len(wf.COT_annotation))),wf.data_table_outputs)), wf.file_reader_data_path
+        outputs = wf.data_table_outputs
+        annotations = scan.annotations if discovered is not None else wf.COT_annotation
+    # data paths of all the readers of the submitted workflow, including the pruned ones
+    if discovered is not None:
+        data_path = scan.data_paths
+    else:
+        data_path = [knime.find_service_file_reader_data_path(path_to_knime_workflow, dirname)
+                     for dirname in knime.find_service_file_reader_node_dirnames(path_to_knime_workflow)]
+    if all([e == None for e in annotations]):
+        return dict(zip(list(range(len(annotations))),outputs)), data_path
     else:
-        return dict(zip(wf.COT_annotation,wf.data_table_outputs)), wf.file_reader_data_path
+        return dict(zip(annotations,outputs)), data_path
   
 def compare_COT_annotation(d1,d2):
     """
@@ -65,35 +112,37 @@ def compare_COT_annotation(d1,d2):
         missing_ann: list of annotations of d1 which are not in d2.
         foreign_ann: list of annotations of d2 which are not in d1.
     """
-    foreign_ann = []
-    missing_ann = []
-    for k in d1:
-        if k not in list(d2.keys()):
-            missing_ann.append(k)
-    for k in d2:
-        if k not in list(d1.keys()):
-            foreign_ann.append(k)
+    missing_ann = [k for k in d1 if k not in d2]
+    foreign_ann = [k for k in d2 if k not in d1]
     return missing_ann, foreign_ann    
 
-def assisted_question_inference(d, missing, foreign):
+def assisted_question_inference(d, missing, foreign, matcher=None):
         """
-        Performed assisted question inference when the both missing 
-        and foreign questions are exactly one. When len(missing) and 
-        len(foreign) are both 1, performs automatic update of the 
-        dictionary key from the question observed in foreign to the 
-        one observed in missing.
+        Performed assisted question inference of mislabeled questions. 
+        With a `questionmatcher.questionmatcher`, the foreign questions
+        are matched to the missing questions they are most similar to;
+        otherwise only when len(missing) and len(foreign) are both 1. 
+        Performs automatic update of the dictionary keys from the 
+        questions observed in foreign to the matched ones in missing.
         
         Args:
             d: the dictionary of outputs with the form 
                 {node_annotation: dataframe_from_COT}.
             missing: the list of missing questions from the submission
             foreign: the list of foreign questions observed in the submission
+            matcher: optional `questionmatcher.questionmatcher` of the reference
         Returns:
-            feedback: computer generated qualitative feedback for the student
+            matches: dictionary of the form {foreign question: missing question}
         """
-        if len(missing) == 1 and len(foreign) == 1:
-            d[missing[0]] = d[foreign[0]]
-            del d[foreign[0]]
+        if matcher is not None:
+            matches = matcher.match(missing, foreign, d)
+        elif len(missing) == 1 and len(foreign) == 1:
+            matches = {foreign[0]: missing[0]}
+        else:
+            matches = {}
+        for f, m in matches.items():
+            d[m] = d.pop(f)
+        return matches
         
 def move_col_to_front(df, suffix='_summary'):
     """
@@ -113,42 +162,125 @@ class workflowgrader():
     """
     
     """
-    def __init__(self, workspace, ref_workflow, exec_path, workflowsets):
+    def __init__(self, workspace, ref_workflow, exec_path, workflowsets,
+                 heap_size=None, memory_budget=None, max_workers=1, reference=None, journal=None,
+                 unordered_questions=(), compact_outputs=False, alt_ref_workflows=(),
+                 preflight=True, prune=False, dataset_cache=None, prefetch_depth=PREFETCH_DEPTH, results_store=None,
+                 retries=RETRIES, retry_backoff=RETRY_BACKOFF, execution_timeout=None, workspace_tree=None,
+                 diagnostics=True, diagnostic_rows=DIAGNOSTIC_ROWS, diagnostic_time_budget=DIAGNOSTIC_TIME_BUDGET,
+                 check_settings=False):
         # directory with the workflows to be graded    
         self.workspace = workspace
         # workflow to be used as a reference for grading
         self.ref_workflow = ref_workflow
+        # alternative reference workflows, each submission is graded against the best matching reference
+        self.ref_workflows = [ref_workflow] + list(alt_ref_workflows)
         # fullpaths of workflowsets to iterate, if None, fullpath to workspace is provided
         # self.fullpath_workflowsets = [workspace] if not workflowsets else [os.path.join(workspace,i) for i in workflowsets]
         self.fullpath_workflowsets = [os.path.join(workspace,i) for i in workflowsets]
 
         # assume that workflows are named using student ids
         self.student_ids = {}
+        # workflowsets and workflows of the workspace, see `discovery.workspacetree`, discovered when first needed if None
+        self.workspace_tree = workspace_tree
 
         # knime executable path
         self.exec_path = exec_path
 
+        # admission control of concurrent KNIME executions
+        self.governor = memorygovernor(heap_size, memory_budget, max_workers)
+
+        # live metrics of the run, see metrics.metricsexporter to publish them
+        self.metrics = metricsregistry()
+        self.metrics.gauge_function('in_flight_executions', lambda: {(): self.governor.in_flight})
+        self.metrics.gauge_function('memory_bytes', lambda: memory_usage(self.governor))
+
+        # whether workflows are checked with `preflight.check_workflow` before their execution
+        self.preflight = preflight
+        # whether only the nodes feeding the outputs of submissions are executed, see `pruning.pruned_workflow`
+        self.prune = prune
+        # local cache of the datasets read by submissions, see `staging.datasetcache`, None to read them in place
+        self.dataset_cache = dataset_cache
+        # number of submissions scanned ahead of their execution, see `prefetch.prefetcher`
+        self.prefetch_depth = prefetch_depth
+        # retries of executions failing transiently, see `failures.is_transient`, and seconds before the first
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        # seconds after which the execution of a submission is killed, and failed as a timeout, None to wait
+        self.execution_timeout = execution_timeout
+
+        # store of the results of the run, see `resultstore.resultstore`, None to write the csv files only
+        self.results_store = results_store
+
+        # checkpoint journal of extracted submissions, see journal.checkpointjournal
+        self.journal = journal
+
         # list of fullpaths to folders with workflows
         # self.workflowsets = workflowsets
         self.workflowsets = [os.path.basename(workspace)] if not workflowsets else workflowsets
 
-        # reference based on reference workflow
-        self.ref_output, _ = collect_workflow_outputs(os.path.join(workspace,ref_workflow))
-        self.ref_node_dist = collect_workflow_nodes(os.path.join(workspace,ref_workflow))
+        # reference based on reference workflows, unless (ref_output, ref_node_dist[, alt_ref_outputs]) is provided
+        if reference is None:
+            self.ref_output, _ = collect_workflow_outputs(os.path.join(workspace,ref_workflow), exec_path, self.governor.vmargs)
+            self.ref_node_dist = collect_workflow_nodes(os.path.join(workspace,ref_workflow))
+            self.alt_ref_outputs = [collect_workflow_outputs(os.path.join(workspace,w), exec_path, self.governor.vmargs)[0]
+                                    for w in alt_ref_workflows]
+        else:
+            self.ref_output, self.ref_node_dist, *alt_ref_outputs = reference
+            self.alt_ref_outputs = alt_ref_outputs[0] if alt_ref_outputs else []
         self.question_keys = self.ref_output.keys()
+
+        # questions whose outputs are compared regardless of the order of the rows, named as
+        # strings while the questions of references without annotations are numbered
+        names = {str(q) for q in unordered_questions}
+        self.unordered_questions = {q for q in self.question_keys if str(q) in names}
+        for name in sorted(names - {str(q) for q in self.question_keys}):
+            logging.warning('Unordered question {} matches no question of the reference'.format(name))
+        # matcher of mislabeled questions to the questions of the reference
+        self.question_matcher = questionmatcher(self.ref_output)
+        # schemas and fingerprints of the outputs of the alternative references, see `references`
+        self.ref_index = referenceindex([self.ref_output] + self.alt_ref_outputs, self.unordered_questions) \
+            if self.alt_ref_outputs else None
+        # row and column multisets of the reference, computed once per question
+        self.ref_hash_counts = {}
         
         # outputs from submissions
         self.sub_outputs = {}
-        self.sub_node_dists = {}
+        # strings shared by the compacted outputs of all submissions, None when outputs are not compacted
+        self.string_pool = stringpool() if compact_outputs else None
+        # node counts of the students of each workflowset, see `nodecounts.nodecountmatrix`
+        self.sub_node_counts = {}
         self.sub_data_paths = {}
+        # reasons why the workflows of students could not be executed, None when they could
+        self.sub_failures = {}
 
         # missing and foreign questions
         self.check_question_results = {}
+        # mislabeled questions of each student matched to the reference, {foreign: missing}
+        self.question_matches = {}
+        # numbers the workflowsets of the submissions graded one at a time with `grade_submission`
+        self._submission_counter = itertools.count()
    
         # missing and foreign variables
         self.check_var_results = {}
         # incorrect datatypes
         self.check_data_results = {}
+        # reference matched by each submission per question, only with alternative references
+        self.check_ref_results = {}
+        # incorrect node settings, only when checked with `check_settings_by_workflowset`
+        self.check_settings_results = {}
+        # whether the settings of the nodes are checked by `check_workflowset`
+        self.check_settings = check_settings
+        # reference node settings by question, see `settingsdiff.settings_index`
+        self.ref_settings_index = None
+        # cohort statistics accumulated while the students are checked, see `cohort.cohortstats`
+        self.cohort_stats = {}
+        # diagnostics of the variables with incorrect data, see `mismatch.diagnose_column`, None when not diagnosed
+        self.check_diagnostics_results = {}
+        self.diagnostics = diagnostics
+        # differing rows reported per variable, and seconds the diagnostic of a variable may take
+        self.diagnostic_rows = diagnostic_rows
+        self.diagnostic_time_budget = diagnostic_time_budget
 
 
     def __len__(self):
@@ -157,12 +289,20 @@ class workflowgrader():
         """
         return sum(len(workflowset) for workflowset in self.sub_outputs.values() )
 
+    def reference(self):
+        """
+        Returns the (ref_output, ref_node_dist, alt_ref_outputs) of the
+        references, from which a workflowgrader can be created without
+        executing the reference workflows again.
+        """
+        return self.ref_output, self.ref_node_dist, self.alt_ref_outputs
+
     def cmp_var_dtype(self, workflowset, s, q, v):
         """
         Comparison of the variable datatype for question q and variable v of
         sub_outputs by submission s to ref_output to return a boolean value.
         """
-        return self.ref_output[q][v].dtype == self.sub_outputs[workflowset][s][q][v].dtype
+        return self.ref_output[q][v].dtype == original_dtype(self.sub_outputs[workflowset][s][q], v)
 
     def cmp_var_data(self, workflowset, s, q, v):
         """
@@ -170,51 +310,326 @@ class workflowgrader():
         sub_outputs by submission s to ref_output using pandas .equals 
         function to return a boolean value.
         """
-        return self.ref_output[q][v].equals(self.sub_outputs[workflowset][s][q][v])
+        if q in self.unordered_questions:
+            return self.cmp_var_data_unordered(workflowset, s, q, v)
+        return self.ref_output[q][v].equals(original_column(self.sub_outputs[workflowset][s][q], v))
 
-    def extract_workflow_data(self, workflowset):
+    def diagnose_var_data(self, workflowset, s, q, variables, r=None):
         """
-        Extracts node, output and data path information from the workflows
-        found in the workflowset.
+        Returns the diagnostics {variable: diagnostic} of the variables of
+        question q with incorrect data in the output of submission s,
+        against the reference r it was graded against, see
+        `mismatch.diagnose_column`.
         """
-        nodes = []
-        sub_outputs = []
-        data_paths = []
-        student_ids = []
-        # fullpath_workflowset = os.path.join(self.workspace,workflowset)
+        ref_output = ([self.ref_output] + self.alt_ref_outputs)[r or 0][q]
+        diagnostics = {}
+        for v in variables:
+            try:
+                diagnostics[v] = diagnose_column(ref_output[v], original_column(self.sub_outputs[workflowset][s][q], v),
+                                                 q in self.unordered_questions, self.diagnostic_rows, self.diagnostic_time_budget)
+            except Exception:
+                logging.exception('Error encountered with diagnostic of {} of {} of {}'.format(v, q, s))
+        return diagnostics
 
-        if (len(self.workflowsets) == 1) and os.path.basename(self.workspace) == self.workflowsets[0]:
-            fullpath_workflowset = self.workspace
-        else:
-            fullpath_workflowset = os.path.join(self.workspace,workflowset)
+    def ref_hash_count(self, q, v=None):
+        """
+        Returns the multiset of values of variable v of the reference output
+        of question q, or the multiset of its rows when v is None.
+        """
+        if (q, v) not in self.ref_hash_counts:
+            self.ref_hash_counts[(q, v)] = hash_value_counts(self.ref_output[q] if v is None else self.ref_output[q][v])
+        return self.ref_hash_counts[(q, v)]
 
-        progress = tqdm(glob.glob(os.path.join(fullpath_workflowset,'[ab0-9]*')), ascii=' >=')
-        for wfp in progress:
-            progress.set_description('    Extracting data from {}'.format(os.path.basename(wfp)+'.knwf'))
-            student_ids.append(os.path.basename(wfp))
-            
-            # extraction of node information
+    def cmp_var_data_unordered(self, workflowset, s, q, v):
+        """
+        Comparison of the variable data for question q and variable v of
+        sub_outputs by submission s to ref_output regardless of the order
+        of the values, by comparing the multisets of hashed values.
+        """
+        return equal_multisets(self.ref_hash_count(q, v), hash_value_counts(original_column(self.sub_outputs[workflowset][s][q], v)))
+
+    def cmp_rows_unordered(self, workflowset, s, q):
+        """
+        Comparison of the rows of the output of question q by submission s,
+        restricted to the reference variables, to the rows of ref_output
+        regardless of their order. Returns True when the multisets of rows
+        are equal, in which case every variable has the correct data.
+        """
+        sub_output = self.sub_outputs[workflowset][s][q]
+        if not set(self.ref_output[q].columns).issubset(sub_output.columns):
+            return False
+        return equal_multisets(self.ref_hash_count(q), hash_value_counts(original_frame(sub_output, self.ref_output[q].columns)))
+
+    def scan_submission(self, wfp):
+        """
+        Reads the metadata of a single workflow which its execution needs,
+        runs the pre-flight checks and, for a workflow which passed them,
+        finds the nodes to prune and stages its datasets, ahead of its
+        admission to an execution slot.
+        Returns a `prefetch.submissionscan`.
+        """
+        # extraction of node information
+        with self.metrics.timer('nodes'):
             d = collect_workflow_nodes(wfp)
-            # compare keys and create missing keys
-            for k in self.ref_node_dist.keys():
-                if k not in d.keys():
-                    d[k] = 0
-            nodes.append(d)
 
-            # extraction of output and data path information
+        # discovery of the nodes, left to the execution when it fails
+        try:
+            discovered = knime.discover_service_nodes(wfp)
+            annotations = [knime.find_service_COT_node_annotation(wfp, dirname) for dirname in discovered[1]]
+            data_paths = [knime.find_service_file_reader_data_path(wfp, dirname) for dirname in discovered[2]]
+        except Exception:
+            discovered, annotations, data_paths = None, None, ''
+
+        # pre-flight checks, with no KNIME execution
+        failure = None
+        if self.preflight:
+            with self.metrics.timer('preflight'):
+                failure = check_workflow(wfp, self.dataset_cache.resolve if self.dataset_cache else local_data_path,
+                                         discovered)
+
+        # pruning and staging of the workflow, left to the execution when they fail
+        staged, pruned, outside = None, None, None
+        if (self.prune or self.dataset_cache is not None) and failure is None and discovered is not None:
             try:
-                sub_output, data_path = collect_workflow_outputs(wfp,self.exec_path)
-                sub_outputs.append(sub_output)
-                data_paths.append(data_path)
-            except:
-                logging.exception('Error encountered with {}'.format(wfp))
-                sub_outputs.append({})
-                data_paths.append('')
-
-        self.student_ids[workflowset] = student_ids
-        self.sub_node_dists[workflowset] = dict(zip(student_ids,nodes))
+                outside = outside_node_dirnames(wfp, os.listdir(wfp))
+                if self.prune:
+                    pruned = pruned_node_dirnames(wfp, discovered[1])
+                if self.dataset_cache is not None:
+                    with self.metrics.timer('staging'):
+                        staged = self.dataset_cache.stage_readers(wfp, discovered[2], data_paths)
+            except Exception:
+                logging.warning('Pruning and staging {} at its execution'.format(wfp), exc_info=True)
+                staged, pruned, outside = None, None, None
+        return submissionscan(d, discovered, annotations, data_paths, failure, staged, pruned, outside)
+
+    def extract_submission_data(self, wfp, scan=None):
+        """
+        Extracts node, output and data path information from a single
+        workflow, from its scan by `scan_submission` when it was scanned
+        beforehand. The KNIME execution waits for admission by self.governor
+        so that concurrent executions stay within the memory budget.
+        Callers count the workflow in the queue_depth metric beforehand.
+        A workflow failing the pre-flight checks is not executed.
+        Returns a tuple of (node distribution, outputs, data paths, failure),
+        where failure is the reason why the workflow could not be executed,
+        or None.
+        """
+        if scan is None:
+            scan = self.scan_submission(wfp)
+        d = scan.node_dist
+
+        if scan.failure is not None:
+            logging.warning('Skipping {}: {}'.format(wfp, scan.failure))
+            self.metrics.inc('failures_total', cause=cause_of(scan.failure))
+            self.metrics.inc('queue_depth', -1)
+            self.metrics.completed()
+            return d, {}, scan.data_paths, scan.failure
+
+        # extraction of output and data path information
+        failure = None
+        waiting = time.perf_counter()
+        try:
+            with self.governor.admit():
+                self.metrics.observe('phase_duration_seconds', time.perf_counter() - waiting, phase='admission')
+                self.metrics.inc('queue_depth', -1)
+                waiting = None
+                with self.metrics.timer('execution'):
+                    sub_output, data_path = collect_workflow_outputs(wfp,self.exec_path,self.governor.vmargs,
+                                                                     self.prune,self.dataset_cache,scan,self.execution_timeout)
+        except Exception as e:
+            logging.exception('Error encountered with {}'.format(wfp))
+            failure = '{}: {}'.format(failure_cause(e), e)
+            self.metrics.inc('failures_total', cause=failure_cause(e))
+            if waiting is not None:
+                self.metrics.inc('queue_depth', -1)
+            sub_output, data_path = {}, ''
+        self.metrics.completed()
+        return d, sub_output, data_path, failure
+
+    def settle_failure(self, wfp, result, attempt):
+        """
+        Returns (delay, result) for the result of the attempt-th execution of
+        the workflow wfp by `extract_submission_data`: delay is the seconds
+        after which the workflow is executed again after a transient failure,
+        see `failures.is_transient`, or None when the result is final. A
+        workflow still failing transiently after self.retries retries is
+        quarantined, its failure replaced by the reason of its quarantine.
+        """
+        failure = result[3]
+        if not is_transient(failure):
+            return None, result
+        if attempt <= self.retries:
+            delay = self.retry_backoff * 2**(attempt - 1)
+            logging.warning('Retrying {} in {}s after attempt {}: {}'.format(wfp, delay, attempt, failure))
+            self.metrics.inc('retries_total', cause=cause_of(failure))
+            return delay, result
+        if self.retries:
+            logging.warning('Quarantining {}: {}'.format(wfp, failure))
+            self.metrics.inc('quarantined_total')
+            result = result[:3] + (quarantine_reason(failure, attempt),)
+        return None, result
+
+    def extract_submission_data_with_retries(self, wfp, scan=None):
+        """
+        Extracts the data of a single workflow as `extract_submission_data`,
+        executing it again after transient failures and quarantining it as
+        `extract_workflow_data` does, see `settle_failure`. The backoff
+        before each retry is waited in the calling thread.
+        """
+        attempt = 1
+        while True:
+            delay, result = self.settle_failure(wfp, self.extract_submission_data(wfp, scan), attempt)
+            if delay is None:
+                return result
+            time.sleep(delay)
+            attempt, scan = attempt + 1, None
+            self.metrics.inc('queue_depth')
+
+    def workflow_paths(self, workflowset):
+        """
+        Returns the fullpaths of the submitted workflows found in the workflowset,
+        which are the workflows in its folder at any depth other than the reference workflows.
+        """
+        if self.workspace_tree is None:
+            self.workspace_tree = workspacetree(self.workspace).discover()
+
+        ref_paths = {os.path.normpath(os.path.join(self.workspace,w)) for w in self.ref_workflows}
+        return [wfp for wfp in self.workspace_tree.workflow_paths(workflowset) if os.path.normpath(wfp) not in ref_paths]
+
+    def store_workflow_data(self, workflowset, student_ids, results):
+        """
+        Stores the results of `extract_submission_data` for the students
+        of the workflowset, in the order of student_ids. When outputs are
+        compacted, reports the memory saved by their compaction.
+        Results without a failure, as saved before pre-flight checks, are
+        taken as executed.
+        """
+        results = [tuple(r) + (None,) * (4 - len(r)) for r in results]
+        nodes, sub_outputs, data_paths, failures = zip(*results) if results else ((), (), (), ())
+        if self.string_pool is not None:
+            before, after = 0, 0
+            compacted = []
+            for sub_output in sub_outputs:
+                sub_output, b, a = compact_output(sub_output, self.string_pool)
+                compacted.append(sub_output)
+                before, after = before + b, after + a
+            sub_outputs = compacted
+            display_process_output('outputs of workflowset {} compacted from {:.1f} MB to {:.1f} MB ({:.1f} MB saved).'.format(
+                workflowset.upper(), before / 2**20, after / 2**20, (before - after) / 2**20))
+
+        self.student_ids[workflowset] = list(student_ids)
+        self.sub_node_counts[workflowset] = nodecountmatrix(student_ids, nodes, self.ref_node_dist)
         self.sub_outputs[workflowset] = dict(zip(student_ids,sub_outputs))
         self.sub_data_paths[workflowset] = dict(zip(student_ids,data_paths))
+        self.sub_failures[workflowset] = dict(zip(student_ids,failures))
+
+    def save_bundle_by_workflowset(self, workflowset, save_dir):
+        """
+        Saves the outputs, node distributions, data paths and failures of the students
+        of the workflowset to a bundle, see `bundle.save_bundle`, from which
+        the workflowset can be regraded with `load_bundle_by_workflowset`.
+        To be called before the checks, which relabel mislabeled questions.
+        """
+        student_ids = self.student_ids[workflowset]
+        results = zip(self.sub_node_counts[workflowset].node_dists(),
+                      [self.sub_outputs[workflowset][s] for s in student_ids],
+                      [self.sub_data_paths[workflowset][s] for s in student_ids],
+                      [self.sub_failures[workflowset][s] for s in student_ids])
+        save_bundle(bundle_filepath(save_dir, workflowset), workflowset, student_ids, results)
+
+    def load_bundle_by_workflowset(self, workflowset, save_dir):
+        """
+        Loads the outputs, node distributions, data paths and failures of the students
+        of the workflowset from the bundle saved by `save_bundle_by_workflowset`,
+        in place of `extract_workflow_data`.
+        """
+        student_ids, results = load_bundle(bundle_filepath(save_dir, workflowset))
+        self.store_workflow_data(workflowset, student_ids, results)
+        display_process_output('loaded {} workflows of workflowset {} from its bundle.'.format(len(student_ids), workflowset.upper()))
+
+    def extract_workflow_data(self, workflowset):
+        """
+        Extracts node, output and data path information from the workflows
+        found in the workflowset. Up to self.governor.max_workers workflows
+        are executed concurrently, while the next self.prefetch_depth
+        workflows are scanned, see `prefetch.prefetcher`. With a journal,
+        every extracted workflow is recorded as it completes and workflows
+        already recorded are skipped.
+        Workflows whose execution failed transiently, see `failures`, are
+        executed again up to self.retries times, after a backoff doubling
+        from self.retry_backoff seconds and behind the workflows not executed
+        yet. Workflows still failing are quarantined.
+        """
+        from tqdm import tqdm
+
+        wfps = self.workflow_paths(workflowset)
+        student_ids = [os.path.basename(wfp) for wfp in wfps]
+        results = dict(self.journal.completed(workflowset)) if self.journal else {}
+
+        pending = [wfp for wfp in wfps if os.path.basename(wfp) not in results]
+        self.metrics.inc('queue_depth', len(pending))
+        progress = tqdm(total=len(wfps), initial=len(wfps)-len(pending), ascii=' >=')
+        # {wfp: number of executions}
+        attempts = dict.fromkeys(pending, 1)
+        # heap of (time of the retry, order, wfp), submitted once the time has come
+        retries, order = [], itertools.count()
+        with prefetcher(self.scan_submission, pending, self.prefetch_depth) as scans, \
+                ThreadPoolExecutor(max_workers=self.governor.max_workers) as executor:
+            futures = {executor.submit(lambda wfp: self.extract_submission_data(wfp, scans.take(wfp)), wfp): wfp
+                       for wfp in pending}
+            while futures or retries:
+                while retries and retries[0][0] <= time.monotonic():
+                    _, _, wfp = heapq.heappop(retries)
+                    self.metrics.inc('queue_depth')
+                    futures[executor.submit(self.extract_submission_data, wfp)] = wfp
+                if not futures:
+                    time.sleep(max(0, retries[0][0] - time.monotonic()))
+                    continue
+                timeout = max(0, retries[0][0] - time.monotonic()) if retries else None
+                done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    wfp = futures.pop(future)
+                    s = os.path.basename(wfp)
+                    delay, result = self.settle_failure(wfp, future.result(), attempts[wfp])
+                    if delay is not None:
+                        heapq.heappush(retries, (time.monotonic() + delay, next(order), wfp))
+                        attempts[wfp] += 1
+                        continue
+                    progress.set_description('    Extracting data from {}'.format(s+'.knwf'))
+                    results[s] = result
+                    if self.journal:
+                        self.journal.record_extract(workflowset, s, results[s])
+                    progress.update()
+        progress.close()
+
+        # results are collected in the order of the workflows found
+        self.store_workflow_data(workflowset, student_ids, [results[s] for s in student_ids])
+
+    def checks_by_workflowset(self, workflowset):
+        """
+        Returns the results of the checks of the workflowset as a dictionary,
+        to be restored with `restore_checks_by_workflowset`.
+        """
+        check_results = {'check_question_results': self.check_question_results[workflowset],
+                         'check_var_results': self.check_var_results[workflowset],
+                         'check_data_results': self.check_data_results[workflowset]}
+        if workflowset in self.check_ref_results:
+            check_results['check_ref_results'] = self.check_ref_results[workflowset]
+        if workflowset in self.check_settings_results:
+            check_results['check_settings_results'] = self.check_settings_results[workflowset]
+        if workflowset in self.cohort_stats:
+            check_results['cohort_stats'] = self.cohort_stats[workflowset]
+        if workflowset in self.check_diagnostics_results:
+            check_results['check_diagnostics_results'] = self.check_diagnostics_results[workflowset]
+        return check_results
+
+    def restore_checks_by_workflowset(self, workflowset, check_results):
+        """
+        Restores the results of the checks of the workflowset from
+        `checks_by_workflowset`.
+        """
+        for k, v in check_results.items():
+            getattr(self, k)[workflowset] = v
         
     def check_question_by_workflowset(self, workflowset):
         """
@@ -226,22 +641,29 @@ class workflowgrader():
             self.question_check_results : a dictionary of form {student_id: (missing, foreign)}
             self.question_sub_feedbacks : a dictionary of form {student_id: *feedback*}
         """
+        from tqdm import tqdm
 
         try:
             self.sub_outputs[workflowset].keys()
         except:
             print("Need to accumulate workflow outputs with `accumulate_workflow_outputs` first.")
         question_check_results = []
+        question_matches = []
+        stats = self.cohort_stats[workflowset] = cohortstats(self.ref_output.keys())
+        node_summaries = self.sub_node_counts[workflowset].node_summary()
         
         progress = tqdm(self.student_ids[workflowset], ascii=True)
-        for s in progress:
+        for s, node_summary in zip(progress, node_summaries):
             progress.set_description('    Checking outputs from {}'.format(s+'.knwf'))
             missingq, foreignq = compare_COT_annotation(self.ref_output,self.sub_outputs[workflowset][s])
-            feedback = assisted_question_inference(self.sub_outputs[workflowset][s], missingq, foreignq)
+            matches = assisted_question_inference(self.sub_outputs[workflowset][s], missingq, foreignq, self.question_matcher)
             
             question_check_results.append(compare_COT_annotation(self.ref_output,self.sub_outputs[workflowset][s]))
+            question_matches.append(matches)
+            stats.add_submission(*question_check_results[-1], node_summary, self.sub_failures[workflowset].get(s))
        
         self.check_question_results[workflowset] = dict(zip(self.student_ids[workflowset],question_check_results))
+        self.question_matches[workflowset] = dict(zip(self.student_ids[workflowset],question_matches))
 
     def check_variable_and_data_by_workflowset(self,workflowset):
         """
@@ -255,18 +677,26 @@ class workflowgrader():
         
         when question i is not submitted by student j, (aij, bij) = 'UNGRADED'
 
+        With alternative references, each output is graded against the
+        reference it matches best, recorded in self.check_ref_results.
 
         self.var_check_results can be converted to a pandas dataframe with `pd.Dataframe.from_dict()`.
         """
+        from tqdm import tqdm
 
         var_check_results = []
         data_check_results = []
+        ref_check_results = []
+        diagnostics_check_results = []
+        stats = self.cohort_stats[workflowset]
         # for question q 
         q_progress = tqdm(self.ref_output.keys(), ascii=True)
         for q in q_progress:
         # for q in self.ref_output.keys():
             var_check_result = []
             data_check_result = []
+            ref_check_result = []
+            diagnostics_check_result = []
 
             for s in self.student_ids[workflowset]:
                 q_progress.set_description('    Checking data from {}'.format(s+'.knwf'))
@@ -285,43 +715,157 @@ class workflowgrader():
 
                     incorrect_var_data = ['UNGRADED']
                     data_check_result.append(incorrect_var_data)
+                    ref_check_result.append(None)
+                    diagnostics_check_result.append(None)
                     
                     continue
+
                 # when question q is available iterate over target variables and target dtypes
                 for tar_var, tar_dtype in zip(self.ref_output[q].columns,self.ref_output[q].dtypes):
                     try:
                         # check if variable dtype can be accessed and equal to target variable dtype
 
                         if not self.cmp_var_dtype(workflowset, s, q, tar_var):
-                            incorrect_var_dtype.append((tar_var,self.sub_outputs[workflowset][s][q][tar_var].dtype))
+                            incorrect_var_dtype.append((tar_var,original_dtype(self.sub_outputs[workflowset][s][q],tar_var)))
 
                     except:
                         # if variable dtype cannot be accessed, variable is taken to be missing
                         missing_vars.append(tar_var)
-                
-                var_check_result.append((missing_vars,incorrect_var_dtype))  
-                
-                for tar_var in self.ref_output[q].columns:
-                    try:
-                        if not self.cmp_var_data(workflowset, s, q, tar_var):
-                            incorrect_var_data.append(tar_var)
-                    except:
-                        continue
+
+                # when the rows match as a whole, the variables need not be compared one by one
+                if not (q in self.unordered_questions and self.cmp_rows_unordered(workflowset, s, q)):
+                    for tar_var in self.ref_output[q].columns:
+                        try:
+                            if not self.cmp_var_data(workflowset, s, q, tar_var):
+                                incorrect_var_data.append(tar_var)
+                        except:
+                            continue
+
+                # with alternative references, an output which does not match the reference perfectly
+                # is graded against the alternative it matches best, when it matches it better
+                r = None
+                if self.ref_index is not None:
+                    r = 0
+                    if missing_vars or incorrect_var_dtype or incorrect_var_data:
+                        alternative = self.ref_index.match(q, self.sub_outputs[workflowset][s][q],
+                                                           score(missing_vars, incorrect_var_dtype, incorrect_var_data,
+                                                                 len(self.ref_output[q].columns)))
+                        if alternative is not None:
+                            r, missing_vars, incorrect_var_dtype, incorrect_var_data = alternative
+
+                var_check_result.append((missing_vars,incorrect_var_dtype))
                 data_check_result.append(incorrect_var_data)
+                ref_check_result.append(r)
+                stats.add_check(q, 'var', missing_vars)
+                stats.add_check(q, 'dtype', incorrect_var_dtype)
+                stats.add_check(q, 'data', incorrect_var_data)
+                diagnostics_check_result.append(self.diagnose_var_data(workflowset, s, q, incorrect_var_data, r)
+                                                if self.diagnostics else None)
 
 
             var_check_results.append(dict(zip(self.student_ids[workflowset],var_check_result)))
             data_check_results.append(dict(zip(self.student_ids[workflowset],data_check_result)))
+            ref_check_results.append(dict(zip(self.student_ids[workflowset],ref_check_result)))
+            diagnostics_check_results.append(dict(zip(self.student_ids[workflowset],diagnostics_check_result)))
       
         self.check_var_results[workflowset] = dict(zip(self.ref_output.keys(),var_check_results))
         self.check_data_results[workflowset] = dict(zip(self.ref_output.keys(),data_check_results))
+        if self.ref_index is not None:
+            self.check_ref_results[workflowset] = dict(zip(self.ref_output.keys(),ref_check_results))
+        if self.diagnostics:
+            self.check_diagnostics_results[workflowset] = dict(zip(self.ref_output.keys(),diagnostics_check_results))
 
-    def generate_csv_by_workflowset(self, workflowset, save_dir):
+    def check_workflowset(self, workflowset, wfps=None):
+        """
+        Runs the checks of the students of the workflowset, with the check
+        of their node settings when self.check_settings is set. wfps maps
+        the students to their workflows, see `check_settings_by_workflowset`.
         """
-        Processes the data collected into a single pandas dataframe.
+        with self.metrics.timer('checks'):
+            self.check_question_by_workflowset(workflowset)
+            self.check_variable_and_data_by_workflowset(workflowset)
+        if self.check_settings:
+            with self.metrics.timer('settings'):
+                self.check_settings_by_workflowset(workflowset, wfps)
+
+    def check_settings_by_workflowset(self, workflowset, wfps=None):
         """
+        Checks the settings of the nodes feeding the output of each question
+        against the nodes of the same factory class in the reference, see
+        `settingsdiff.diff_question_settings`. The settings of the reference
+        are indexed once and reused for every submission. wfps maps the
+        students to their workflows, the workflows found in the workflowset
+        when not provided.
+
+        Returns self.check_settings_results dictionary with the format
+
+            {'q1': {'stu1': a11, 'stu2': a12}, 'q2': {'stu1': a21, 'stu2': a22}}
+
+        where aij is the list of 'node: key' of the settings which differ in
+        student j submission of question i, or ['UNGRADED'] when question i
+        cannot be found in the workflow of student j or the settings of its
+        nodes cannot be read.
+        """
+        from tqdm import tqdm
+        from settingsdiff import question_nodes, settings_index, diff_question_settings
+
+        if self.ref_settings_index is None:
+            ref_path = os.path.join(self.workspace,self.ref_workflow)
+            ref_nodes = question_nodes(ref_path)
+            self.ref_settings_index = {q: settings_index(ref_path, ref_nodes.get(q, [])) for q in self.ref_output.keys()}
+
+        if wfps is None:
+            wfps = {os.path.basename(wfp): wfp for wfp in self.workflow_paths(workflowset)}
+        settings_check_results = {q: {} for q in self.ref_output.keys()}
+
+        progress = tqdm(self.student_ids[workflowset], ascii=True)
+        for s in progress:
+            progress.set_description('    Checking settings from {}'.format(s+'.knwf'))
+            try:
+                sub_nodes = question_nodes(wfps[s])
+            except Exception:
+                logging.exception('Error encountered with settings of {}'.format(s))
+                sub_nodes = {}
+            # mislabeled questions are matched as by `assisted_question_inference`
+            for f, m in self.question_matches.get(workflowset, {}).get(s, {}).items():
+                if f in sub_nodes and m not in sub_nodes:
+                    sub_nodes[m] = sub_nodes.pop(f)
+
+            for q in self.ref_output.keys():
+                if q not in sub_nodes:
+                    settings_check_results[q][s] = ['UNGRADED']
+                    continue
+                try:
+                    settings_check_results[q][s] = diff_question_settings(self.ref_settings_index[q], wfps[s], sub_nodes[q])
+                except Exception:
+                    # a missing or corrupt settings.xml of a node leaves the question ungraded
+                    logging.exception('Error encountered with settings of {} of {}'.format(q, s))
+                    settings_check_results[q][s] = ['UNGRADED']
+                    continue
+                self.cohort_stats[workflowset].add_check(q, 'settings', settings_check_results[q][s])
+
+        self.check_settings_results[workflowset] = settings_check_results
+
+    def ref_var_counts(self, workflowset, q, student_ids):
+        """
+        Returns the number of variables of the output of question q of the
+        reference matched by each of the students.
+        """
+        ref_outputs = [self.ref_output] + self.alt_ref_outputs
+        matched = self.check_ref_results.get(workflowset, {}).get(q, {})
+        return [len(ref_outputs[matched.get(s) or 0][q].columns) for s in student_ids]
+
+    def summarize_workflowset(self, workflowset):
+        """
+        Processes the data collected into a single pandas dataframe with a
+        row for each student of the workflowset.
+        """
+        import pandas as pd
+
         # filepath df
         fp_df = pd.Series(self.sub_data_paths[workflowset],name='data_filepaths')
+        # failure df
+        f_df = pd.Series(self.sub_failures[workflowset],name='failure_reason',dtype=object).fillna('')
 
         # check question df
         cqr_df = pd.DataFrame.from_dict(self.check_question_results[workflowset],orient='index',columns=['missing_questions','foreign_questions'])
@@ -331,22 +875,38 @@ class workflowgrader():
         cvr_df = pd.DataFrame.from_dict(self.check_var_results[workflowset])
         # print(cvr_df)
         for i in cvr_df.columns:
-            cvr_df[i+'_var_summary'] = cvr_df[i].apply(lambda x : 1-(len(x[0])/len(self.ref_output[i].columns)) if 'UNGRADED' not in x[0] else x[0][0])
-            cvr_df[i+'_dtype_summary'] = cvr_df[i].apply(lambda x : 1-(len(x[0])/len(self.ref_output[i].columns)) if 'UNGRADED' not in x[0] else x[0][0])
-            cvr_df[[i+'_missing_var',i+'_incorrect_var_dtype']] = pd.DataFrame(cvr_df[i].to_list(),index=cvr_df.index)
+            n_vars = self.ref_var_counts(workflowset, i, cvr_df.index)
+            cvr_df['{}_var_summary'.format(i)] = [1-(len(x[0])/n) if 'UNGRADED' not in x[0] else x[0][0] for x, n in zip(cvr_df[i], n_vars)]
+            cvr_df['{}_dtype_summary'.format(i)] = [1-(len(x[0])/n) if 'UNGRADED' not in x[0] else x[0][0] for x, n in zip(cvr_df[i], n_vars)]
+            cvr_df[['{}_missing_var'.format(i),'{}_incorrect_var_dtype'.format(i)]] = pd.DataFrame(cvr_df[i].to_list(),index=cvr_df.index)
             del cvr_df[i] 
 
         # check data df
         cdr_df = pd.DataFrame.from_dict(self.check_data_results[workflowset])
         for i in cdr_df.columns:
-            cdr_df[i+'_data_summary'] = cdr_df[i].apply(lambda x : 1-(len(x)/len(self.ref_output[i].columns)) if x!=['UNGRADED'] else x[0])
-            cdr_df[i+'_incorrect_var_values'] = cdr_df[i]
+            n_vars = self.ref_var_counts(workflowset, i, cdr_df.index)
+            cdr_df['{}_data_summary'.format(i)] = [1-(len(x)/n) if x!=['UNGRADED'] else x[0] for x, n in zip(cdr_df[i], n_vars)]
+            cdr_df['{}_incorrect_var_values'.format(i)] = cdr_df[i]
+            if workflowset in self.check_diagnostics_results:
+                diagnostics = self.check_diagnostics_results[workflowset][i]
+                cdr_df['{}_data_diagnostics'.format(i)] = ['UNGRADED' if diagnostics[s] is None else json.dumps(diagnostics[s], separators=(',', ':'))
+                                                 for s in cdr_df.index]
             del cdr_df[i] 
 
+        # matched reference df
+        if workflowset in self.check_ref_results:
+            crr_df = pd.DataFrame({'{}_reference'.format(q): pd.Series(matched).map(lambda r: 'UNGRADED' if pd.isna(r) else self.ref_workflows[int(r)])
+                                   for q, matched in self.check_ref_results[workflowset].items()})
+            cdr_df = pd.merge(cdr_df,crr_df,left_index=True,right_index=True)
+
+        # check settings df
+        if workflowset in self.check_settings_results:
+            csr_df = pd.DataFrame.from_dict(self.check_settings_results[workflowset])
+            csr_df.columns = ['{}_incorrect_settings'.format(i) for i in csr_df.columns]
+            cdr_df = pd.merge(cdr_df,csr_df,left_index=True,right_index=True)
+
         # node distribution df
-        n_df = pd.DataFrame.from_dict(self.sub_node_dists[workflowset],orient='index')
-        n_df['node_count'] = n_df.sum(axis=1)
-        n_df['node_summary'] = n_df['node_count']/sum(self.ref_node_dist.values())
+        n_df = self.sub_node_counts[workflowset].to_frame()
 
 
         # combined df
@@ -354,19 +914,92 @@ class workflowgrader():
         combined_df = pd.merge(combined_df,cdr_df,left_index=True,right_index=True,suffixes=('_var_dtype','_data'))
         combined_df = pd.merge(combined_df,n_df,left_index=True,right_index=True,suffixes=('_var_dtype','_data'))
         combined_df = pd.merge(combined_df,fp_df,left_index=True,right_index=True)
+        combined_df = pd.merge(combined_df,f_df,left_index=True,right_index=True)
 
         # move columns
         move_col_to_front(combined_df)
         combined_df.reset_index(inplace=True)
+        return combined_df
+
+    def generate_csv_by_workflowset(self, workflowset, save_dir):
+        """
+        Saves the dataframe from `summarize_workflowset` to a csv file.
+        With a results store, the dataframe is recorded in the store and
+        the csv file is exported from it.
+        """
+        combined_df = self.summarize_workflowset(workflowset)
 
         # saving dataframe to csv file 
-        combined_df.to_csv(os.path.join(save_dir,workflowset+'.csv'))
+        if self.results_store is not None:
+            node_types = [NODE_TYPES.names[t] for t in self.sub_node_counts[workflowset].node_types()]
+            self.results_store.record_workflowset(workflowset, combined_df, self.question_keys, node_types)
+            self.results_store.export_csv(workflowset, os.path.join(save_dir,workflowset+'.csv'))
+        else:
+            combined_df.to_csv(os.path.join(save_dir,workflowset+'.csv'))
 
         display_process_output('{} is saved at {}'.format(workflowset+'.csv',save_dir))
 
+    def grade_submission(self, wfp, student_id=None):
+        """
+        Grades a single workflow as a workflowset of its own, which is
+        discarded once graded, with the retries and checks of a workflowset,
+        see `extract_submission_data_with_retries` and `check_workflowset`.
+        Returns the row of the student from `summarize_workflowset` as a
+        dataframe.
+        """
+        student_id = student_id or os.path.basename(wfp)
+        workflowset = '_submission_{}'.format(next(self._submission_counter))
+        self.metrics.inc('queue_depth')
+        try:
+            self.store_workflow_data(workflowset, [student_id], [self.extract_submission_data_with_retries(wfp)])
+            self.check_workflowset(workflowset, {student_id: wfp})
+            with self.metrics.timer('report'):
+                return self.summarize_workflowset(workflowset)
+        finally:
+            self.discard_workflowset(workflowset)
+
+    def discard_workflowset(self, workflowset):
+        """
+        Discards the data and check results of the workflowset.
+        """
+        for results in (self.student_ids, self.sub_outputs, self.sub_node_counts, self.sub_data_paths, self.sub_failures,
+                        self.check_question_results, self.question_matches, self.check_var_results,
+                        self.check_data_results, self.check_ref_results, self.check_settings_results, self.cohort_stats,
+                        self.check_diagnostics_results):
+            results.pop(workflowset, None)
 
+    def generate_node_statistics_by_workflowset(self, workflowset, save_dir):
+        """
+        Saves the cohort statistics of the node types used in the workflowset
+        against the reference, see `nodecounts.nodecountmatrix.statistics`,
+        next to the csv of the workflowset.
+        """
+        stats = self.sub_node_counts[workflowset].statistics()
+        stats.to_csv(os.path.join(save_dir,workflowset+'_nodes.csv'), index=False)
+
+        display_process_output('{} is saved at {}'.format(workflowset+'_nodes.csv',save_dir))
 
+    def generate_cohort_summary_by_workflowset(self, workflowset, save_dir):
+        """
+        Saves the cohort statistics accumulated while the workflowset was
+        checked, see `cohort.cohortstats`, next to the csv of the workflowset.
+        """
+        if workflowset not in self.cohort_stats:
+            display_process_output('no cohort statistics of workflowset {}, it was checked by an earlier version.'.format(workflowset.upper()))
+            return
+        self.cohort_stats[workflowset].save(os.path.join(save_dir,workflowset+'_cohort.json'))
 
+        display_process_output('{} is saved at {}'.format(workflowset+'_cohort.json',save_dir))
 
+    def generate_similarity_report_by_workflowset(self, workflowset, save_dir, threshold=0.5):
+        """
+        Ranks the pairs of similar workflows in the workflowset, see
+        `similarity.similarity_report`, and saves them next to the csv of
+        the workflowset.
+        """
+        from similarity import similarity_report
 
+        report = similarity_report(self.workflow_paths(workflowset), os.path.join(self.workspace,self.ref_workflow), threshold)
+        report.to_csv(os.path.join(save_dir,workflowset+'_similarity.csv'), index=False)
 
+        display_process_output('{} is saved at {}, {} similar pairs found'.format(workflowset+'_similarity.csv',save_dir,len(report)))
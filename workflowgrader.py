@@ -1,93 +1,255 @@
-import knime
-import pandas as pd
-import numpy as np
 import os
 import argparse
-from utils import workflowgrader, display_process_start, display_process_output, current_datetime
 import time
-import sys, traceback, logging
+import sys, traceback, logging, atexit
+# the grading modules are imported once the arguments are parsed, see main()
 
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Grades KNIME workflows.')
     parser.add_argument('workspace', help='KNIME workspace with the workflows to be graded.')
     parser.add_argument('ref_workflow', help='Name of the reference workflow to be used.')
+    parser.add_argument('--alt-ref-workflows', nargs='+', default=[], metavar='REF_WORKFLOW',
+                        help='Names of alternative reference workflows. Each question is graded against the best matching reference.')
     parser.add_argument('--exec-path', default=None, help='Not required unless KNIME is installed in non-standard location.')
     parser.add_argument('--save-dir',default=None, help='Directory to save the grading results to. Saved to workspace if not provided.')
+    parser.add_argument('--heap-size', default=None, help='Maximum heap of each KNIME JVM, e.g. 2g. Uses the knime.ini setting if not provided.')
+    parser.add_argument('--memory-budget', default=None, help='Total memory which concurrent KNIME executions may use, e.g. 12g. Limited only by available system memory if not provided.')
+    parser.add_argument('--max-workers', type=int, default=1, help='Maximum number of workflows executed concurrently.')
+    parser.add_argument('--queue-dir', default=None, help='Work queue directory on a shared filesystem for grading on several machines.')
+    parser.add_argument('--role', default='coordinator', choices=['coordinator', 'worker', 'merge'],
+                        help='Role in grading with --queue-dir: the coordinator enqueues the workflows, workers execute them and merge saves the results.')
+    parser.add_argument('--resume', action='store_true', help='Resume the previous run from its journal, skipping the workflows already graded.')
+    parser.add_argument('--regrade', action='store_true',
+                        help='Regrade the workflowsets against the reference from the output bundles of a previous run, without executing the submitted workflows.')
+    parser.add_argument('--check-settings', action='store_true', help='Check the settings of the nodes feeding each question against the reference workflow.')
+    parser.add_argument('--node-stats', action='store_true', help='Report the node types most often extra or missing against the reference in each workflowset.')
+    parser.add_argument('--similarity', action='store_true', help='Report the pairs of similar workflows in each workflowset.')
+    parser.add_argument('--similarity-threshold', type=float, default=0.5, help='Minimum similarity, between 0 and 1, of the pairs reported by --similarity.')
+    parser.add_argument('--no-diagnostics', action='store_true',
+                        help='Report only the names of the variables with incorrect data, without locating their differing rows.')
+    parser.add_argument('--diagnostic-rows', type=int, default=None, metavar='K',
+                        help='Number of differing rows reported for each variable with incorrect data.')
+    parser.add_argument('--diagnostic-budget-ms', type=float, default=None, metavar='MS',
+                        help='Milliseconds the rows of each variable with incorrect data may be compared for, beyond which its diagnostic is partial.')
+    parser.add_argument('--unordered-questions', nargs='+', default=[], metavar='QUESTION',
+                        help='Questions whose outputs are graded regardless of the order of their rows.')
+    parser.add_argument('--compact-outputs', action='store_true', help='Hold the outputs of submissions in compact dtypes to reduce memory use.')
+    parser.add_argument('--no-preflight', action='store_true',
+                        help='Execute every submitted workflow, without first rejecting the workflows which are locked, corrupt, have no Container Output (Table) nodes or read missing data files.')
+    parser.add_argument('--prune', action='store_true',
+                        help='Execute only the nodes of submitted workflows which feed their Container Output (Table) nodes.')
+    parser.add_argument('--stage-data', default=None, metavar='CACHE_DIR',
+                        help='Copy the datasets read by submitted workflows once into CACHE_DIR and execute the workflows reading them from there.')
+    parser.add_argument('--data-dirs', nargs='+', default=[], metavar='DIR',
+                        help='With --stage-data, directories in which datasets that cannot be read from the paths of submitted workflows are looked up by file name.')
+    parser.add_argument('--prefetch', type=int, default=None, metavar='N',
+                        help='Number of submitted workflows scanned ahead of their execution, 0 to scan each workflow when it is executed.')
+    parser.add_argument('--retries', type=int, default=None, metavar='N',
+                        help='Number of times an execution which failed transiently, e.g. on a lock or a crash of the JVM, is retried before its workflow is quarantined, 0 to not retry.')
+    parser.add_argument('--retry-backoff', type=float, default=None, metavar='SECONDS',
+                        help='Seconds before the first retry of an execution, doubled at every retry.')
+    parser.add_argument('--execution-timeout', type=float, default=None, metavar='SECONDS',
+                        help='Seconds after which the KNIME execution of a submitted workflow is killed and failed as a timeout, which is retried. By default, executions are not timed out.')
+    parser.add_argument('--discovery-cache', default=None, metavar='FILE',
+                        help='File in which the directories of the workspace are cached across runs, so that only the directories which changed are listed again. Defaults to <workspace>.discovery.json in the save directory.')
+    parser.add_argument('--results-db', default=None,
+                        help='SQLite database in which the results of the run are stored, with a row per student, question and check. The csv files are exported from it.')
+    parser.add_argument('--term', default=None, help='Term, e.g. 2024S1, under which the results of the run are stored with --results-db.')
+    parser.add_argument('--metrics-file', default=None, help='Text file to which live metrics of the run are written in the Prometheus format, e.g. for the node exporter textfile collector.')
+    parser.add_argument('--metrics-port', type=int, default=None, help='Serve live metrics of the run in the Prometheus format on http://127.0.0.1:PORT/metrics.')
+    parser.add_argument('--serve', type=int, default=None, metavar='PORT',
+                        help='Serve pre-checks of single submissions on http://127.0.0.1:PORT instead of grading the workspace.')
+    parser.add_argument('--serve-queue', type=int, default=16, help='Maximum number of submissions waiting to be pre-checked with --serve.')
    
     args = parser.parse_args()
     
     return args
 
-def detect_workflowset(workspace):
+def reference_args(args):
     """
-    Scans for workflowsets (folders containing workflow) in the give knime workspace. 
-    Returns a (possibly empty) list of workflowsets.
+    Returns the arguments naming the reference workflows, which are recorded
+    in the journal with the reference read from them.
     """
-    workflowsets = []
-
-    for i in os.listdir(workspace):
-        if os.path.isdir(os.path.join(workspace,i)) and i != 'Example Workflows':
-            wfs = os.path.exists(os.path.join(os.path.join(workspace,i),'workflowset.meta'))
-            wfsvg = os.path.exists(os.path.join(os.path.join(workspace,i),'workflow.svg'))
-            if  wfs and not wfsvg:
-                display_process_output('detected workflowset {}.'.format(i.upper()))
-                workflowsets.append(i)
+    return {'ref_workflow': args.ref_workflow, 'alt_ref_workflows': list(args.alt_ref_workflows)}
+
+def ref_workflow_names(reference_args):
+    if not reference_args:
+        return []
+    return [reference_args['ref_workflow']] + reference_args['alt_ref_workflows']
+
+def detect_workflowset(workspace, cache_filepath=None):
+    """
+    Scans for workflowsets (folders containing workflow) in the give knime workspace,
+    at any depth, see `discovery.workspacetree`.
+    Returns a (possibly empty) list of workflowsets and the tree of the workspace.
+    """
+    from utils import display_process_output
+    from discovery import workspacetree
+
+    tree = workspacetree(workspace, cache_filepath).discover()
+    workflowsets = list(tree.workflowsets)
+
+    for i in workflowsets:
+        display_process_output('detected workflowset {} with {} workflows.'.format(i.upper(), len(tree.workflows[i])))
     if not workflowsets:
         display_process_output('No workflowsets detected. Processing workflows in workspace {}.'.format(os.path.basename(workspace)))
 
-    return workflowsets
+    return workflowsets, tree
 
 def main():
     args = parse_args()
+
+    from utils import workflowgrader, display_process_start, display_process_output
+    from workqueue import workqueue
+    from journal import checkpointjournal
+    from staging import datasetcache
+    from prefetch import PREFETCH_DEPTH
+    from resultstore import resultstore
+    from failures import RETRIES, RETRY_BACKOFF
+    from mismatch import DIAGNOSTIC_ROWS, DIAGNOSTIC_TIME_BUDGET
+
     null_save_dir = None
     if not args.save_dir:
         args.save_dir = args.workspace
         null_save_dir = True
 
-    logging.basicConfig(filename=os.path.join(args.save_dir,os.path.basename(args.workspace)+'.log'), filemode='w', format='%(name)s - %(levelname)s - %(message)s')
+    queue = workqueue(args.queue_dir) if args.queue_dir else None
+
+    # workers sharing a save directory keep separate logs
+    log_name = os.path.basename(args.workspace) if not (queue and args.role == 'worker') else \
+        '{}.{}'.format(os.path.basename(args.workspace), queue.worker_id)
+    logging.basicConfig(filename=os.path.join(args.save_dir,log_name+'.log'), filemode='a' if args.resume or args.regrade else 'w', format='%(name)s - %(levelname)s - %(message)s')
+
+    # runs on a single machine are journaled so that they can be resumed
+    journal = None
+    if not queue and args.serve is None and not args.regrade:
+        journal = checkpointjournal(os.path.join(args.save_dir,os.path.basename(args.workspace)+'.journal'), args.resume)
+        if args.resume and journal.reference is not None and journal.reference_args != reference_args(args):
+            journal.close()
+            sys.exit('The journal was recorded against the reference workflows {}, which differ from {}. '
+                     'Run without --resume to grade against them.'.format(
+                         ', '.join(ref_workflow_names(journal.reference_args)) or 'not recorded',
+                         ', '.join(ref_workflow_names(reference_args(args)))))
+        if args.resume:
+            display_process_start('Resuming from journal, {} workflows were already graded.'.format(
+                sum(len(journal.completed(wfs)) for wfs in journal.extracted)))
+
+    dataset_cache = datasetcache(args.stage_data, args.data_dirs) if args.stage_data else None
+    prefetch_depth = args.prefetch if args.prefetch is not None else PREFETCH_DEPTH
+    results_store = resultstore(args.results_db, args.term) if args.results_db else None
+    retries = args.retries if args.retries is not None else RETRIES
+    retry_backoff = args.retry_backoff if args.retry_backoff is not None else RETRY_BACKOFF
+    diagnostic_rows = args.diagnostic_rows if args.diagnostic_rows is not None else DIAGNOSTIC_ROWS
+    diagnostic_time_budget = args.diagnostic_budget_ms / 1000 if args.diagnostic_budget_ms is not None else DIAGNOSTIC_TIME_BUDGET
 
     display_process_start('Detecting workflowsets from {}...'.format(args.workspace))
 
-    workflowsets = detect_workflowset(args.workspace)
+    discovery_cache = args.discovery_cache or os.path.join(args.save_dir, os.path.basename(args.workspace)+'.discovery.json')
+    workflowsets, workspace_tree = detect_workflowset(args.workspace, discovery_cache)
 
     # if not workflowsets:
     #     workflowsets = [os.path.basename(args.workspace)]
   
-    display_process_start('Reading reference workflow...')
-    wfg = workflowgrader(args.workspace,args.ref_workflow, args.exec_path, workflowsets)
-    display_process_output('reading of {} is completed.'.format(args.ref_workflow))
+    if queue and args.role != 'coordinator':
+        display_process_start('Reading reference from {}...'.format(args.queue_dir))
+        wfg = workflowgrader(args.workspace,args.ref_workflow, args.exec_path, workflowsets,
+                             args.heap_size, args.memory_budget, args.max_workers, reference=queue.reference(),
+                             unordered_questions=args.unordered_questions,
+                             compact_outputs=args.compact_outputs, alt_ref_workflows=args.alt_ref_workflows,
+                             preflight=not args.no_preflight, prune=args.prune, dataset_cache=dataset_cache,
+                             prefetch_depth=prefetch_depth, results_store=results_store,
+                             retries=retries, retry_backoff=retry_backoff, execution_timeout=args.execution_timeout,
+                             workspace_tree=workspace_tree,
+                             diagnostics=not args.no_diagnostics, diagnostic_rows=diagnostic_rows,
+                             diagnostic_time_budget=diagnostic_time_budget, check_settings=args.check_settings)
+    else:
+        display_process_start('Reading reference workflow{}...'.format('s' if args.alt_ref_workflows else ''))
+        wfg = workflowgrader(args.workspace,args.ref_workflow, args.exec_path, workflowsets,
+                             args.heap_size, args.memory_budget, args.max_workers,
+                             reference=journal.reference if journal else None, journal=journal,
+                             unordered_questions=args.unordered_questions,
+                             compact_outputs=args.compact_outputs, alt_ref_workflows=args.alt_ref_workflows,
+                             preflight=not args.no_preflight, prune=args.prune, dataset_cache=dataset_cache,
+                             prefetch_depth=prefetch_depth, results_store=results_store,
+                             retries=retries, retry_backoff=retry_backoff, execution_timeout=args.execution_timeout,
+                             workspace_tree=workspace_tree,
+                             diagnostics=not args.no_diagnostics, diagnostic_rows=diagnostic_rows,
+                             diagnostic_time_budget=diagnostic_time_budget, check_settings=args.check_settings)
+        if journal and journal.reference is None:
+            journal.record_reference(wfg.reference(), reference_args(args))
+    display_process_output('reading of {} is completed.'.format(', '.join([args.ref_workflow] + args.alt_ref_workflows)))
 
-      
-    for wfs in wfg.workflowsets:
-        display_process_start('Processing {}...'.format(wfs.upper()))
-        wfg.extract_workflow_data(wfs)
-        wfg.check_question_by_workflowset(wfs)
-        wfg.check_variable_and_data_by_workflowset(wfs)
+    if args.metrics_file or args.metrics_port is not None:
+        from metrics import metricsexporter
+
+        exporter = metricsexporter(wfg.metrics, args.metrics_file, args.metrics_port).start()
+        atexit.register(exporter.stop)
+
+    if args.serve is not None:
+        from service import gradingservice
 
+        service = gradingservice(wfg, port=args.serve, max_queue=args.serve_queue)
+        display_process_start('Serving pre-checks on http://{}:{}/grade, press Ctrl+C to stop...'.format(*service.address))
+        try:
+            service.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+    if queue and args.role == 'coordinator':
+        display_process_start('Enqueueing workflows to {}...'.format(args.queue_dir))
+        n_tasks = queue.enqueue(wfg)
+        print('\n  A total {} workflows were enqueued in {} seconds'.format(n_tasks,round(time.time() - start_time,0)))
+        return
+    if queue and args.role == 'worker':
+        display_process_start('Processing workflows from {}...'.format(args.queue_dir))
+        n_completed = queue.work(wfg)
+        print('\n  A total {} workflows were processed in {} seconds'.format(n_completed,round(time.time() - start_time,0)))
+        return
+
+    if results_store:
+        results_store.begin_run(args.workspace, wfg.ref_workflows)
+    for wfs in wfg.workflowsets:
+        display_process_start('{} {}...'.format('Regrading' if args.regrade else 'Processing', wfs.upper()))
         if not (wfs == os.path.basename(args.save_dir) and len(workflowsets) == 0): 
             if null_save_dir:
-                args.save_dir = os.path.join(args.workspace,wfs)
-                wfg.generate_csv_by_workflowset(wfs,args.save_dir)
-            else:
-                wfg.generate_csv_by_workflowset(wfs,args.save_dir)
+                args.save_dir = workspace_tree.workflowset_dir(wfs)
+            wfs_save_dir = args.save_dir
         else:
-            wfg.generate_csv_by_workflowset(wfs,args.workspace)
-            # else:
-
-            # args.save_dir = os.path.join(args.workspace,wfs)
+            wfs_save_dir = args.workspace
 
+        if args.regrade:
+            wfg.load_bundle_by_workflowset(wfs, wfs_save_dir)
+        else:
+            if queue:
+                queue.merge(wfg, wfs)
+            else:
+                wfg.extract_workflow_data(wfs)
+            # outputs are bundled before the checks, so that the workflowset can be regraded
+            wfg.save_bundle_by_workflowset(wfs, wfs_save_dir)
+        if journal and wfs in journal.checks:
+            wfg.restore_checks_by_workflowset(wfs, journal.checks[wfs])
+        else:
+            wfg.check_workflowset(wfs)
+            if journal:
+                journal.record_checks(wfs, wfg.checks_by_workflowset(wfs))
 
+        with wfg.metrics.timer('report'):
+            wfg.generate_csv_by_workflowset(wfs,wfs_save_dir)
+            wfg.generate_cohort_summary_by_workflowset(wfs,wfs_save_dir)
+        if args.node_stats:
+            wfg.generate_node_statistics_by_workflowset(wfs,wfs_save_dir)
+        if args.similarity:
+            wfg.generate_similarity_report_by_workflowset(wfs,wfs_save_dir,args.similarity_threshold)
 
-        # if not args.save_dir:
-        #     if len(workflowsets) == 0:
-        #         args.save_dir = args.workspace
-        #     else:
-        #         args.save_dir = os.path.join(args.workspace,wfs)
-      
-        # wfg.generate_csv_by_workflowset(wfs,args.save_dir)
- 
+    if journal:
+        journal.close()
+    if results_store:
+        results_store.close()
+        display_process_output('results of run {} are stored in {}'.format(results_store.run_id, args.results_db))
     print('\n  A total {} workflows were graded in {} seconds'.format(len(wfg),round(time.time() - start_time,0))) 
+    if dataset_cache:
+        print('  {} datasets were staged in {}'.format(dataset_cache.staged, args.stage_data))
 
 if __name__ == '__main__':
     start_time = time.time()
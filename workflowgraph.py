@@ -0,0 +1,288 @@
+"""
+Compact graph representation of KNIME workflows parsed from workflow.knime.
+
+The nodes of a workflow, including the nodes inside its metanodes and
+components, are held in numpy arrays indexed by position: integer node type
+and factory ids from vocabularies shared by all workflows, the containing
+metanode, nesting depth and hashes of the node settings. Connections are
+held as CSR adjacency in both directions. Graphs are cached per workflow
+and invalidated when any of the files they were parsed from changes: the
+workflow.knime of the workflow and of its metanodes and components, and the
+settings.xml of its nodes.
+"""
+import os
+import re
+import hashlib
+import threading
+import xml.etree.ElementTree as ElementTree
+from collections import OrderedDict
+from pathlib import Path, PurePosixPath
+
+
+class vocabulary():
+    """
+    Thread-safe mapping of names to consecutive integer ids.
+    """
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+        self._lock = threading.Lock()
+
+    def id(self, name):
+        try:
+            return self.ids[name]
+        except KeyError:
+            with self._lock:
+                if name not in self.ids:
+                    self.ids[name] = len(self.names)
+                    self.names.append(name)
+                return self.ids[name]
+
+    def __len__(self):
+        return len(self.names)
+
+
+# vocabularies shared by the graphs of all workflows
+NODE_TYPES = vocabulary()
+FACTORIES = vocabulary()
+# number of graphs cached
+CACHE_SIZE = 4096
+
+
+def config_entries(element):
+    """
+    Returns {key: element} of the config and entry children of a KNIME xml element.
+    """
+    return {child.attrib.get('key'): child for child in element}
+
+def canonical(element):
+    """
+    Returns a canonical string of a KNIME settings subtree, independent of
+    the order of its keys.
+    """
+    if len(element) == 0:
+        return '{}={}'.format(element.attrib.get('key'), element.attrib.get('value'))
+    return '{}{{{}}}'.format(element.attrib.get('key'), ';'.join(sorted(canonical(child) for child in element)))
+
+def file_stamp(filepath):
+    """
+    Returns the (modification time, size) of a file, None when it does not exist.
+    """
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def hash64(text):
+    """
+    Returns a 64 bit hash of a string as an int.
+    """
+    return int.from_bytes(hashlib.blake2b(text.encode('utf8'), digest_size=8).digest(), 'little')
+
+def node_type(node_dirname):
+    """
+    Returns the name of the node type from the directory name of a node,
+    e.g. 'File Reader' for 'File Reader (#12)'.
+    """
+    return re.split(r'[\(\)]', node_dirname)[0].strip()
+
+
+class workflowgraph():
+    """
+    Nodes and connections of a KNIME workflow.
+
+    Node i has
+        node_ids[i]        id of the node within its (meta)workflow
+        node_dirnames[i]   directory of the node relative to the workflow
+        node_types[i]      id of its type in NODE_TYPES, e.g. 'Row Filter'
+        factories[i]       id of its factory class in FACTORIES, -1 for metanodes
+        parents[i]         index of the containing metanode or component, -1 at the top level
+        depths[i]          nesting depth, 0 at the top level
+        is_meta[i]         whether the node is a metanode, i.e. has no settings.xml
+        settings_hashes[i] hash of the model settings, 0 when there are none
+        bounds_hashes[i]   hash of the position of the node in the layout
+
+    The files the graph was parsed from are listed in stamps, as
+    (filepath, stamp) with the `file_stamp` of the file when it was read.
+
+    The successors of node i are indices[indptr[i]:indptr[i+1]] and its
+    predecessors are rev_indices[rev_indptr[i]:rev_indptr[i+1]]. Connections
+    to the ports of a metanode from inside are connections to the metanode.
+    """
+    def __init__(self, path_to_knime_workflow):
+        import numpy as np
+
+        self.path_to_knime_workflow = Path(path_to_knime_workflow)
+        self.node_ids = []
+        self.node_dirnames = []
+        self.node_types = []
+        self.factories = []
+        self.parents = []
+        self.depths = []
+        self.is_meta = []
+        self.settings_hashes = []
+        self.bounds_hashes = []
+        self.stamps = []
+        sources, dests = [], []
+        self._parse(PurePosixPath(), -1, 0, sources, dests)
+
+        self.node_ids = np.array(self.node_ids, dtype=np.int32)
+        self.node_types = np.array(self.node_types, dtype=np.int32)
+        self.factories = np.array(self.factories, dtype=np.int32)
+        self.parents = np.array(self.parents, dtype=np.int32)
+        self.depths = np.array(self.depths, dtype=np.int16)
+        self.is_meta = np.array(self.is_meta, dtype=bool)
+        self.settings_hashes = np.array(self.settings_hashes, dtype=np.uint64)
+        self.bounds_hashes = np.array(self.bounds_hashes, dtype=np.uint64)
+
+        n = len(self.node_dirnames)
+        sources = np.array(sources, dtype=np.int32)
+        dests = np.array(dests, dtype=np.int32)
+        self.sources, self.dests = sources, dests
+        self.indptr, self.indices = self._csr(sources, dests, n)
+        self.rev_indptr, self.rev_indices = self._csr(dests, sources, n)
+
+    @staticmethod
+    def _csr(sources, dests, n):
+        import numpy as np
+
+        order = np.argsort(sources, kind='stable')
+        indptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(np.bincount(sources, minlength=n), out=indptr[1:])
+        return indptr, dests[order]
+
+    def _parse(self, rel_dir, parent, depth, sources, dests):
+        """
+        Parses the workflow.knime in rel_dir, and recursively the workflows
+        of its metanodes and components, appending to the node lists and
+        the connections.
+        """
+        workflow_filepath = self.path_to_knime_workflow / rel_dir / 'workflow.knime'
+        self.stamps.append((str(workflow_filepath), file_stamp(workflow_filepath)))
+        root = ElementTree.parse(workflow_filepath).getroot()
+        top = config_entries(root)
+
+        local = {}
+        for node_config in top['nodes'] if 'nodes' in top else []:
+            entries = config_entries(node_config)
+            try:
+                node_id = int(entries['id'].attrib['value'])
+                settings_file = PurePosixPath(entries['node_settings_file'].attrib['value'])
+            except KeyError:
+                continue
+            node_dirname = rel_dir / settings_file.parent
+            node_path = self.path_to_knime_workflow / node_dirname
+
+            index = len(self.node_dirnames)
+            local[node_id] = index
+            self.node_ids.append(node_id)
+            self.node_dirnames.append(str(node_dirname))
+            self.node_types.append(NODE_TYPES.id(node_type(settings_file.parent.name)))
+            self.parents.append(parent)
+            self.depths.append(depth)
+
+            factory, settings_hash = -1, 0
+            is_meta = settings_file.name != 'settings.xml'
+            if not is_meta:
+                self.stamps.append((str(node_path / 'settings.xml'), file_stamp(node_path / 'settings.xml')))
+            if not is_meta and self.stamps[-1][1] is not None:
+                settings = config_entries(ElementTree.parse(node_path / 'settings.xml').getroot())
+                if 'factory' in settings:
+                    factory = FACTORIES.id(settings['factory'].attrib.get('value'))
+                if 'model' in settings:
+                    settings_hash = hash64(canonical(settings['model']))
+            self.factories.append(factory)
+            self.is_meta.append(is_meta)
+            self.settings_hashes.append(settings_hash)
+
+            bounds = config_entries(entries['ui_settings']).get('extrainfo.node.bounds') \
+                if 'ui_settings' in entries else None
+            self.bounds_hashes.append(hash64(canonical(bounds)) if bounds is not None else 0)
+
+            if (node_path / 'workflow.knime').exists():
+                self._parse(node_dirname, index, depth + 1, sources, dests)
+
+        for connection_config in top['connections'] if 'connections' in top else []:
+            entries = config_entries(connection_config)
+            try:
+                source = int(entries['sourceID'].attrib['value'])
+                dest = int(entries['destID'].attrib['value'])
+            except KeyError:
+                continue
+            # -1 refers to the ports of the containing metanode
+            source = parent if source == -1 else local.get(source, -1)
+            dest = parent if dest == -1 else local.get(dest, -1)
+            if source >= 0 and dest >= 0:
+                sources.append(source)
+                dests.append(dest)
+
+    def __len__(self):
+        return len(self.node_dirnames)
+
+    def successors(self, i):
+        return self.indices[self.indptr[i]:self.indptr[i+1]]
+
+    def predecessors(self, i):
+        return self.rev_indices[self.rev_indptr[i]:self.rev_indptr[i+1]]
+
+    def upstream(self, seeds):
+        """
+        Returns a boolean mask of the nodes from which any of the seed nodes
+        can be reached, including the seeds themselves.
+        """
+        import numpy as np
+
+        mask = np.zeros(len(self), dtype=bool)
+        stack = list(seeds)
+        mask[stack] = True
+        while stack:
+            for j in self.predecessors(stack.pop()):
+                if not mask[j]:
+                    mask[j] = True
+                    stack.append(j)
+        return mask
+
+    def node_type_names(self):
+        """
+        Returns the list of the node type names of the nodes.
+        """
+        return [NODE_TYPES.names[t] for t in self.node_types]
+
+    def node_type_counts(self):
+        """
+        Returns {node type name: count} of the nodes at the top level of the
+        workflow, metanodes excluded, sorted by name.
+        """
+        import numpy as np
+
+        types = self.node_types[(self.depths == 0) & ~self.is_meta]
+        ids, counts = np.unique(types, return_counts=True)
+        return dict(sorted((NODE_TYPES.names[t], int(c)) for t, c in zip(ids, counts)))
+
+
+# {fullpath of a workflow: its workflowgraph}, least recently used first
+_graphs = OrderedDict()
+_graphs_lock = threading.Lock()
+
+def load_workflow_graph(path_to_knime_workflow):
+    """
+    Returns the workflowgraph of the KNIME workflow in the provided path,
+    parsing it only when any of the files it was parsed from changed since
+    the last call.
+    """
+    path = os.path.abspath(path_to_knime_workflow)
+    with _graphs_lock:
+        graph = _graphs.get(path)
+    if graph is not None and all(file_stamp(filepath) == stamp for filepath, stamp in graph.stamps):
+        with _graphs_lock:
+            if path in _graphs:
+                _graphs.move_to_end(path)
+        return graph
+    graph = workflowgraph(path)
+    with _graphs_lock:
+        _graphs[path] = graph
+        _graphs.move_to_end(path)
+        while len(_graphs) > CACHE_SIZE:
+            _graphs.popitem(last=False)
+    return graph
@@ -0,0 +1,260 @@
+import os
+import json
+import pickle
+import socket
+import time
+import threading
+import logging
+from utils import display_process_output
+
+
+# leases not renewed for this long are taken to belong to a dead worker
+LEASE_TIMEOUT = 600
+# written by the coordinator once every task is enqueued
+ENQUEUED_FILENAME = 'enqueued'
+
+
+def _atomic_dump(obj, filepath):
+    """
+    Pickles obj to filepath so that readers never observe a partial file.
+    """
+    tmp_filepath = '{}.{}.{}.tmp'.format(filepath, socket.gethostname(), os.getpid())
+    with open(tmp_filepath, 'wb') as fh:
+        pickle.dump(obj, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_filepath, filepath)
+
+def _load(filepath):
+    with open(filepath, 'rb') as fh:
+        return pickle.load(fh)
+
+
+class workqueue():
+    """
+    Work queue on a shared filesystem which lets several grading machines
+    split the workflows of a cohort between them.
+
+    The queue directory is laid out as
+
+        reference.pkl                          reference outputs and node distribution
+        enqueued                               written once every task is enqueued
+        tasks/<workflowset>/<student>.json     one task per submitted workflow
+        leases/<workflowset>/<student>.lease   held by the worker running the task
+        results/<workflowset>/<student>.pkl    result fragment of a completed task
+
+    A task is claimed by creating its lease file exclusively, which is atomic
+    on local and network filesystems alike. Workers renew their leases while
+    a task runs, so that leases of crashed workers expire and their tasks are
+    picked up by other workers. A lease holds the id of its worker, and a
+    worker only renews or removes a lease it still holds. Leases expire when
+    their modification time did not change for lease_timeout seconds, as
+    observed by the clock of the worker breaking them, so that the clocks of
+    the machines and of the shared filesystem need not agree.
+    """
+    def __init__(self, queue_dir, lease_timeout=LEASE_TIMEOUT):
+        self.queue_dir = queue_dir
+        self.lease_timeout = lease_timeout
+        self.worker_id = '{}-{}'.format(socket.gethostname(), os.getpid())
+        # {lease filepath: (modification time, monotonic time when it was first seen)}
+        self._seen_leases = {}
+
+    def _path(self, kind, workflowset, student=None, ext=''):
+        if student is None:
+            return os.path.join(self.queue_dir, kind, workflowset)
+        return os.path.join(self.queue_dir, kind, workflowset, student + ext)
+
+    def enqueue(self, wfg):
+        """
+        Coordinator: stores the reference of the workflowgrader wfg and
+        enqueues a task for every workflow in its workflowsets.
+        Returns the number of tasks enqueued.
+        """
+        _atomic_dump(wfg.reference(), os.path.join(self.queue_dir, 'reference.pkl'))
+        n_tasks = 0
+        for wfs in wfg.workflowsets:
+            for kind in ('tasks', 'leases', 'results'):
+                os.makedirs(self._path(kind, wfs), exist_ok=True)
+            for order, wfp in enumerate(wfg.workflow_paths(wfs)):
+                student = os.path.basename(wfp)
+                # workflow paths are kept relative as the workspace may be mounted elsewhere on workers
+                task = {'workflowset': wfs, 'student': student, 'order': order,
+                        'path': os.path.relpath(wfp, wfg.workspace)}
+                task_filepath = self._path('tasks', wfs, student, '.json')
+                tmp_filepath = '{}.{}.tmp'.format(task_filepath, self.worker_id)
+                with open(tmp_filepath, 'w') as fh:
+                    json.dump(task, fh)
+                os.replace(tmp_filepath, task_filepath)
+                n_tasks += 1
+            display_process_output('enqueued {} workflows of workflowset {}.'.format(
+                len(self.tasks(wfs)), wfs.upper()))
+        with open(os.path.join(self.queue_dir, ENQUEUED_FILENAME), 'w') as fh:
+            fh.write(self.worker_id)
+        return n_tasks
+
+    def enqueued(self):
+        """
+        Returns True once the coordinator enqueued every task.
+        """
+        return os.path.exists(os.path.join(self.queue_dir, ENQUEUED_FILENAME))
+
+    def reference(self, poll_interval=5):
+        """
+        Returns the reference stored by the coordinator, see `workflowgrader.reference`,
+        waiting for the coordinator to store it.
+        """
+        filepath = os.path.join(self.queue_dir, 'reference.pkl')
+        while not os.path.exists(filepath):
+            time.sleep(poll_interval)
+        return _load(filepath)
+
+    def tasks(self, workflowset):
+        """
+        Returns the tasks of the workflowset in the order they were enqueued,
+        none when the coordinator has not enqueued the workflowset yet.
+        """
+        tasks = []
+        try:
+            filenames = os.listdir(self._path('tasks', workflowset))
+        except FileNotFoundError:
+            return tasks
+        for filename in filenames:
+            if not filename.endswith('.json'):
+                continue
+            with open(os.path.join(self._path('tasks', workflowset), filename)) as fh:
+                tasks.append(json.load(fh))
+        return sorted(tasks, key=lambda t: t['order'])
+
+    def _owner(self, lease_filepath):
+        """
+        Returns the id of the worker holding the lease, or None when there is no lease.
+        """
+        try:
+            with open(lease_filepath) as fh:
+                return fh.read()
+        except FileNotFoundError:
+            return None
+
+    def _expired(self, lease_filepath):
+        """
+        Returns True when the lease was not renewed for lease_timeout seconds
+        since this worker first saw its current modification time.
+        """
+        try:
+            mtime = os.stat(lease_filepath).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        seen = self._seen_leases.get(lease_filepath)
+        if seen is None or seen[0] != mtime:
+            self._seen_leases[lease_filepath] = (mtime, time.monotonic())
+            return False
+        return time.monotonic() - seen[1] > self.lease_timeout
+
+    def _claim(self, workflowset, student):
+        """
+        Attempts to claim the task with an exclusive lease file, breaking the
+        lease when it has expired. Returns True when the task is claimed.
+        """
+        lease_filepath = self._path('leases', workflowset, student, '.lease')
+        try:
+            fd = os.open(lease_filepath, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if self._expired(lease_filepath):
+                # renaming is atomic, only one of the workers breaking the lease succeeds
+                expired_filepath = '{}.{}.expired'.format(lease_filepath, self.worker_id)
+                try:
+                    os.replace(lease_filepath, expired_filepath)
+                    os.remove(expired_filepath)
+                    logging.warning('Expired lease on {}/{} broken by {}'.format(workflowset, student, self.worker_id))
+                except FileNotFoundError:
+                    pass
+                self._seen_leases.pop(lease_filepath, None)
+            return False
+        with os.fdopen(fd, 'w') as fh:
+            fh.write(self.worker_id)
+            fh.flush()
+            os.fsync(fh.fileno())
+        return True
+
+    def _renew(self, lease_filepath, stop):
+        """
+        Renews the lease until stop is set, or until the lease is lost to
+        another worker after it expired.
+        """
+        while not stop.wait(self.lease_timeout / 3):
+            if self._owner(lease_filepath) != self.worker_id:
+                logging.warning('Lease on {} was lost by {}'.format(lease_filepath, self.worker_id))
+                return
+            try:
+                os.utime(lease_filepath)
+            except FileNotFoundError:
+                return
+
+    def _release(self, lease_filepath):
+        """
+        Removes the lease, unless it was lost to another worker.
+        """
+        if self._owner(lease_filepath) != self.worker_id:
+            return
+        try:
+            os.remove(lease_filepath)
+        except FileNotFoundError:
+            pass
+
+    def work(self, wfg, poll_interval=5):
+        """
+        Worker: claims and runs tasks until every task of the queue has a
+        result fragment. wfg is a workflowgrader holding the reference of
+        the queue and the local path to the workspace. Tasks failing
+        transiently are retried and quarantined by the worker, see
+        `workflowgrader.extract_submission_data_with_retries`.
+        Returns the number of tasks completed by this worker.
+        """
+        n_completed = 0
+        while True:
+            pending = 0
+            for wfs in wfg.workflowsets:
+                for task in self.tasks(wfs):
+                    student = task['student']
+                    if os.path.exists(self._path('results', wfs, student, '.pkl')):
+                        continue
+                    pending += 1
+                    if not self._claim(wfs, student):
+                        continue
+
+                    lease_filepath = self._path('leases', wfs, student, '.lease')
+                    stop = threading.Event()
+                    renewer = threading.Thread(target=self._renew, args=(lease_filepath, stop), daemon=True)
+                    renewer.start()
+                    try:
+                        # another worker may have completed the task while its lease expired
+                        if not os.path.exists(self._path('results', wfs, student, '.pkl')):
+                            display_process_output('{} processing {}/{}.'.format(self.worker_id, wfs, student))
+                            wfg.metrics.inc('queue_depth')
+                            result = wfg.extract_submission_data_with_retries(os.path.join(wfg.workspace, task['path']))
+                            _atomic_dump(result, self._path('results', wfs, student, '.pkl'))
+                            n_completed += 1
+                        pending -= 1
+                    finally:
+                        stop.set()
+                        renewer.join()
+                        self._release(lease_filepath)
+            if pending == 0 and self.enqueued():
+                return n_completed
+            # the remaining tasks are leased by other workers or not enqueued yet
+            time.sleep(poll_interval)
+
+    def merge(self, wfg, workflowset):
+        """
+        Loads the result fragments of the workflowset into the workflowgrader
+        wfg, which can then check and generate the csv of the workflowset as
+        for a local run.
+        """
+        tasks = self.tasks(workflowset)
+        missing = [t['student'] for t in tasks
+                   if not os.path.exists(self._path('results', workflowset, t['student'], '.pkl'))]
+        if missing:
+            raise RuntimeError('{} of {} workflows in workflowset {} are not completed: {}'.format(
+                len(missing), len(tasks), workflowset, ', '.join(missing)))
+        results = [_load(self._path('results', workflowset, t['student'], '.pkl')) for t in tasks]
+        wfg.store_workflow_data(workflowset, [t['student'] for t in tasks], results)